@@ -0,0 +1,549 @@
+# Access Data - Student Database Benchmarks
+# Generates synthetic data files and times the Student Database Preparer
+# pipelines with them. Results are saved as JSON so that runs can be
+# compared.
+
+import argparse
+import csv
+import custtools.filetools as ft
+import json
+import os
+import platform
+import random
+import shutil
+import Student_Database_Preparer as sdp
+import subprocess
+import sys
+import tempfile
+
+# Modules that should only be imported by the pipelines that use them
+HEAVY_MODULES = ['concurrent.futures', 'multiprocessing', 'numpy', 'pandas']
+
+
+def create_benchmark_files(directory, num_rows, seed=0):
+    """Create a synthetic data set for every pipeline.
+
+    Each pipeline's main data file has num_rows rows. The reference files are
+    sized so that they are consistent with the data files, e.g. every student
+    in the Enrolment Sheet is in Student_IDs.csv and every Combined Data Form
+    student is not.
+
+    Args:
+        directory (str): Directory to save the files to.
+        num_rows (int): Number of rows in each main data file.
+        seed (int): (Optional) Seed for the random data.
+
+    Returns:
+        tables (dict): For each table name, the files (keyed on data source)
+        and course code to run it with.
+    """
+    rng = random.Random(seed)
+    num_tutors = max(10, num_rows // 100)
+    # Enough courses and workshops for num_rows new tutor pairings
+    num_courses = max(200, num_rows // 100)
+    num_workshops = max(200, num_rows // 100)
+    dates = [make_date(rng) for i in range(10)]
+    # Reference files
+    existing = [make_person(rng, 100000000 + i) for i in range(num_rows)]
+    new = [make_person(rng, 200000000 + i) for i in range(num_rows)]
+    tutors = [make_person(rng, make_code('T', i, 6)) for i in
+              range(num_tutors)]
+    courses = [['ADV-ON-001', '']]
+    for i in range(num_courses):
+        courses.append([make_code('ADV-PT-', i, 13),
+                        'Monday class {}'.format(i)])
+    workshops = [[make_code('W', i, 6), 'Workshop {}'.format(i)] for i in
+                 range(num_workshops)]
+    save_csv(directory, 'Student_IDs', ['StudentPK', 'First', 'Last'],
+             [[person['id'], person['first'], person['last']] for person in
+              existing])
+    save_csv(directory, 'Tutor_IDs', ['TutorPK', 'First', 'Last'],
+             [[tutor['id'], tutor['first'], tutor['last']] for tutor in
+              tutors])
+    save_csv(directory, 'Course_IDs', ['CoursePK', 'Form Text'], courses)
+    save_csv(directory, 'Workshop_IDs', ['WorkshopPK', 'Name'], workshops)
+    # Two enrolments for each existing student
+    enrolments = [[str(i + 1), existing[i % num_rows]['id']] for i in
+                  range(num_rows * 2)]
+    save_csv(directory, 'Enrolment_Codes', ['EnrolmentPK', 'StudentFK'],
+             enrolments)
+    save_csv(directory, 'Graduates_Current', ['GraduatePK', 'EnrolmentFK'],
+             [[str(i + 1), enrolments[i][0]] for i in range(num_rows)])
+    save_csv(directory, 'Extension_Codes', ['EnrolmentFK', 'AcceptanceDate'],
+             [[enrolments[i][0], dates[0]] for i in range(num_rows)])
+    save_csv(directory, 'Course_Tutors', ['CourseFK', 'Tutor', 'TutorFK'],
+             [[course[0], 'Tutor', tutors[i % num_tutors]['id']] for i, course
+              in enumerate(courses)])
+    save_csv(directory, 'Workshop_Tutors', ['WorkshopFK', 'Tutor', 'TutorFK'],
+             [[workshop[0], 'Tutor', tutors[i % num_tutors]['id']] for i,
+              workshop in enumerate(workshops)])
+    attendance_course = courses[1][0]
+    save_csv(directory, 'scc', ['StudentFK', 'CourseFK'],
+             [[person['id'], attendance_course] for person in existing])
+    save_csv(directory, 'swc', ['StudentFK', 'WorkshopFK'],
+             [[person['id'], workshops[i % num_workshops][0]] for i, person
+              in enumerate(existing)])
+    # Main data files
+    save_csv(directory, 'cdf', ['Column {}'.format(i) for i in range(64)],
+             [make_cdf_row(rng, person, courses) for person in new])
+    save_csv(directory, 'es_new', ['Column {}'.format(i) for i in range(18)],
+             [make_es_row(rng, person, courses, tutors, dates) for person in
+              new])
+    save_csv(directory, 'es', ['Column {}'.format(i) for i in range(18)],
+             [make_es_row(rng, person, courses, tutors, dates) for person in
+              existing])
+    save_csv(directory, 'td', ['TutorPK', 'First', 'Last', 'Email', 'Phone'],
+             [[make_code('N', i, 6), 'Tutor', 'Name', 'tutor{}@example.com'
+               .format(i), '021555{:04d}'.format(i % 10000)] for i in
+              range(num_rows)])
+    save_csv(directory, 'cd', ['CoursePK', 'Name', 'Venue', 'Mode', 'Status'],
+             [[make_code('NEW-PT-', i, 13), 'Course {}'.format(i),
+               'Auckland', 'Part-time', 'Active'] for i in range(num_rows)])
+    save_csv(directory, 'wd', ['WorkshopPK', 'Name', 'Location', 'Venue',
+                               'Date', 'Cost', 'Status', 'Type'],
+             [[make_code('X', i, 6), 'Workshop {}'.format(i), 'Auckland',
+               'Studio', rng.choice(dates), '50', 'Active', 'Compulsory']
+              for i in range(num_rows)])
+    save_csv(directory, 'ct', ['CourseFK', 'Tutor', 'TutorFK'],
+             [[courses[i % len(courses)][0], 'Tutor',
+               tutors[(i % len(courses) + 1 + i // len(courses)) %
+                      num_tutors]['id']] for i in range(num_rows)])
+    save_csv(directory, 'wt', ['WorkshopFK', 'Tutor', 'TutorFK'],
+             [[workshops[i % num_workshops][0], 'Tutor',
+               tutors[(i % num_workshops + 1 + i // num_workshops) %
+                      num_tutors]['id']] for i in range(num_rows)])
+    save_csv(directory, 'ca', ['StudentID', 'First', 'Last'] + dates,
+             [[person['id'], person['first'], person['last']] +
+              [rng.choice(['0', '1']) for date in dates] for person in
+              existing])
+    save_csv(directory, 'dates', ['Date {}'.format(i) for i in range(10)],
+             [dates])
+    save_csv(directory, 'wa', ['WorkshopFK', 'StudentFK'],
+             [[workshops[(i + 1) % num_workshops][0], person['id']] for i,
+              person in enumerate(existing)])
+    save_csv(directory, 'gd', ['StudentID', 'Name', 'EnrolmentFK', 'Date',
+                               'Certificate'],
+             [[enrolments[i][1], 'Name', enrolments[i][0], rng.choice(dates),
+               'C{}'.format(i)] for i in range(num_rows, num_rows * 2)])
+    save_csv(directory, 'os', ['Column {}'.format(i) for i in range(35)],
+             [make_os_row(rng, make_person(rng, 300000000 + i), dates) for i
+              in range(num_rows)])
+    save_csv(directory, 'ext', ['StudentID', 'Name', 'EnrolmentFK', 'Length',
+                                'AcceptanceDate', 'NewExpiry'],
+             [[enrolments[i][1], 'Name', enrolments[i][0], '3', dates[1],
+               dates[2]] for i in range(num_rows, num_rows * 2)])
+    # Results files for the ADV base course
+    statuses = ['Graduated', 'Expired', 'Withdrawn', 'Active']
+    save_csv(directory, 'Expiry_Dates_ADV', ['EnrolmentPK', 'CourseFK',
+                                             'ExpiryDate', 'Status'],
+             [[enrolment[0], 'ADV-ON-001', '01/01/2018', rng.choice(statuses)]
+              for enrolment in enrolments[:num_rows]])
+    save_text(directory, 'Course_codes', ['ADV', 'BKG'])
+    save_text(directory, 'Current_Results_Students_ADV',
+              [enrolment[0] for enrolment in enrolments[:num_rows:10]])
+    assessments = ['Assessment {}'.format(i) for i in range(60)]
+    master_headings = ['StudentID', 'Name', 'Course', 'EnrolmentID']
+    master_headings += assessments
+    save_text(directory, 'Master_Results_Headings_ADV', master_headings)
+    save_text(directory, 'Results_Table_Headings_ADV',
+              ['EnrolmentID'] + assessments)
+    save_text(directory, 'Students_to_add_ADV',
+              [enrolment[0] for enrolment in enrolments[:num_rows:2]])
+    save_csv(directory, 'Master_Results_ADV', master_headings,
+             [[enrolment[1], 'Name', 'ADV-ON-001', enrolment[0]] +
+              [rng.choice(['', '55', '70', '85']) for item in assessments]
+              for enrolment in enrolments[:num_rows]])
+    tables = {
+            'students': ({'Combined Data Form': 'cdf',
+                          'Enrolment Sheet': 'es_new'}, ''),
+            'tutors': ({'Tutor Data': 'td'}, ''),
+            'courses': ({'Course Data': 'cd'}, ''),
+            'workshops': ({'Workshop Data': 'wd'}, ''),
+            'course-tutors': ({'Course Tutors': 'ct'}, ''),
+            'workshop-tutors': ({'Workshop Tutor Data': 'wt'}, ''),
+            'enrolments': ({'Enrolment Sheet': 'es'}, ''),
+            'course-attendance': ({'Course Attendance': 'ca',
+                                   'Dates': 'dates'}, attendance_course),
+            'workshop-attendance': ({'Workshop Attendance': 'wa'}, ''),
+            'graduates': ({'Graduates Data': 'gd'}, ''),
+            'old-students': ({'Old Students': 'os'}, ''),
+            'extensions': ({'Extensions Data': 'ext'}, ''),
+            'results-students': ({}, 'ADV'),
+            'results-table': ({}, 'ADV')
+            }
+    return tables
+
+
+def main(argv=None):
+    """Run the benchmarks and save the results.
+
+    Args:
+        argv (list): (Optional) Command line arguments, not including the
+        program name. If not provided, sys.argv is used.
+
+    Returns:
+        0 if every pipeline was processed and start up was within the budget,
+        1 otherwise.
+    """
+    pipelines = sdp.get_pipelines()
+    parser = argparse.ArgumentParser(
+            description='Time the Student Database Preparer pipelines with '
+            'generated data.')
+    parser.add_argument('tables', nargs='*', metavar='table',
+                        help='Tables to time: {}. All tables are timed if '
+                        'none are given.'.format(', '.join(pipelines)))
+    parser.add_argument('-s', '--sizes', nargs='+', type=int,
+                        default=[1000, 10000, 100000],
+                        help='Numbers of rows to generate.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each pipeline is run.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the generated data.')
+    parser.add_argument('--keep', default='',
+                        help='Directory to keep the generated data in.')
+    parser.add_argument('--startup-budget', type=float, default=0.1,
+                        help='Most seconds importing Student Database '
+                        'Preparer may take.')
+    args = parser.parse_args(argv)
+    for table in args.tables:
+        if table not in pipelines:
+            parser.error('invalid table: {}'.format(table))
+    tables = args.tables or list(pipelines)
+    startup = time_startup(args.repeat)
+    startup['budget'] = args.startup_budget
+    print('\nStart up took {:.3f}s (budget {:.3f}s).'.format(
+            startup['seconds'], args.startup_budget))
+    if startup['heavy_modules']:
+        print('Imported at start up: {}.'.format(', '.join(
+                startup['heavy_modules'])))
+    results = []
+    for num_rows in args.sizes:
+        if args.keep != '':
+            directory = os.path.join(args.keep, str(num_rows))
+            os.makedirs(directory, exist_ok=True)
+        else:
+            directory = tempfile.mkdtemp(prefix='sdp_benchmark_')
+        try:
+            print('\nGenerating {} rows in {}...'.format(num_rows, directory))
+            table_files = create_benchmark_files(directory, num_rows,
+                                                 args.seed)
+            for table in tables:
+                files, course_code = table_files[table]
+                result = time_pipeline(directory, table, files, course_code,
+                                       args.repeat)
+                result['rows'] = num_rows
+                result['rows_per_second'] = round(
+                        num_rows / max(result['seconds'], 1e-9), 1)
+                results.append(result)
+                print('{:<20} {:>9} {:<10} {:>9.3f}s {:>12} rows/s'.format(
+                        table, num_rows, result['status'], result['seconds'],
+                        result['rows_per_second']))
+        finally:
+            if args.keep == '':
+                shutil.rmtree(directory, ignore_errors=True)
+    file_name = save_results(results, args.repeat, startup)
+    print('\nResults have been saved to {}'.format(file_name))
+    if any(result['status'] != 'processed' for result in results):
+        return 1
+    if startup['seconds'] > args.startup_budget or startup['heavy_modules']:
+        print('\nStart up is over budget.')
+        return 1
+    return 0
+
+
+def make_cdf_row(rng, person, courses):
+    """Return a Combined Data Form row for a person.
+
+    Args:
+        rng (Random): Random number generator.
+        person (dict): Person details from make_person().
+        courses (list): Course code and Course Date for each course.
+
+    Returns:
+        row (list): The 64 columns of the Combined Data Form.
+    """
+    row = [''] * 64
+    row[0] = person['id']
+    if rng.random() < 0.5:
+        row[1] = 'Online'
+    else:
+        row[1] = 'Part-time class'
+        row[2] = rng.choice(courses[1:])[1]
+    row[4] = person['first']
+    row[6] = person['last']
+    row[9] = person['preferred']
+    row[13] = rng.choice(['Male', 'Female'])
+    row[14] = person['birth']
+    row[22] = rng.choice(['', '095551234'])
+    row[23] = person['mobile']
+    row[24] = person['email']
+    row[25] = 'Mobile'
+    row[26] = 'Email'
+    row[27] = 'New Zealander'
+    row[28] = rng.choice(['NZ European', 'Maori', 'Other'])
+    row[29] = 'Samoan'
+    row[30] = 'New Zealand'
+    row[32] = rng.choice(['NZ Citizen', 'Other'])
+    row[33] = 'Permanent Resident'
+    row[34] = rng.choice(['Yes', 'No'])
+    row[35] = 'Maori'
+    row[36] = str(rng.randint(1, 400))
+    row[37] = 'Queen Street'
+    row[38] = 'Central'
+    row[39] = 'Auckland'
+    row[40] = str(rng.randint(1000, 9999))
+    row[41] = 'New Zealand'
+    row[42] = rng.choice(['No', 'Yes'])
+    row[44] = 'Employed'
+    row[45] = 'NCEA Level 3'
+    row[46] = '2010'
+    row[48] = rng.choice(['Career change', 'Other'])
+    row[50] = rng.choice(['Facebook', 'Other'])
+    row[52] = 'Agreed'
+    return row
+
+
+def make_code(prefix, number, length):
+    """Return a code of a fixed length made from a number.
+
+    The number is written in base 36 after the prefix so that large data sets
+    still fit in the code length.
+
+    Args:
+        prefix (str): Start of the code.
+        number (int): Number to make the code from.
+        length (int): Length of the code.
+
+    Returns:
+        code (str): The code.
+    """
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    code = ''
+    while number > 0:
+        number, remainder = divmod(number, 36)
+        code = digits[remainder] + code
+    return prefix + code.rjust(length - len(prefix), '0')
+
+
+def make_date(rng):
+    """Return a random date in the form dd/mm/yyyy."""
+    return '{:02d}/{:02d}/{}'.format(rng.randint(1, 28), rng.randint(1, 12),
+                                     rng.randint(2015, 2019))
+
+
+def make_es_row(rng, person, courses, tutors, dates):
+    """Return an Enrolment Sheet row for a person.
+
+    Args:
+        rng (Random): Random number generator.
+        person (dict): Person details from make_person().
+        courses (list): Course code and Course Date for each course.
+        tutors (list): Person details for each tutor.
+        dates (list): Dates to choose from.
+
+    Returns:
+        row (list): The 18 columns of the Enrolment Sheet.
+    """
+    tutor = rng.choice(tutors)
+    return [person['id'], person['first'], person['last'],
+            person['preferred'], person['mobile'], person['email'], 'Email',
+            rng.choice(courses)[0], rng.choice(dates), rng.choice(dates),
+            rng.choice(dates), '{} {}'.format(tutor['first'], tutor['last']),
+            rng.choice(dates), person['username'], 'Active',
+            rng.choice(['Green', 'Orange', '']), '', '']
+
+
+def make_os_row(rng, person, dates):
+    """Return an Old Students row for a person.
+
+    Args:
+        rng (Random): Random number generator.
+        person (dict): Person details from make_person().
+        dates (list): Dates to choose from.
+
+    Returns:
+        row (list): The 35 columns of the Old Students file.
+    """
+    row = [''] * 35
+    row[0] = person['id']
+    row[1] = person['first']
+    row[2] = person['last']
+    row[3] = person['preferred']
+    row[4] = person['birth']
+    row[5] = person['username']
+    row[7] = person['mobile']
+    row[8] = person['email']
+    row[9] = 'Email'
+    row[10] = str(rng.randint(1, 400))
+    row[11] = 'Queen Street'
+    row[12] = 'Central'
+    row[13] = 'Auckland'
+    row[14] = str(rng.randint(1000, 9999))
+    row[15] = 'New Zealand'
+    row[23] = 'Facebook'
+    row[25] = rng.choice(dates)
+    row[26] = rng.choice(['Male', 'Female'])
+    row[27] = 'NZ European'
+    return row
+
+
+def make_person(rng, person_id):
+    """Return the details for a generated person.
+
+    Args:
+        rng (Random): Random number generator.
+        person_id (int or str): Student ID Number or Tutor ID.
+
+    Returns:
+        person (dict): ID, names, username, birth date, mobile and email.
+    """
+    first_names = ['Aroha', 'Ben', 'Chloe', 'Daniel', 'Emma', 'Finn',
+                   'Grace', 'Hemi', 'Isla', 'Jack', 'Kiri', 'Liam']
+    last_names = ['Brown', 'Clarke', 'Ngata', 'Patel', 'Smith', 'Taylor',
+                  'Walker', 'Williams', 'Wilson', 'Young']
+    first = rng.choice(first_names)
+    last = rng.choice(last_names)
+    username = '{}{}{}'.format(first, last, ''.join(
+            rng.choice('abcdefghijklmnopqrstuvwxyz') for i in range(4)))
+    return {'id': str(person_id), 'first': first, 'last': last,
+            'preferred': rng.choice(['', first]),
+            'username': username.lower(),
+            'birth': '{:02d}/{:02d}/{}'.format(rng.randint(1, 28),
+                                                rng.randint(1, 12),
+                                                rng.randint(1960, 2002)),
+            'mobile': '021{:07d}'.format(rng.randint(0, 9999999)),
+            'email': '{}@example.com'.format(username.lower())}
+
+
+def save_csv(directory, f_name, headings, rows):
+    """Save rows to a CSV file with a headings row.
+
+    Args:
+        directory (str): Directory to save the file to.
+        f_name (str): File name without the .csv extension.
+        headings (list): Column headings.
+        rows (list): Rows to be saved.
+    """
+    with open(os.path.join(directory, '{}.csv'.format(f_name)), 'w',
+              newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(headings)
+        writer.writerows(rows)
+
+
+def save_results(results, repeat, startup):
+    """Save the benchmark results to a JSON file.
+
+    Args:
+        results (list): Result for each table and size.
+        repeat (int): Number of times each pipeline was run.
+        startup (dict): Start up time and budget from time_startup().
+
+    Returns:
+        file_name (str): Name of the saved file.
+    """
+    report = {'created': ft.generate_time_string(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(), 'repeat': repeat,
+              'startup': startup, 'results': results}
+    file_name = 'Benchmark_Results_{}.json'.format(ft.generate_time_string())
+    with open(file_name, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    return file_name
+
+
+def save_text(directory, f_name, items):
+    """Save items to a txt file on one line, separated by commas.
+
+    Args:
+        directory (str): Directory to save the file to.
+        f_name (str): File name without the .txt extension.
+        items (list): Items to be saved.
+    """
+    with open(os.path.join(directory, '{}.txt'.format(f_name)),
+              'w') as text_file:
+        text_file.write(','.join(items))
+
+
+def time_startup(repeat):
+    """Time importing Student Database Preparer in a new interpreter.
+
+    Args:
+        repeat (int): Number of times to start the interpreter.
+
+    Returns:
+        startup (dict): Fastest import time in seconds and the heavy modules
+        (see HEAVY_MODULES) that were imported with it.
+    """
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            'import Student_Database_Preparer\n'
+            'print(time.perf_counter() - start)\n'
+            'print(\',\'.join(name for name in {!r} if name in '
+            'sys.modules))'.format(HEAVY_MODULES))
+    # Make sure the new interpreter finds the same modules
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+    times = []
+    for i in range(max(repeat, 1)):
+        output = subprocess.run([sys.executable, '-c', code], env=env,
+                                stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout.split('\n')
+        times.append(float(output[0]))
+    heavy_modules = [name for name in output[1].split(',') if name]
+    return {'seconds': round(min(times), 6), 'heavy_modules': heavy_modules}
+
+
+def time_pipeline(directory, table, files, course_code, repeat):
+    """Time a pipeline end to end and for each stage.
+
+    Args:
+        directory (str): Directory holding the generated data.
+        table (str): Name of the table, as used by get_pipelines().
+        files (dict): File names to be loaded, keyed on the data source.
+        course_code (str): Code for the course being processed.
+        repeat (int): Number of times to run the pipeline.
+
+    Each run starts with an empty date parse cache and the files saved by a
+    run are removed before the next one, so that every run does the same work.
+
+    Returns:
+        result (dict): Table name, status, fastest run time in seconds, the
+        time for each run and the stage timings and date cache statistics
+        for the fastest run.
+    """
+    start_dir = os.getcwd()
+    os.chdir(directory)
+    runs = []
+    try:
+        for i in range(repeat):
+            sdp.parse_date.cache_clear()
+            # Memory is not traced as it would slow the pipelines down
+            date_cache = sdp.date_cache_stats()
+            with sdp.profile_stages(memory=False) as stages:
+                run = sdp.run_table(table, files, course_code, capture=True)
+            run['stages'] = stages
+            run['date_cache'] = sdp.date_cache_stats(date_cache)
+            runs.append(run)
+            # Remove the upload and any error and warning logs
+            for file_name in run['output_files']:
+                if os.path.isfile(file_name):
+                    os.remove(file_name)
+            if run['status'] != 'processed':
+                break
+    finally:
+        os.chdir(start_dir)
+    fastest = min(runs, key=lambda run: run['seconds'])
+    result = {'table': table, 'status': runs[-1]['status'],
+              'seconds': fastest['seconds'],
+              'runs': [run['seconds'] for run in runs],
+              'stages': fastest['stages'],
+              'date_cache': fastest['date_cache']}
+    if result['status'] != 'processed':
+        result['messages'] = runs[-1]['messages']
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())
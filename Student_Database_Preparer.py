@@ -4,14 +4,105 @@
 # Takes in data files and prepares them for uploading into the
 # Student Database
 
+import argparse
+import collections
+import contextlib
 import copy
+import csv
 import custtools.admintools as ad
-import custtools.databasetools as db
-import custtools.datetools as da
 import custtools.filetools as ft
-import numpy as np
-import pandas as pd
+import functools
+import hashlib
+import io
+import json
+import operator
+import os
+import pickle
 import sys
+import time
+import tracemalloc
+import types
+# pandas, numpy, concurrent.futures, multiprocessing and the custtools
+# database and date modules are imported in the functions that use them, so
+# that tables which do not need them start quickly
+
+# Errors held back by process_errors() while collect_errors() is active
+error_collection = []
+
+# Databases that upload rows are saved to while sqlite_output() is active
+output_databases = []
+
+# Files saved for each table while run_table() is recording them, see
+# record_file()
+saved_files = []
+
+# Stage profiles being recorded while profile_stages() is active, see stage()
+stage_profiles = []
+
+# Worker processes for check_cdf() when jobs is not passed. Forms are checked
+# in this process unless a batch run asks for workers, see set_check_jobs()
+cdf_check_jobs = 1
+
+# Cleaned rows, as returned by clean_cdf_frame(), clean_es_frame(),
+# clean_os() and clean_expiry(). Fields are in upload file order and can also
+# be accessed by position.
+CdfRow = collections.namedtuple('CdfRow', [
+        'student_id', 'course', 'first_name', 'last_name', 'preferred_name',
+        'gender', 'birth_date', 'guardian_first_name', 'guardian_last_name',
+        'guardian_id', 'under_18_auth', 'telephone', 'mobile', 'email',
+        'contact_mode', 'nationality', 'ethnicity', 'birth_country', 'iwi',
+        'citizenship', 'language', 'address_number', 'address_street',
+        'address_suburb', 'address_city', 'post_code', 'address_country',
+        'disability', 'employment', 'previous_education', 'previous_ed_year',
+        'national_student_number', 'study_reason', 'how_heard',
+        'agree_tandc'])
+EsRow = collections.namedtuple('EsRow', [
+        'student_id', 'first_name', 'last_name', 'preferred_name', 'mobile',
+        'email', 'contact_mode', 'course', 'enrolled_date', 'start_date',
+        'end_date', 'tutor', 'tutor_contact', 'username', 'status', 'tag',
+        'enrolment_code', 'national_student_number'])
+OsRow = collections.namedtuple('OsRow', [
+        'student_id', 'first_name', 'last_name', 'preferred_name',
+        'birth_date', 'username', 'telephone', 'mobile', 'email',
+        'contact_mode', 'address_number', 'address_street', 'address_suburb',
+        'address_city', 'post_code', 'address_country', 'nationality', 'iwi',
+        'citizenship', 'guardian_first_name', 'guardian_last_name',
+        'guardian_id', 'under_18_auth', 'how_heard', 'agree_tandc',
+        'enrolled_date', 'gender', 'ethnicity', 'birth_country', 'language',
+        'disability', 'previous_education', 'previous_ed_year', 'employment',
+        'study_reason'])
+ExpiryRow = collections.namedtuple('ExpiryRow', [
+        'enrolment_id', 'course', 'expiry_date', 'status'])
+# Matched Combined Data Form and Enrolment Sheet rows, see join_cdf_es()
+JoinedRow = collections.namedtuple('JoinedRow', ['cdf', 'es'])
+
+# Fields of each matched (JoinedRow) student for the Students table upload,
+# see get_student_data()
+STUDENT_UPLOAD_FIELDS = operator.attrgetter(
+        'cdf.student_id', 'cdf.first_name', 'cdf.last_name',
+        'cdf.preferred_name', 'cdf.gender', 'cdf.birth_date', 'es.username',
+        'cdf.telephone', 'cdf.mobile', 'cdf.email', 'cdf.contact_mode',
+        # Address
+        'cdf.address_number', 'cdf.address_street', 'cdf.address_suburb',
+        'cdf.address_city', 'cdf.post_code', 'cdf.address_country',
+        # Nationality to Language
+        'cdf.nationality', 'cdf.ethnicity', 'cdf.birth_country', 'cdf.iwi',
+        'cdf.citizenship', 'cdf.language',
+        # Guardian
+        'cdf.guardian_first_name', 'cdf.guardian_last_name', 'cdf.guardian_id',
+        'cdf.under_18_auth', 'cdf.disability',
+        # Previous Education
+        'cdf.previous_education', 'cdf.previous_ed_year',
+        'cdf.national_student_number', 'cdf.employment', 'cdf.study_reason',
+        'cdf.how_heard', 'cdf.agree_tandc', 'es.enrolled_date')
+
+# Allowed values for the Status and Tag columns of the Enrolment Sheet, see
+# check_es_frame() and clean_es_frame()
+ENROLMENT_STATUSES = ('Active', 'Suspended', 'Withdrawn', 'Graduated',
+                      'Expired', 'On Hold', 'Cancelled')
+ENROLMENT_TAGS = ('', 'N/A', 'Green', 'Orange', 'Red', 'Purple', 'Black',
+                  'Expired', 'Withdrawn', 'Graduated', 'Suspended', 'On Hold',
+                  'Cancelled')
 
 
 def add_students(initial_students, additional_students):
@@ -22,7 +113,7 @@ def add_students(initial_students, additional_students):
     
     Args:
         initial_students (list): Initial list of student Enrolment IDs.
-        additional_students (list): List of lists with student data to add.
+        additional_students (list): ExpiryRow for each student to add.
         
     Returns:
         updated_students (list): List with updated students.
@@ -31,24 +122,24 @@ def add_students(initial_students, additional_students):
     updated_students = copy.deepcopy(initial_students)
     # Add in Enrolment IDs from the additional_students list
     for student in additional_students:
-        updated_students.append(student[0])
+        updated_students.append(student.enrolment_id)
     return updated_students
     
 
-def apply_students_filter(student, students):
-    """Convert to NaN students that do not appear in the students list.
-    
+def add_warnings(warnings, items_to_add):
+    """Add warnings to a list without repeating the warnings heading.
+
+    Used when the same check is run over several chunks of a file so that the
+    heading returned with each chunk's warnings only appears once.
+
     Args:
-        student (str): Enrolment ID for student entry.
-        students (list): List of Enrolment IDs to be included.
-        
-    Returns:
-        student if present in students, NaN if not.    
+        warnings (list): Warnings identified so far.
+        items_to_add (list): Warnings to be added, starting with a heading.
     """
-    if student in students:
-        return student
-    else:
-        return np.nan
+    for item in items_to_add:
+        if item == items_to_add[0] and item in warnings:
+            continue
+        warnings.append(item)
 
 
 def check_ass_data(ass_data, number):
@@ -83,7 +174,7 @@ def check_ass_data(ass_data, number):
             errors.append('An assessment item is empty.')
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Assessments_Data')
+        process_errors(errors, 'Assessments_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -125,7 +216,7 @@ def check_ca(ca_data):
             i += 1
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Course_Attendance_Data')
+        process_errors(errors, 'Course_Attendance_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -160,7 +251,7 @@ def check_cc(course_codes):
                             (course[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Course Codes')
+        process_errors(errors, 'Course Codes')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -209,7 +300,7 @@ def check_cd(course_data):
                             '{}'.format(course[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Course Data')
+        process_errors(errors, 'Course Data')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -217,7 +308,7 @@ def check_cd(course_data):
         return False, warnings
 
 
-def check_cdf(combined_data):
+def check_cdf(combined_data, jobs=None):
     """Return list of warnings for information in CDF file.
 
     Checks the Combined Data Form for the required information.
@@ -226,8 +317,18 @@ def check_cdf(combined_data):
     Missing or incorrect information that is non-fatal is appended to a
     warnings list and returned.
 
+    If worker processes are requested, forms of 5000 rows or more are split
+    into chunks that are checked on a pool of worker processes. The errors
+    and warnings are merged back in row order, so the result is the same as
+    checking the rows one after another.
+
     Args:
         coumbined_data (list): A list with the data for each student.
+        jobs (int): (Optional) Number of worker processes. If not provided,
+        cdf_check_jobs is used for forms with 5000 or more rows (see
+        set_check_jobs()), which is 1 unless a batch run has asked for
+        workers. Forms are always checked in this process if jobs is 1 or if
+        this is a daemonic process.
 
     Returns:
         True if warnings list has had items appended to it, False otherwise.
@@ -254,8 +355,57 @@ def check_cdf(combined_data):
         Entry Id, Entry Date, Source Url, Transaction Id, Payment Amount,
         Payment Date, Payment Status, Post Id, User Agent, User IP.
     """
+    import concurrent.futures
+    import multiprocessing
     errors = []
     warnings = ['\nCombined Data Form Warnings:\n']
+    if jobs is None:
+        jobs = cdf_check_jobs
+        # Small forms are quicker to check than to start a pool for
+        if len(combined_data) < 5000:
+            jobs = 1
+    # Daemonic processes (e.g. multiprocessing.Pool workers) cannot start a
+    # pool of their own
+    if jobs > 1 and not multiprocessing.current_process().daemon:
+        chunk_size = max(1000, -(-len(combined_data) // (jobs * 4)))
+        chunks = chunk_rows(combined_data, chunk_size)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            for chunk_errors, chunk_warnings in pool.map(check_cdf_rows,
+                                                         chunks):
+                errors.extend(chunk_errors)
+                warnings.extend(chunk_warnings)
+    else:
+        chunk_errors, chunk_warnings = check_cdf_rows(combined_data)
+        errors.extend(chunk_errors)
+        warnings.extend(chunk_warnings)
+    # Check if any errors have been identified, save error log if they have
+    if len(errors) > 0:
+        process_errors(errors, 'Combined_Data_Form')
+    # Check if any warnings have been identified, return if they have
+    if len(warnings) > 1:
+        return True, warnings
+    else:
+        return False, warnings
+
+
+def check_cdf_rows(combined_data):
+    """Return the errors and warnings for rows of the CDF file.
+
+    Performs the row checks for check_cdf(). Does not process the error log
+    so that it can be used for a chunk of the rows in a worker process.
+
+    Args:
+        combined_data (list): A list with the data for each student. See
+        check_cdf() for the file structure.
+
+    Returns:
+        errors (list): Errors that have been identified in the rows.
+        warnings (list): Warnings that have been identified in the rows, not
+        including a heading.
+    """
+    import custtools.databasetools as db
+    errors = []
+    warnings = []
     for student in combined_data:
         if len(student[0]) != 9:
             errors.append('Student ID Number incorrect length for student '
@@ -273,7 +423,7 @@ def check_cdf(combined_data):
             warnings.append('Gender is missing for student {}'.format(
                     student[0]))
         # Check Birth Date is valid
-        if not da.validate_date(student[14].strip()):
+        if not date_is_valid(student[14].strip()):
             errors.append('Date of birth is not valid for student '
                           '{}'.format(student[0]))
         if not ad.check_lead_zero(student[22].strip()):
@@ -305,14 +455,7 @@ def check_cdf(combined_data):
         if student[52] in (None, ''):
             errors.append('Terms and Conditions missing for student '
                           '{}'.format(student[0]))
-    # Check if any errors have been identified, save error log if they have
-    if len(errors) > 0:
-        ft.process_error_log(errors, 'Combined_Data_Form')
-    # Check if any warnings have been identified, return if they have
-    if len(warnings) > 1:
-        return True, warnings
-    else:
-        return False, warnings
+    return errors, warnings
 
 
 def check_course(expiry_data, course_code):
@@ -323,18 +466,18 @@ def check_course(expiry_data, course_code):
     file is created and the program exits.
     
     Args:
-        expiry_data (list): List of lists holding expiry dates data.
+        expiry_data (list): Cleaned expiry dates data (ExpiryRow).
         course_code (str): Three letter course code, e.g. ADV.
     """
     errors = []
     for student in expiry_data:
         # Check first three letters of course code match course_code
-        if student[1][:3] != course_code:
+        if student.course[:3] != course_code:
              errors.append('Incorrect course for the following student '
-                           'Enrolment ID: {}.'.format(student[0]))
+                           'Enrolment ID: {}.'.format(student.enrolment_id))
      # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Expiry_Data_Course_Codes')    
+        process_errors(errors, 'Expiry_Data_Course_Codes')    
 
 
 def check_ctd(source_tutor_data, source, source_type):
@@ -369,7 +512,7 @@ def check_ctd(source_tutor_data, source, source_type):
                                   source_type, tutor[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)
+        process_errors(errors, source)
     return False, warnings
 
 
@@ -396,12 +539,12 @@ def check_da(da_data):
     i = 0
     while i < len(da_data[0]):
         # Check that each item is a valid date
-        if not da.validate_date(da_data[0][i]):
+        if not date_is_valid(da_data[0][i]):
             errors.append('Incorrect Date found:{}.'.format(da_data[0][i]))
         i += 1
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Course_Attendance_Dates_Data')
+        process_errors(errors, 'Course_Attendance_Dates_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -474,7 +617,7 @@ def check_e_id_data(e_id_data):
             warnings.append('Tutor missing for student {}.'.format(student[1]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Enrolment_Sheet')
+        process_errors(errors, 'Enrolment_Sheet')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -509,7 +652,7 @@ def check_ec(ec_data):
                           '{}.'.format(code[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Enrolment_Codes_Data')
+        process_errors(errors, 'Enrolment_Codes_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -517,7 +660,7 @@ def check_ec(ec_data):
         return False, warnings
 
 
-def check_es(es_data):
+def check_es_frame(es_data):
     """Return list of warnings for information in Enrolment Sheet file.
 
     Checks the Enrolment Sheet data for the required information.
@@ -526,6 +669,11 @@ def check_es(es_data):
     Missing or incorrect information that is non-fatal is appended to a
     warnings list and returned.
 
+    Each rule is applied to a whole column and the rows that fail it are
+    reported from a boolean mask. Messages are returned by row, then by
+    rule. Rules that depend on the custtools helpers are applied once for
+    each distinct value.
+
     Args:
         es_data (list): A list with the data for each student.
 
@@ -536,71 +684,75 @@ def check_es(es_data):
     File structure (es_data):
         Student ID, First Name, Last Name, Preferred Name,
         Mobile, Email, Preferred Contact Mode, Course, Date Enrolled,
-        Start Date, End Date, Tutor, Tutor contact, Username, Status, Tag
+        Start Date, End Date, Tutor, Tutor contact, Username, Status, Tag,
         Enrolment Code, National Student Number.
     """
+    import custtools.databasetools as db
+    import pandas as pd
     errors = []
     warnings = ['\nEnrolment Sheet Warnings:\n']
-    for student in es_data:
-        # Check Student ID is valid length
-        if len(student[0]) != 9:
-            errors.append('Student ID Number incorrect length for student '
-                          '{} {}.'.format(student[1], student[2]))
-        if student[1] in (None, ''):
-            warnings.append('First name missing for student {}.'.format(
-                    student[0]))
-        if student[2] in (None, ''):
-            warnings.append('Last name missing for student {}.'.format(
-                    student[0]))
-        if not ad.check_lead_zero(student[4].strip()):
-            warnings.append('Mobile is missing a leading 0 for student {}'
-                            '. A 0 will be added to the start of their '
-                            'mobile number.'.format(student[0]))
-        # Check email address is present and in valid format
-        if student[5] in (None, ''):
-            errors.append('Email missing for student {}'.format(student[0]))
-        elif not ad.check_email(student[5]):
-            errors.append('Email format is not valid for student '
-                          '{}'.format(student[0]))
-        if student[7] in (None, ''):
-            errors.append('Course code missing for student '
-                          '{}'.format(student[0]))
-        if not da.validate_date(student[8].strip()):
-            errors.append('Enrolment date is not valid for student '
-                          '{}'.format(student[0]))
-        if student[9].strip() in (None, ''):
-            warnings.append('Start date missing for student {}.'.format(
-                    student[0]))
-        elif not da.validate_date(student[9].strip()):
-            errors.append('Start date is not valid for student {}.'.format(
-                    student[0]))
-        if student[10].strip() in (None, ''):
-            warnings.append('End date missing for student {}'.format(
-                    student[0]))
-        elif not da.validate_date(student[10].strip()):
-            errors.append('End date is not valid for student {}.'.format(
-                    student[0]))
-        if student[11] in (None, ''):
-            warnings.append('Tutor is missing for student {}.'.format(
-                    student[0]))
-        # Check username is present and valid
-        if student[13].strip() in (None, ''):
-            warnings.append('Username is missing for student {}.'.format(
-                    student[0]))
-        elif not db.check_username(student[13]):
-            errors.append('Username is not valid for student {}. Please '
-                          'make sure it contains lower-case letters only '
-                          'and no digits or special characters.'.format(
-                                  student[0]))
-        if not check_status(student[14].strip()):
-            errors.append('Status is not valid for student {}.'.format(
-                    student[0]))
-        if not check_tag(student[15].strip()):
-            errors.append('Tag is not valid for student {}.'.format(
-                    student[0]))
+    if len(es_data) == 0:
+        return False, warnings
+    raw = pd.DataFrame(data=es_data).iloc[:, :18].astype(str)
+    col = {i: raw[i].str.strip() for i in range(18)}
+    dates_valid = {i: map_unique(col[i], date_is_valid).astype(bool) for
+                   i in (8, 9, 10)}
+    email_valid = map_unique(raw[5], ad.check_email).astype(bool)
+    username_valid = map_unique(raw[13], db.check_username).astype(bool)
+    lead_zero = map_unique(col[4], ad.check_lead_zero).astype(bool)
+    # Each rule: (mask, is error, message, columns used in message)
+    rules = [
+            (raw[0].str.len() != 9, True, 'Student ID Number incorrect '
+             'length for student {} {}.', (1, 2)),
+            (raw[1] == '', False, 'First name missing for student {}.',
+             (0,)),
+            (raw[2] == '', False, 'Last name missing for student {}.', (0,)),
+            (~lead_zero, False, 'Mobile is '
+             'missing a leading 0 for student {}. A 0 will be added to the '
+             'start of their mobile number.', (0,)),
+            (raw[5] == '', True, 'Email missing for student {}', (0,)),
+            ((raw[5] != '') & ~email_valid, True, 'Email format is not '
+             'valid for student {}', (0,)),
+            (raw[7] == '', True, 'Course code missing for student {}', (0,)),
+            (~dates_valid[8], True, 'Enrolment date is not valid for '
+             'student {}', (0,)),
+            (col[9] == '', False, 'Start date missing for student {}.',
+             (0,)),
+            ((col[9] != '') & ~dates_valid[9], True, 'Start date is not '
+             'valid for student {}.', (0,)),
+            (col[10] == '', False, 'End date missing for student {}', (0,)),
+            ((col[10] != '') & ~dates_valid[10], True, 'End date is not '
+             'valid for student {}.', (0,)),
+            (raw[11] == '', False, 'Tutor is missing for student {}.', (0,)),
+            (col[13] == '', False, 'Username is missing for student {}.',
+             (0,)),
+            ((col[13] != '') & ~username_valid, True, 'Username is not '
+             'valid for student {}. Please make sure it contains lower-case '
+             'letters only and no digits or special characters.', (0,)),
+            (~col[14].isin(ENROLMENT_STATUSES), True, 'Status is not valid '
+             'for student {}.', (0,)),
+            (~col[15].isin(ENROLMENT_TAGS), True, 'Tag is not valid for '
+             'student {}.', (0,))
+            ]
+    found_errors = []
+    found_warnings = []
+    for order, (mask, is_error, message, columns) in enumerate(rules):
+        failed = raw[mask]
+        for row, values in zip(failed.index, zip(*(failed[i] for i in
+                                                     columns))):
+            found = (row, order, message.format(*values))
+            if is_error:
+                found_errors.append(found)
+            else:
+                found_warnings.append(found)
+    # Report messages by row and then by rule
+    for found in sorted(found_errors):
+        errors.append(found[2])
+    for found in sorted(found_warnings):
+        warnings.append(found[2])
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Enrolment_Sheet')
+        process_errors(errors, 'Enrolment_Sheet')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -644,16 +796,16 @@ def check_ex(ext_data):
             errors.append('Extension Length is not a valid number for '
                           'StudentID {}'.format(student[0]))
         # Check that the Acceptance Date is in a valid format
-        if not da.validate_date(student[4].strip()):
+        if not date_is_valid(student[4].strip()):
             errors.append('Acceptance date is not valid for student '
                           '{}.'.format(student[0]))
         # Check that the New Expiry Date is in a valid format
-        if not da.validate_date(student[5].strip()):
+        if not date_is_valid(student[5].strip()):
             errors.append('New Expiry Date is not valid for student '
                           '{}.'.format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Extensions_Data')
+        process_errors(errors, 'Extensions_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -687,12 +839,12 @@ def check_exc(exc_data):
             errors.append('Enrolment code is not a valid number for '
                           'Acceptance Date {}.'.format(code[1]))
         # Check that Acceptance Date is present and is a valid date
-        if not da.validate_date(code[1].strip()):
+        if not date_is_valid(code[1].strip()):
             errors.append('Acceptance date is not valid for Enrolment ID '
                           '{}.'.format(code[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Extension_Codes_Data')
+        process_errors(errors, 'Extension_Codes_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -728,7 +880,7 @@ def check_expiry(exp_data):
             errors.append('Course code is missing for Enrolment ID {}'.format(
                     student[0]))
         # Check Expiry Date present and in correct format
-        if not da.validate_date(student[2].strip()):
+        if not date_is_valid(student[2].strip()):
             errors.append('Expiry date is not valid for Enrolment ID {}'.format
                           (student[0]))
         # Check status is present
@@ -737,7 +889,7 @@ def check_expiry(exp_data):
                     student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Expiry_Dates_Data')
+        process_errors(errors, 'Expiry_Dates_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -772,7 +924,7 @@ def check_gc(gc_data):
                           'GraduatePK  {}.'.format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Graduates_Current_Data')
+        process_errors(errors, 'Graduates_Current_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -811,7 +963,7 @@ def check_gd(gd_data):
             errors.append('Enrolment code is not a valid number for '
                           'Student ID {}'.format(student[0]))
         # Check that Graduation Date is in a valid format
-        if not da.validate_date(student[3].strip()):
+        if not date_is_valid(student[3].strip()):
             errors.append('Graduation date is not valid for Student ID {}'
                           .format(student[0]))
         # Check that the Certificate Number is present
@@ -820,7 +972,7 @@ def check_gd(gd_data):
                           .format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Graduate_Data')
+        process_errors(errors, 'Graduate_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -854,6 +1006,7 @@ def check_os(os_data):
         Language, Disability, PreviousEducation, PreviousEdYear, Employment,
         ReasonForStudy.
     """
+    import custtools.databasetools as db
     # print('check os_data:')
     # ad.debug_list(os_data)
     errors = []
@@ -873,7 +1026,7 @@ def check_os(os_data):
         if student[4].strip() in (None, ''):
                 warnings.append('Date of birth date missing for student '
                                 '{}.'.format(student[0]))
-        elif not da.validate_date(student[4].strip()):
+        elif not date_is_valid(student[4].strip()):
             errors.append('Date of birth date is not valid for student '
                           '{}.'.format(student[0]))
         # Check username is present and valid
@@ -899,12 +1052,12 @@ def check_os(os_data):
         if student[25].strip() in (None, ''):
                 warnings.append('Enrolment Date missing for student '
                                 '{}.'.format(student[0]))
-        elif not da.validate_date(student[25].strip()):
+        elif not date_is_valid(student[25].strip()):
             errors.append('Enrolment Date is not valid for student '
                           '{}.'.format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Old_Students_Data')
+        process_errors(errors, 'Old_Students_Data')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -912,47 +1065,64 @@ def check_os(os_data):
         return False, warnings
 
 
-def check_present(database_ids, source_data, a_id_pos, b_id_pos, source,
-                  id_type):
+def check_pairs_unique(existing, to_check, ex_key_pos, ch_key_pos, source,
+                       message):
+    """Check that each combination of values is not already in the database.
+
+    Indexes the existing combinations once and then checks each row of the
+    data to be checked against the index. If any combination is already
+    present an error file is saved and the program exits.
+
+    Args:
+        existing (list): The list of combinations currently in the database.
+        to_check (list): The list of combinations to be checked (in the
+                         submitted data).
+        ex_key_pos (tuple): Positions of the key values in existing.
+        ch_key_pos (tuple): Positions of the key values in to_check.
+        source (str): Source of data that is being checked.
+        message (str): Error message, formatted with the key values.
+    """
+    errors = []
+    existing_keys = create_key_index(existing, ex_key_pos)
+    for row in to_check:
+        key = tuple(row[pos] for pos in ch_key_pos)
+        if key in existing_keys:
+            errors.append(message.format(*key))
+    # Check if any errors have been identified, save error log if they have
+    if len(errors) > 0:
+        process_errors(errors, source)
+
+
+def check_present(id_index, source_data, b_id_pos, source, id_type):
     """Check that an identifier is present before it is used.
 
     If an identifier is missing from database an error file is saved and the
     program exits.
 
     Args:
-        database_ids (list): List of identifiers present in the database.
+        id_index (frozenset): Identifiers present in the database, as returned
+        by create_id_index().
         source_data (list): List of data to be checked.
-        a_id_pos (int): Position of identifier in the list of ids in database.
         b_id_pos (int): Position of identifier in the data list being checked.
+        source (str): Source of data that is being checked.
         id_type (str): Type of identifier (singular). e.g. Course code.
 
-    File structure (database_ids):
-        Course Code, Course Name.
-
     File structure (source_data):
         Course Code, Course Name.
     """
     errors = []
-    ids = []
-    # Separate identifiers into a list
-    for identifier in database_ids:
-        a = identifier[a_id_pos].strip()
-        ids.append(a)
-    # print('Contents of ids: ')
-    # ad.debug_list(ids)
-    # Check if provided code is in the list of Course codes
+    # Check if provided code is in the index of identifiers
     for item in source_data:
-        if item[b_id_pos].strip() in ids or item[b_id_pos].strip() in (None,
-                                                                       ''):
+        identifier = item[b_id_pos].strip()
+        if identifier in id_index or identifier in (None, ''):
             continue
         else:
             errors.append('{} {} not found in the list of {}s. Please check '
-                          'the list of {}s.'.format(id_type,
-                                       item[b_id_pos].strip(), id_type,
-                                       id_type))
+                          'the list of {}s.'.format(id_type, identifier,
+                                                    id_type, id_type))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)
+        process_errors(errors, source)
 
 
 def check_scc(scc_data):
@@ -983,7 +1153,7 @@ def check_scc(scc_data):
                           .format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Student_Course_Codes_Data')
+        process_errors(errors, 'Student_Course_Codes_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1016,7 +1186,7 @@ def check_si(si_data):
                           'for student {} {}.'.format(student[1], student[2]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Student_ID_Numbers')
+        process_errors(errors, 'Student_ID_Numbers')
     return False, warnings
 
 
@@ -1038,36 +1208,9 @@ def check_source_tutor_unique(source_data, pairings, source):
     File structure (pairings):
         CourseFK, TutorFK.
     """
-    errors = []
-    for pair in pairings:
-        for source_pair in source_data:
-            if pair == source_pair:
-                errors.append('The pairing {} is already in the database. '
-                              'Please correct file.'.format(pair))
-                break
-    # Check if any errors have been identified, save error log if they have
-    if len(errors) > 0:
-        ft.process_error_log(errors, source)
-
-
-def check_status(status):
-    """Return True if status is in allowed values.
-
-    Checks the status of student's enrolment against the list of allowed
-    values.
-
-    Args:
-        status (str): Status for student from the data source.
-
-    Returns:
-        True if status is in the allowed values, False otherwise.
-    """
-    allowed = ['Active', 'Suspended', 'Withdrawn', 'Graduated',
-               'Expired', 'On Hold', 'Cancelled']
-    if status.strip() in allowed:
-        return True
-    else:
-        return False
+    check_pairs_unique(pairings, source_data, (0, 1), (0, 1), source,
+                       'The pairing {} - {} is already in the database. '
+                       'Please correct file.')
 
 
 def check_swc(swc_data):
@@ -1097,7 +1240,7 @@ def check_swc(swc_data):
                           .format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Student_Workshop_Codes_Data')
+        process_errors(errors, 'Student_Workshop_Codes_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1105,26 +1248,6 @@ def check_swc(swc_data):
         return False, warnings
 
 
-def check_tag(tag):
-    """Return True if tag is in allowed values.
-    
-    Checks that the student's tag is in the list of allowed values.
-    
-    Args:
-        tag (str): Tag for student from the data source.
-    
-    Returns:
-        True if tag is in the allowed values, False otherwise.
-    """
-    allowed = [None, '', 'N/A', 'Green', 'Orange', 'Red', 'Purple', 'Black',
-               'Expired', 'Withdrawn', 'Graduated', 'Suspended', 'On Hold',
-               'Cancelled']
-    if tag.strip() in allowed:
-        return True
-    else:
-        return False
-
-
 def check_td(td_data):
     """Return list of warnings for information in Tutor Data file.
 
@@ -1168,7 +1291,7 @@ def check_td(td_data):
                           'is missing.'.format(tutor[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Tutor_Data_File')
+        process_errors(errors, 'Tutor_Data_File')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1209,7 +1332,7 @@ def check_tu(tu_data):
                           'is missing.'.format(tutor[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Tutor_ID_Numbers')
+        process_errors(errors, 'Tutor_ID_Numbers')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1217,43 +1340,34 @@ def check_tu(tu_data):
         return False, warnings
 
 
-def check_unique(database_ids, source_data, a_id_pos, b_id_pos, source,
-                 id_type):
+def check_unique(id_index, source_data, b_id_pos, source, id_type):
     """Check an identifier is not already in the database before it is used.
 
     Required information that is missing causes an error file to be saved
     and the program to exit.
 
     Args:
-        database_ids (list): List of identifiers present in the database.
+        id_index (frozenset): Identifiers present in the database, as returned
+        by create_id_index().
         source_data (list): List of identifiers to be checked.
-        a_id_pos (int): Position of identifier in the list of ids in database.
         b_id_pos (int): Position of identifier in the data list being checked.
         source (str): Source of data that is being checked.
         id_type (str): Type of identifier (singular). e.g. Course code
 
-    File structure (database_ids):
-        Course Code, Course Name.
-
     File structure (source_data):
         Course Code, Course Name.
     """
     errors = []
-    ids = []
-    # Separate identifiers into a list
-    for identifier in database_ids:
-        a = identifier[a_id_pos].strip()
-        ids.append(a)
-    # Check if provided identifier is in the list of identifiers in database
+    # Check if provided identifier is in the index of identifiers in database
     for item in source_data:
-        if item[b_id_pos].strip() in ids:
+        identifier = item[b_id_pos].strip()
+        if identifier in id_index:
             errors.append('{} {} already appears in the list of {}s. Please '
                           'check the list of {}s.'.format(
-                                  id_type, item[b_id_pos].strip(), id_type,
-                                  id_type))
+                                  id_type, identifier, id_type, id_type))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)
+        process_errors(errors, source)
 
 
 def check_unique_extension(existing, to_check, ex_ec_pos, ex_ad_pos, ch_ec_pos,
@@ -1263,7 +1377,8 @@ def check_unique_extension(existing, to_check, ex_ec_pos, ex_ad_pos, ch_ec_pos,
     Checks that the combination of Enrolment Code and Acceptance Date are not
     contained in the Extension Codes list. If they are already there, this
     indicates that the extension has alerady been added to the Student
-    Database and therefore must be removed.
+    Database and therefore must be removed. Combinations that appear more
+    than once in the data to be checked are also reported.
     
     Args:
         existing (list): The list of pairings currently in the database.
@@ -1282,74 +1397,55 @@ def check_unique_extension(existing, to_check, ex_ec_pos, ex_ad_pos, ch_ec_pos,
         New Expiry Date.        
     """
     errors = []
-    i = 0
+    # Index the existing Enrolment Code - Acceptance Date combinations
+    existing_keys = create_key_index(existing, (ex_ec_pos, ex_ad_pos))
+    seen_keys = set()
     # Check each pair in to_check data
-    while i < len(to_check):
-        # Extract Enrolment Code from to_check
-        tc_ec = to_check[i][ch_ec_pos]
-        # Extract Acceptance Date from to_check
-        tc_ad = to_check[i][ch_ad_pos]
-        # Look for Enrolment Code in existing data
-        j = 0
-        found = False
-        while j < len(existing) and not found:
-            # Extract Enrolment Code from existing
-            ex_ec = existing[j][ex_ec_pos]
-            # Extract Acceptance Date from existing
-            ex_ad = existing[j][ex_ad_pos]
-            if ex_ec == tc_ec:
-                # Enrolment code is found in existing data
-                # Check if Acceptance Dates also match
-                if ex_ad == tc_ad:
-                    # Acceptance Date also matches - duplicate
-                    found = True
-                    errors.append('The combination of Enrolment Code {} and '
-                                  'Acceptance Date {} already exists in the '
-                                  'Student Database. Please correct the data '
-                                  'and try again.'.format(tc_ec, tc_ad))
-            # Combination not found, try the next row in existing data
-            j += 1
-        # Check the next row in the data to be checked
-        i += 1
+    for extension in to_check:
+        key = (extension[ch_ec_pos], extension[ch_ad_pos])
+        if key in existing_keys:
+            # Combination is already in the Extensions table
+            errors.append('The combination of Enrolment Code {} and '
+                          'Acceptance Date {} already exists in the '
+                          'Student Database. Please correct the data '
+                          'and try again.'.format(key[0], key[1]))
+        elif key in seen_keys:
+            # Combination appears more than once in the submitted data
+            errors.append('The combination of Enrolment Code {} and '
+                          'Acceptance Date {} appears more than once in the '
+                          'Extensions data. Please correct the data and try '
+                          'again.'.format(key[0], key[1]))
+        seen_keys.add(key)
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Extensions_Data')
+        process_errors(errors, 'Extensions_Data')
 
 
-def check_valid_course(course_codes, course, a_id_pos, source):
+def check_valid_course(course_index, course, source):
     """Check that course code is a valid course code.
 
     If the supplied code does not appear in the list of valid course codes, an
     error file is saved and the program exits.
 
     Args:
-        course_codes (list): List of valid courses.
+        course_index (frozenset): Valid course codes, as returned by
+        create_id_index().
         course (str): The course to be checked.
-        a_id_pos (int): Position of course code in the list of course codes.
         source (str): Source of data that is being checked.
-        
-    File structure (database_ids):
-        Course Code, Course Name.
     """
     errors = []
-    ids = []
-    # Separate identifiers into a list
-    for identifier in course_codes:
-        a = identifier[a_id_pos].strip()
-        ids.append(a)
-    # print('Contents of ids: ')
-    # ad.debug_list(ids)
-    # Check if provided code is in the list of Course codes
-    if course.strip() not in ids and course.strip() not in (None, ''):
+    # Check if provided code is in the index of Course codes
+    if course.strip() not in course_index and course.strip() not in (None,
+                                                                      ''):
         errors.append('Course code {} not found in the list of Course codes. '
                       'Please check the list of Course codes.'.format(
                               course.strip()))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)
+        process_errors(errors, source)
 
 
-def check_valid_scc(sup_data, scc_data, course, s_sfk_pos, source):
+def check_valid_scc(sup_data, scc_map, course, s_sfk_pos, source):
     """Check that the Student ID and Course ID combination is valid.
     
     Checks that each Student ID and Course ID combination in the
@@ -1358,7 +1454,8 @@ def check_valid_scc(sup_data, scc_data, course, s_sfk_pos, source):
     
     Args:
         sup_data (list): Data that needs to be checked.
-        scc_data (list): Data from the Student Course Codes Data file.
+        scc_map (dict): Course Codes for each Student ID, as returned by
+        create_student_map() for the Student Course Codes Data file.
         course (str): Course Code for course being updated.
         s_sfk_pos (int): Position of the StudentID in the supplied data.
         source (str): File source for data to be checked.
@@ -1373,34 +1470,16 @@ def check_valid_scc(sup_data, scc_data, course, s_sfk_pos, source):
         StudentFK and CourseFK columns from Enrolments Table in Student
         Database.
     """
-    i = 0
     warnings = ['\nStudent Course Codes Warnings:\n']
+    empty = frozenset()
     # Work through each student in sup_data
-    while i < len(sup_data):
-        # Extract a single student
-        student = extract_student_2(sup_data, i)
-        # print(student)
-        j = 0
-        matched = False
-        # Check if Student ID Numbers match
-        while j < len(scc_data) and not matched:
-            # Extract a StudentID - Course Code combination
-            student_codes = extract_student_2(scc_data, j)
-            # Check if Student ID Numbers match
-            if student[s_sfk_pos] == student_codes[0]:
-                # Check if Course Codes also match
-                if course == student_codes[1]:
-                    matched = True
-                    # If do not match, continue looking for Student ID
-                    # Relevant if Student has enrolled in more than one course
-            j += 1
-        # Create error if not matched
-        if not matched:
+    for student in sup_data:
+        # Student may be enrolled in more than one course
+        if course not in scc_map.get(student[s_sfk_pos], empty):
             warnings.append('{} could not be found with the course code {} '
                           'in the list of existing course codes. Please '
                           'check the file and try again.'.format(
                                   student[s_sfk_pos], course))
-        i += 1
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1408,7 +1487,7 @@ def check_valid_scc(sup_data, scc_data, course, s_sfk_pos, source):
         return False, warnings
 
 
-def check_valid_stud(sup_data, ec_data, s_epk_pos, s_sfk_pos, source):
+def check_valid_stud(sup_data, ec_map, s_epk_pos, s_sfk_pos, source):
     """Check that the Student ID and Enrolment Code combination is valid.
     
     Checks that each Student ID and Enrolment Code combination in the
@@ -1417,7 +1496,8 @@ def check_valid_stud(sup_data, ec_data, s_epk_pos, s_sfk_pos, source):
     
     Args:
         sup_data (list): Data that needs to be checked.
-        ec_data (list): Data from the Enrolment Codes Data file.
+        ec_map (dict): Enrolment Codes for each Student ID, as returned by
+        create_student_map() for the Enrolment Codes Data file.
         s_epk_pos (int): Position of the EnrolmentFK in the supplied data.
         s_sfk_pos (int): Position of the StudentID in the supplied data.
         source (str): File source for data to be checked.
@@ -1432,37 +1512,19 @@ def check_valid_stud(sup_data, ec_data, s_epk_pos, s_sfk_pos, source):
     File structure (ec_data):
         EnrolmentPK, StudentFK.
     """
-    i = 0
     errors = []
-    # Work through each student in gd_data
-    while i < len(sup_data):
-        # Extract a single student
-        student = extract_student_2(sup_data, i)
-        # print(student)
-        j = 0
-        matched = False
-        # Check if Student ID Numbers match
-        while j < len(ec_data) and not matched:
-            # Extract an Enrolment Code combination
-            student_codes = extract_student_2(ec_data, j)
-            # Check if Student ID Numbers match
-            if student[s_sfk_pos] == student_codes[1]:
-                # Check if Enrolment Codes also match
-                if student[s_epk_pos] == student_codes[0]:
-                    matched = True
-                    # If do not match, continue looking for Student ID
-                    # Applicable if Student has graduated more than one course
-            j += 1
-        # Create error if not matched
-        if not matched:
+    empty = frozenset()
+    # Work through each student in sup_data
+    for student in sup_data:
+        # Student may have more than one Enrolment Code
+        if student[s_epk_pos] not in ec_map.get(student[s_sfk_pos], empty):
             errors.append('{} could not be found with the enrolment code {} '
                           'in the list of existing enrolment codes. Please '
                           'check the file and try again.'.format(
                                   student[s_sfk_pos], student[s_epk_pos]))
-        i += 1
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)        
+        process_errors(errors, source)        
 
 
 def check_wa(wa_data):
@@ -1494,7 +1556,7 @@ def check_wa(wa_data):
                           '{}'.format(student[1]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Workshop_Attendance_Data')
+        process_errors(errors, 'Workshop_Attendance_Data')
     # Check if any warnings have been identified, return if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1579,7 +1641,7 @@ def check_wd(workshop_data):
                           '{}'.format(workshop[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Workshop Data')
+        process_errors(errors, 'Workshop Data')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1617,7 +1679,7 @@ def check_we(enrolment_data):
                           'correct and try again.'.format(enrolment[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Workshop Enrolment Data')
+        process_errors(errors, 'Workshop Enrolment Data')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -1649,10 +1711,30 @@ def check_wtd(workshop_tutor_data, source):
                                   pairing[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, source)
+        process_errors(errors, source)
     return False, warnings
 
 
+def chunk_rows(rows, chunk_size):
+    """Yield lists of rows of up to chunk_size rows.
+
+    Args:
+        rows (iterable): Rows to be grouped.
+        chunk_size (int): Maximum number of rows in each chunk.
+
+    Yields:
+        chunk (list): The next chunk of rows.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def clean_cc(raw_data):
     """Clean the data in the course codes file.
 
@@ -1687,29 +1769,27 @@ def clean_cd(raw_data):
     File structure (raw_data):
         CoursePK, CourseName, Venue, Mode, Status.
     """
-    cleaned_data = []
-    for course in raw_data:
-        cleaned_course = []
-        cleaned_course.append(course[0].strip())
-        cleaned_course.append(course[1].strip())
-        cleaned_course.append(course[2].strip())
-        cleaned_course.append(course[3].strip())
-        cleaned_course.append(course[4].strip())
-        cleaned_data.append(cleaned_course)
+    cleaned_data = [[item.strip() for item in course[:5]]
+                    for course in raw_data]
     return cleaned_data
 
 
-def clean_cdf(processing_data, course_data):
-    """Clean the data in the combined data form data and convert required
-    items.
+def clean_cdf_frame(processing_data, course_data):
+    """Clean the combined data form data column by column.
+
+    The data is placed into a DataFrame and each cleaning rule is applied to
+    a whole column at once. Rules that depend on the custtools helpers (dates
+    and phone numbers) are applied once for each distinct value in the column
+    and the results mapped back onto the rows.
 
     Args:
         processing_data (list): A list with the data read from the combined
         data form file.
-        course_data (list): A list with the data for each course.
+        course_data (dict): Dictionary of course codes: course names.
 
     Returns:
-        cleaned_data (list): A list with cleaned combined data form data.
+        cleaned_data (list): A CdfRow for each student in the combined data
+        form data.
 
     File structure (processing_data):
         Student ID, Preferred Method of Study, Part-time Class Schedules,
@@ -1729,91 +1809,105 @@ def clean_cdf(processing_data, course_data):
         Employment, Qualification, Year, National Student Number,
         Reason for Study, Please explain:, How did you hear about us?, 
         Please state:, Please tick to confirm...
-
-    File structure (course_data):
-        Course Code, Class Date.
     """
-    cleaned_data = []
+    import numpy as np
+    import pandas as pd
+    if len(processing_data) == 0:
+        return []
+    # Short rows would otherwise be filled with 'nan' and 'None' values
+    errors = []
     for student in processing_data:
-        cleaned_student = []
-        # Process each column as required
-        cleaned_student.append(student[0].strip())
-        # Convert to a course code
-        course = convert_course(student[1].strip(), student[2].strip(),
-                                course_data)
-        cleaned_student.append(course)
-        cleaned_student.append(student[4].strip())
-        cleaned_student.append(student[6].strip())
-        cleaned_student.append(student[9].strip())
-        cleaned_student.append(student[13].strip())
-        # Process Date of Birth so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[14].strip()))
-        cleaned_student.append(student[16].strip())
-        cleaned_student.append(student[18].strip())
-        cleaned_student.append(student[20].strip())
-        # Convert Under age tick to 'Yes' or 'No'
-        cleaned_student.append(clean_u18(student[21]))
-        # Add a leading 0 to Telephone if required and remove spaces
-        clean_tele = clean_telephone(student[22])
-        cleaned_student.append(clean_tele)
-        # If mobile is empty take from telephone else clean up
-        clean_mob = clean_mobile_cdf(student[23], clean_tele)
-        cleaned_student.append(clean_mob)
-        cleaned_student.append(student[24].lower().strip())
-        # Process preferred contact mode and replace Mobile Email with it
-        contact_preference = preferred_contact(student[25].strip(),
-                                               student[26].strip())
-        cleaned_student.append(contact_preference)
-        cleaned_student.append(student[27].strip())
-        # Process Ethnicity and set if Other selected
-        ethnicity = get_ethnicity(student[28].strip(), student[29].strip())
-        cleaned_ethnicity = ad.replace_string(ethnicity, ',', '')
-        cleaned_student.append(cleaned_ethnicity)
-        cleaned_student.append(student[30].strip())
-        iwi = ad.replace_string(student[31].strip(), ',', ' and')
-        cleaned_student.append(iwi)
-        # Process Citizenship and set if Other selected
-        citizen = get_citizenship(student[32].strip(), student[33].strip())
-        cleaned_citizen = ad.replace_string(citizen, ',', '')
-        cleaned_student.append(cleaned_citizen)
-        # Process first language
-        language = get_language(student[34].strip(), student[35].strip())
-        cleaned_language = ad.replace_string(language, ',', '')
-        cleaned_student.append(cleaned_language)
-        add_num = ad.replace_string(student[36].strip(), ',', '')
-        cleaned_student.append(add_num)
-        add_street = ad.replace_string(student[37].strip(), ',', '')
-        cleaned_student.append(add_street)
-        add_suburb = ad.replace_string(student[38].strip(), ',', '')
-        cleaned_student.append(add_suburb)
-        add_city = ad.replace_string(student[39].strip(), ',', '')
-        cleaned_student.append(add_city)
-        # Process post code to make sure it has four digits
-        post_code = get_post_code(student[40].strip(), student[41].strip())
-        cleaned_student.append(post_code)
-        cleaned_student.append(student[41].strip())
-        # Get disability
-        disability = get_disability(student[42].strip(), student[43].strip())
-        cleaned_disability = ad.replace_string(disability, ',', '')
-        cleaned_student.append(cleaned_disability)
-        cleaned_student.append(student[44].strip())
-        qualification = ad.replace_string(student[45].strip(), ',', ' and')
-        cleaned_student.append(qualification)
-        cleaned_student.append(student[46].strip())
-        cleaned_student.append(student[47].strip())
-        # Get reason for study
-        study_reason = get_study_reason(student[48].strip(),
-                                        student[49].strip())
-        cleaned_study_reason = ad.replace_string(study_reason, ',', '')
-        cleaned_student.append(cleaned_study_reason)
-        # Get how heard
-        how_heard = get_how_heard(student[50].strip(), student[51].strip())
-        cleaned_how_heard = ad.replace_string(how_heard, ',', '')
-        cleaned_student.append(cleaned_how_heard)
-        # Process Terms and conditions
-        cleaned_student.append(process_tc(student[52].strip()))
-        cleaned_data.append(cleaned_student)
-    # ad.debug_list(cleaned_data)
+        if len(student) < 53:
+            errors.append('Student {} has {} columns in the Combined Data '
+                          'Form. 53 columns are required.'.format(
+                                  student[0] if student else '',
+                                  len(student)))
+    if len(errors) > 0:
+        process_errors(errors, 'Combined_Data_Form_Columns')
+    raw = pd.DataFrame(data=processing_data).iloc[:, :53].astype(str)
+    col = {i: raw[i].str.strip() for i in range(53)}
+    cleaned = pd.DataFrame(index=raw.index)
+    cleaned[0] = col[0]
+    # Convert to a course code, taking the first code for each course name
+    class_codes = {}
+    for code, session in course_data.items():
+        class_codes.setdefault(session, code)
+    course = col[2].map(class_codes).fillna('')
+    cleaned[1] = course.where(col[1] != 'Online', 'ADV-ON-001')
+    cleaned[2] = col[4]
+    cleaned[3] = col[6]
+    cleaned[4] = col[9]
+    cleaned[5] = col[13]
+    # Process Date of birth so that it is dd/mm/yyyy
+    cleaned[6] = map_unique(col[14], normalise_date)
+    cleaned[7] = col[16]
+    cleaned[8] = col[18]
+    cleaned[9] = col[20]
+    # Convert Under age tick to 'Yes' or 'No'
+    cleaned[10] = np.where(raw[21] != '', 'Yes', 'No')
+    # Add a leading 0 to Telephone if required and remove spaces
+    clean_tele = map_unique(raw[22], clean_telephone)
+    cleaned[11] = clean_tele
+    # If mobile is empty take from telephone else clean up
+    clean_mob = map_unique(raw[23], clean_telephone)
+    tele_mob = map_unique(clean_tele, clean_telephone)
+    cleaned[12] = clean_mob.where(raw[23] != '', tele_mob)
+    cleaned[13] = raw[24].str.lower().str.strip()
+    # Process preferred contact mode
+    mobile_pref = col[25] == 'Mobile'
+    email_pref = col[26] == 'Email'
+    cleaned[14] = np.select([mobile_pref & email_pref, mobile_pref,
+                             email_pref], ['Email or Mobile', 'Mobile',
+                                           'Email'], '')
+    cleaned[15] = col[27]
+    # Process Ethnicity and set if Other selected
+    cleaned[16] = other_column(col[28], col[29]).str.replace(',', '',
+                                                            regex=False)
+    cleaned[17] = col[30]
+    cleaned[18] = col[31].str.replace(',', ' and', regex=False)
+    # Process Citizenship and set if Other selected
+    cleaned[19] = other_column(col[32], col[33]).str.replace(',', '',
+                                                            regex=False)
+    # Process first language
+    language = np.select([col[34].str.lower() == 'yes',
+                          col[34].str.lower() == 'no'],
+                         ['English', col[35]], '')
+    cleaned[20] = pd.Series(language, index=raw.index).str.replace(
+            ',', '', regex=False)
+    for i, pos in enumerate(range(36, 40)):
+        cleaned[21 + i] = col[pos].str.replace(',', '', regex=False)
+    # Process post code to make sure it has four digits
+    short_code = (col[41] == 'New Zealand') & (col[40].str.len() == 3)
+    cleaned[25] = col[40].where(~short_code, '0' + col[40])
+    cleaned[26] = col[41]
+    # Get disability, using get_disability() for any other responses
+    disability_response = col[42].str.lower()
+    disability = np.select([disability_response == 'no',
+                            (disability_response == 'yes') &
+                            (col[43] != ''),
+                            disability_response == 'yes'],
+                           ['No', col[43], 'Yes - no details provided'],
+                           None)
+    disability = pd.Series(disability, index=raw.index, dtype=object)
+    other = disability.isna()
+    if other.any():
+        disability[other] = [get_disability(response, explain) for
+                             response, explain in zip(col[42][other],
+                                                      col[43][other])]
+    cleaned[27] = disability.astype(str).str.replace(',', '', regex=False)
+    cleaned[28] = col[44]
+    cleaned[29] = col[45].str.replace(',', ' and', regex=False)
+    cleaned[30] = col[46]
+    cleaned[31] = col[47]
+    # Get reason for study and how heard
+    cleaned[32] = other_column(col[48], col[49], 'Other - not specified'
+                               ).str.replace(',', '', regex=False)
+    cleaned[33] = other_column(col[50], col[51], 'Other - not specified'
+                               ).str.replace(',', '', regex=False)
+    # Process Terms and conditions
+    cleaned[34] = np.where(col[52] != '', 'Yes', 'No')
+    cleaned_data = list(map(CdfRow._make,
+                            cleaned.astype(object).values.tolist()))
     return cleaned_data
 
 
@@ -1864,15 +1958,21 @@ def clean_ec(raw_data):
     return cleaned_data
 
 
-def clean_es(processing_data):
-    """Clean the data in the enrolment sheet file data.
+def clean_es_frame(processing_data):
+    """Clean the data in the enrolment sheet file data column by column.
+
+    Every column is stripped, the mobile number is cleaned, email and
+    username are made lower case, dates are converted to dd/mm/yyyy and
+    statuses that are not allowed are left empty. Each date is cleaned once,
+    however many times it appears in the four date columns.
 
     Args:
         processing_data (list): A list with the data from the Enrolment Sheet
         file.
 
     Returns:
-        cleaned_data (list): A list with cleaned enrolment sheet file data.
+        cleaned_data (list): An EsRow for each student in the enrolment sheet
+        file data.
 
     File structure (es_data):
         Student ID, First Name, Last Name, Preferred Name,
@@ -1880,39 +1980,27 @@ def clean_es(processing_data):
         Start Date, End Date, Tutor, Tutor contact, Username, Status, Tag,
         Enrolment Code, National Student Number.
     """
-    cleaned_data = []
-    for student in processing_data:
-        cleaned_student = []
-        # Process each column
-        # Student ID Number, name columns
-        cleaned_student.append(student[0].strip())
-        cleaned_student.append(student[1].strip())
-        cleaned_student.append(student[2].strip())
-        cleaned_student.append(student[3].strip())
-        # Clean the mobile number
-        cleaned_student.append(clean_mobile(student[4].strip()))
-        # Email, Contact Mode and Course Codes
-        cleaned_student.append(student[5].lower().strip())
-        cleaned_student.append(student[6].strip())
-        cleaned_student.append(student[7].strip())
-        # Process Date of enrolment so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[8].strip()))
-        # Process Start Date so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[9].strip()))
-        # Process End Date so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[10].strip()))
-        cleaned_student.append(student[11].strip())
-        # Process Tutor Contact Date so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[12].strip()))
-        cleaned_student.append(student[13].lower().strip())
-        # Process status
-        cleaned_student.append(get_status(student[14].strip()))
-        # Add tag
-        cleaned_student.append(student[15].strip())
-        cleaned_student.append(student[16].strip())
-        cleaned_student.append(student[17].strip())
-        cleaned_data.append(cleaned_student)
-    # ad.debug_list(cleaned_data)
+    import pandas as pd
+    if len(processing_data) == 0:
+        return []
+    raw = pd.DataFrame(data=processing_data).iloc[:, :18].astype(str)
+    cleaned = pd.DataFrame({i: raw[i].str.strip() for i in range(18)})
+    # Clean the mobile number
+    cleaned[4] = map_unique(cleaned[4], clean_mobile)
+    # Email and username are lower case
+    cleaned[5] = raw[5].str.lower().str.strip()
+    cleaned[13] = raw[13].str.lower().str.strip()
+    # Process the date columns so that they are dd/mm/yyyy
+    date_columns = [8, 9, 10, 12]
+    dates = pd.unique(cleaned[date_columns].values.ravel())
+    clean_dates = {date: normalise_date(date) for date in dates}
+    for i in date_columns:
+        cleaned[i] = cleaned[i].map(clean_dates)
+    # Process status
+    allowed = ('',) + ENROLMENT_STATUSES
+    cleaned[14] = cleaned[14].where(cleaned[14].isin(allowed), '')
+    cleaned_data = list(map(EsRow._make,
+                            cleaned.astype(object).values.tolist()))
     return cleaned_data
 
 
@@ -1933,11 +2021,33 @@ def clean_exc(exc_data):
         cleaned_student = []
         # Process each column
         cleaned_student.append(code[0].strip())
-        cleaned_student.append(da.clean_date(code[1].strip()))
+        cleaned_student.append(normalise_date(code[1].strip()))
         cleaned_data.append(cleaned_student)
     return cleaned_data
 
 
+def clean_expiry(exp_data):
+    """Clean the data in the Expiry Dates file data.
+
+    Args:
+        exp_data (list): A list with the data from the Expiry Dates file.
+
+    Returns:
+        cleaned_data (list): An ExpiryRow for each enrolment in the Expiry
+        Dates file data.
+
+    File structure (exp_data):
+        EnrolmentFK, CourseFK, ExpiryDate, Status.
+    """
+    cleaned_data = []
+    for student in exp_data:
+        # Process Expiry Date so that it is dd/mm/yyyy
+        cleaned_data.append(ExpiryRow(student[0].strip(), student[1].strip(),
+                                      normalise_date(student[2].strip()),
+                                      student[3].strip()))
+    return cleaned_data
+
+
 def clean_ext(raw_data):
     """Clean the data in the Extensions Table file data.
     
@@ -1951,19 +2061,13 @@ def clean_ext(raw_data):
         Student ID Number, Name, Enrolment Code, Extension Length,
         Acceptance Date, New Expiry Date.
     """
-    cleaned_data = []
-    for student in raw_data:
-        cleaned_student = []
-        # Process each column
-        # Student ID Number, Enrolment Code, Extension Length
-        cleaned_student.append(student[0].strip())
-        cleaned_student.append(student[2].strip())
-        cleaned_student.append(student[3].strip())
-        # Acceptance Date, New Expiry Date
-        cleaned_student.append(da.clean_date(student[4].strip()))
-        cleaned_student.append(da.clean_date(student[5].strip()))
-        cleaned_data.append(cleaned_student)
-    return cleaned_data            
+    # Student ID Number, Enrolment Code, Extension Length, Acceptance Date,
+    # New Expiry Date (dates are dd/mm/yyyy)
+    cleaned_data = [[student[0].strip(), student[2].strip(),
+                     student[3].strip(), normalise_date(student[4].strip()),
+                     normalise_date(student[5].strip())]
+                    for student in raw_data]
+    return cleaned_data
 
 
 def clean_gc(raw_data):
@@ -2002,46 +2106,12 @@ def clean_gd(raw_data):
         Student ID Number, Name, Enrolment Code, Graduation Date,
         Certificate Number.
     """
-    cleaned_data = []
-    for student in raw_data:
-        cleaned_student = []
-        # Process each column
-        # Student ID Number, Enrolment Code
-        cleaned_student.append(student[0].strip())
-        cleaned_student.append(student[2].strip())
-        # Graduation Date
-        cleaned_student.append(da.clean_date(student[3].strip()))
-        # Certificate Number
-        cleaned_student.append(student[4].strip())
-        cleaned_data.append(cleaned_student)
-    return cleaned_data    
-
-
-def clean_mobile_cdf(student_mobile, student_telephone):
-    """Check and correct for leading 0 in mobile number.
-
-    Checks if the mobile number is missing a leading 0 and adds it if it is.
-    If there is no mobile number, returns the telephone number if one is
-    present.
-
-    Args:
-        student_mobile (str): Input moblie number as a string.
-        student_telephone (str): Input telephone number as a string.
-
-    Returns:
-        clean_mob (str): Cleaned mobile or phone number with a leading '0'.
-    """
-    if student_mobile not in (None, '') and not ad.check_lead_zero(
-            student_mobile):
-        mob = '0{}'.format(student_mobile[:])
-        clean_mob = mob.strip().replace(' ', '')
-    elif student_mobile not in (None, ''):
-        clean_mob = student_mobile.strip().replace(' ', '')
-    elif student_mobile in (None, '') and student_telephone not in (None, ''):
-        clean_mob = clean_telephone(student_telephone)
-    else:
-        clean_mob = student_mobile
-    return clean_mob
+    # Student ID Number, Enrolment Code, Graduation Date (dd/mm/yyyy),
+    # Certificate Number
+    cleaned_data = [[student[0].strip(), student[2].strip(),
+                     normalise_date(student[3].strip()), student[4].strip()]
+                    for student in raw_data]
+    return cleaned_data
 
 
 def clean_mobile(mobile):
@@ -2072,7 +2142,8 @@ def clean_os(os_data):
         os_data (list): A list with the data from the Old Students file.
 
     Returns:
-        cleaned_data (list): A list with cleaned Old Students file data.
+        cleaned_data (list): An OsRow for each student in the Old Students
+        file data.
 
     File structure (os_data):
         StudentPK, NameGiven, NameSurname, NamePreferred, DateOfBirth,
@@ -2086,61 +2157,30 @@ def clean_os(os_data):
     """
     cleaned_data = []
     for student in os_data:
-        cleaned_student = []
-        # Process each column
-        # Student ID Number, name columns
-        cleaned_student.append(student[0].strip())
-        cleaned_student.append(student[1].strip())
-        cleaned_student.append(student[2].strip())
-        cleaned_student.append(student[3].strip())
-        # Process Date of Birth so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[4].strip()))
-        # Username
-        cleaned_student.append(student[5].strip())
-        # Blank for telephone
-        cleaned_student.append('')
-        # Mobile number
-        cleaned_student.append(clean_mobile(student[7].strip()))
-        # Email, Preferred Contact Mode
-        cleaned_student.append(student[8].strip())
-        cleaned_student.append(student[9].strip())
-        cleaned_data.append(cleaned_student)
-        # Address details
-        cleaned_student.append(student[10].strip())
-        cleaned_student.append(student[11].strip())
-        cleaned_student.append(student[12].strip())
-        cleaned_student.append(student[13].strip())
-        # Clean Post Code
-        post_code = get_post_code(student[14].strip(), student[15].strip())
-        cleaned_student.append(post_code)
-        cleaned_student.append(student[15].strip())
-        # Blanks for Nationality, Iwi, Citizenship, GuardianNameGiven.
-        # GuardianNameSurname, GuardianId, Under18Auth
-        cleaned_student.append('')
-        cleaned_student.append('')
-        cleaned_student.append('')
-        cleaned_student.append('')
-        cleaned_student.append('')
-        cleaned_student.append('')
-        cleaned_student.append('')
-        # How heard
-        cleaned_student.append(student[23].strip())
-        # Agree T & C
-        cleaned_student.append('Yes')
-        # Process Enrolment Date so that it is dd/mm/yyyy
-        cleaned_student.append(da.clean_date(student[25].strip()))
-        # Gender
-        cleaned_student.append(student[26].strip())
-        cleaned_student.append(student[27].strip())
-        cleaned_student.append(student[28].strip())
-        cleaned_student.append(student[29].strip())
-        cleaned_student.append(student[30].strip())
-        cleaned_student.append(student[31].strip())
-        cleaned_student.append(student[32].strip())
-        cleaned_student.append(student[33].strip())
-        cleaned_student.append(student[34].strip())
+        student = [item.strip() for item in student[:35]]
+        cleaned_data.append(OsRow(
+                # Student ID Number, name columns
+                *student[:4],
+                # Process Date of Birth so that it is dd/mm/yyyy
+                normalise_date(student[4]),
+                # Username, blank for Telephone, Mobile number
+                student[5], '', clean_mobile(student[7]),
+                # Email, Preferred Contact Mode, Address details
+                *student[8:14], get_post_code(student[14], student[15]),
+                student[15],
+                # Blanks for Nationality, Iwi, Citizenship, GuardianNameGiven,
+                # GuardianNameSurname, GuardianId and Under18Auth
+                '', '', '', '', '', '', '',
+                # How heard, Agree T & C
+                student[23], 'Yes',
+                # Process Enrolment Date so that it is dd/mm/yyyy
+                normalise_date(student[25]),
+                # Gender, Ethnicity, CountryOfBirth, Language, Disability,
+                # PreviousEducation, PreviousEdYear, Employment,
+                # ReasonForStudy
+                *student[26:35]))
     return cleaned_data
-    
+
 
 def clean_pt_dates(raw_data):
     """Clean the data in the Course Attendance Dates file data.
@@ -2157,7 +2197,7 @@ def clean_pt_dates(raw_data):
     cleaned_dates = []
     i = 0
     while i < len(raw_data[0]):
-        clean_date = da.clean_date(raw_data[0][i])
+        clean_date = normalise_date(raw_data[0][i])
         cleaned_dates.append(clean_date)
         i += 1
     return cleaned_dates
@@ -2217,16 +2257,10 @@ def clean_td(processing_data):
     File structure (processing_data):
         TutorID, First Name, Last Name, Email, Phone.
     """
-    cleaned_data = []
-    for tutor in processing_data:
-        cleaned_tutor = []
-        # Process each column
-        cleaned_tutor.append(tutor[0].strip())
-        cleaned_tutor.append(tutor[1].strip())
-        cleaned_tutor.append(tutor[2].strip())
-        cleaned_tutor.append(tutor[3].strip())
-        cleaned_tutor.append(clean_mobile(tutor[4]))
-        cleaned_data.append(cleaned_tutor)
+    # Process each column
+    cleaned_data = [[tutor[0].strip(), tutor[1].strip(), tutor[2].strip(),
+                     tutor[3].strip(), clean_mobile(tutor[4])]
+                    for tutor in processing_data]
     return cleaned_data
 
 
@@ -2254,23 +2288,6 @@ def clean_tu(processing_data):
     return cleaned_data
 
 
-def clean_u18(repsonse):
-    """Return value for confirmation of under 18.
-
-    Args:
-        response (str): String for Under 18 column in cdf file data.
-
-    Returns:
-        under (str): String indicating if data for confirmation of under 18 is
-        'Yes' or 'No'.
-    """
-    if repsonse not in (None, ''):
-        under = 'Yes'
-    else:
-        under = 'No'
-    return under
-
-
 def clean_wa(raw_data):
     """Clean the data in the Workshop Attedance file data.
 
@@ -2283,16 +2300,9 @@ def clean_wa(raw_data):
     File structure (raw_data):
         Workshop Code, Student ID, First Name, Last Name.
     """
-    cleaned_data = []
-    for student in raw_data:
-        cleaned_workshop = []
-        # Add '' for AttendancePK
-        cleaned_workshop.append('')
-        # Add Student ID
-        cleaned_workshop.append(student[1].strip())
-        # Add Workshop ID
-        cleaned_workshop.append(student[0].strip())
-        cleaned_data.append(cleaned_workshop)
+    # AttendancePK is left empty, then Student ID and Workshop ID
+    cleaned_data = [['', student[1].strip(), student[0].strip()]
+                    for student in raw_data]
     return cleaned_data
 
 
@@ -2331,18 +2341,11 @@ def clean_wd(raw_data, ):
         Workshop Code, Workshop Name, Location, Venue, Date, Cost, Status,
         Type.
     """
-    
     cleaned_data = []
     for workshop in raw_data:
-        cleaned_workshop = []
-        cleaned_workshop.append(workshop[0].strip())
-        cleaned_workshop.append(workshop[1].strip())
-        cleaned_workshop.append(workshop[2].strip())
-        cleaned_workshop.append(workshop[3].strip())
-        cleaned_workshop.append(da.clean_date(workshop[4].strip()))
-        cleaned_workshop.append(workshop[5].strip())
-        cleaned_workshop.append(workshop[6].strip())
-        cleaned_workshop.append(workshop[7].strip())
+        cleaned_workshop = [item.strip() for item in workshop[:8]]
+        # Process Workshop Date so that it is dd/mm/yyyy
+        cleaned_workshop[4] = normalise_date(cleaned_workshop[4])
         cleaned_data.append(cleaned_workshop)
     return cleaned_data
 
@@ -2372,7 +2375,40 @@ def clean_we(processing_data):
     return cleaned_data
 
 
-def compare_cdf_es(cdf, es):
+@contextlib.contextmanager
+def collect_errors(source):
+    """Collect the errors from every check into one error log.
+
+    While active, process_errors() keeps the errors found by each check
+    instead of processing the error log and exiting, so that every check is
+    run. The combined errors are processed before an upload file is saved
+    (see process_collected_errors()) or when the block ends. If a later step
+    fails because of data that already has errors, the failure is added to
+    the error log.
+
+    Args:
+        source (str): Name used for the combined error log.
+
+    Yields:
+        collected (list): The source and errors for each check that found
+        errors.
+    """
+    collected = []
+    error_collection.append((source, collected))
+    try:
+        yield collected
+    except Exception as error:
+        if not collected:
+            raise
+        collected.append(('Processing', ['Processing stopped: {}'.format(
+                error)]))
+    finally:
+        error_collection.pop()
+    if collected:
+        save_error_log(get_combined_errors(collected), source)
+
+
+def compare_cdf_es(cdf, es, joined):
     """Check that data is consistent between the cdf and es files.
 
     Checks that data such as names and contact details are consistent in the
@@ -2380,8 +2416,10 @@ def compare_cdf_es(cdf, es):
     (non-fatal) and errors (fatal).
 
     Args:
-        cdf (list): Combined Data Form data in a list.
-        es (list): Enrolment Sheet data in a list.
+        cdf (list): Cleaned Combined Data Form data (CdfRow).
+        es (list): Cleaned Enrolment Sheet data (EsRow).
+        joined (tuple): Matched and unmatched rows, as returned by
+        join_cdf_es().
 
     Returns:
         True if warnings list has had items appended to it, False otherwise.
@@ -2418,47 +2456,39 @@ def compare_cdf_es(cdf, es):
         errors.append('The two files are of different length! Check which '
                       'students are missing. Also check that each student has '
                       'a Student ID Number.')
-        ft.process_error_log(errors, 'Sheets_Comparison')
-    i = 0
-    while i < len(cdf):
-        j = 0
-        found = False
-        while not found and j < len(es):
-            student = cdf[i][0]
-            if student == es[j][0]:
-                found = True
-                if cdf[i][2] != es[j][1]:
-                    errors.append('First names are not consistent for '
-                                  'Student: {}'.format(student))
-                if cdf[i][3] != es[j][2]:
-                    errors.append('Last names are not consistent for '
-                                  'Student: {}'.format(student))
-                if cdf[i][4] != es[j][3]:
-                    warnings.append('Preferred names are not consistent for '
-                                    'Student: {}'.format(student))
-                if cdf[i][12] != es[j][4]:
-                    warnings.append('Mobile numbers are not consistent for '
-                                    'Student: {}'.format(student))
-                if cdf[i][13] != es[j][5]:
-                    errors.append('Email addresses are not consistent for '
-                                  'Student: {}'.format(student))
-                if cdf[i][14] != es[j][6]:
-                    warnings.append('Preferred contact modes are not '
-                                    'consistent for Student: {}'.format(
-                                            student))
-                if cdf[i][1] != es[j][7]:
-                    warnings.append('Course codes are not consistent for '
-                                    'Student: {}'.format(student))
-                # print('Contact Mode c ' + student + ' ' + cdf[i][14])
-                # print('Contact Mode e ' + student + ' ' + es[j][7])
-            else:
-                j += 1
-        if not found:
-            errors.append('Student {} does not appear in the Enrolment form. '
-                          'Please check!'.format(student))
-        i += 1
+        process_errors(errors, 'Sheets_Comparison')
+    matched, cdf_only, es_only = joined
+    for cdf_student, es_student in matched:
+        student = cdf_student.student_id
+        if cdf_student.first_name != es_student.first_name:
+            errors.append('First names are not consistent for '
+                          'Student: {}'.format(student))
+        if cdf_student.last_name != es_student.last_name:
+            errors.append('Last names are not consistent for '
+                          'Student: {}'.format(student))
+        if cdf_student.preferred_name != es_student.preferred_name:
+            warnings.append('Preferred names are not consistent for '
+                            'Student: {}'.format(student))
+        if cdf_student.mobile != es_student.mobile:
+            warnings.append('Mobile numbers are not consistent for '
+                            'Student: {}'.format(student))
+        if cdf_student.email != es_student.email:
+            errors.append('Email addresses are not consistent for '
+                          'Student: {}'.format(student))
+        if cdf_student.contact_mode != es_student.contact_mode:
+            warnings.append('Preferred contact modes are not '
+                            'consistent for Student: {}'.format(student))
+        if cdf_student.course != es_student.course:
+            warnings.append('Course codes are not consistent for '
+                            'Student: {}'.format(student))
+    for cdf_student in cdf_only:
+        errors.append('Student {} does not appear in the Enrolment form. '
+                      'Please check!'.format(cdf_student.student_id))
+    for es_student in es_only:
+        errors.append('Student {} does not appear in the Combined Data Form. '
+                      'Please check!'.format(es_student.student_id))
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Sheets_Comparison')
+        process_errors(errors, 'Sheets_Comparison')
     # Check if any warnings have been identified, save error log if they have
     if len(warnings) > 1:
         return True, warnings
@@ -2466,33 +2496,6 @@ def compare_cdf_es(cdf, es):
         return False, warnings
 
 
-def convert_course(mode, p_class, course_codes):
-    """Convert study mode to a course code.
-
-    If the study mode is 'Online' then 'ADV-ON-001' is the course code.
-    Converts a part-time class to its course code.
-
-    Args:
-        mode (str): The study mode ('Online' or 'Part-time').
-        p_class (str): The class name from the enrolment form.
-        course_codes (dict): Dictionary of course codes: course names.
-
-    Returns:
-        course_code (str): If mode is 'Online' returns online course code.
-        code (str): If mode is part-time returns the course code.
-        (str): Empty string returned if course cannot be found.
-    """
-    if mode == 'Online':
-        course_code = 'ADV-ON-001'
-        return course_code
-    elif p_class.strip() in course_codes.values():
-        for code, session in course_codes.items():
-            if session == p_class.strip():
-                return code
-    else:
-        return ''
-
-
 def create_codes(received_codes):
     """Create a dictionary with the course codes.
 
@@ -2514,29 +2517,176 @@ def create_codes(received_codes):
     return processed_codes
 
 
-def drop_existing(expiry_data, current_students):
-    """Remove students already in the Results table.
-    
+def create_id_index(database_ids, a_id_pos):
+    """Return an index of the identifiers held in a reference file.
+
+    Builds the index once so that membership checks against it take constant
+    time, rather than scanning a list of identifiers for every row checked.
+
     Args:
-        expiry_data (list): List of lists of expiry date data.
-        current_students (list): List of students currently in Results table.
-        
+        database_ids (list): List of identifiers present in the database.
+        a_id_pos (int): Position of identifier in the list of ids in database.
+
     Returns:
-        updated_expiry_data (list): List of data to be kept.
+        id_index (frozenset): Stripped identifiers from database_ids.
+
+    File structure (database_ids):
+        Course Code, Course Name.
     """
-    updated_expiry_data = []
-    for student in expiry_data:
-        if student[0] not in current_students:
-            updated_expiry_data.append(student)
-    return updated_expiry_data
+    return frozenset(identifier[a_id_pos].strip() for identifier in
+                     database_ids)
 
 
-def drop_status(expiry_data):
-    """Remove students without status of Graduated, Expired or Withdrawn.
-    
+def create_key_index(source_data, key_pos):
+    """Return an index of the composite keys held in a data file.
+
+    Builds a tuple key from the values at each position in key_pos for every
+    row, so that combinations (e.g. Enrolment Code and Acceptance Date) can be
+    looked up in constant time.
+
     Args:
-        expiry_data (list): List of lists of expiry date data.
-        
+        source_data (list): List of data to be indexed.
+        key_pos (tuple): Positions of the values that make up the key.
+
+    Returns:
+        key_index (frozenset): Tuple keys from source_data.
+    """
+    return frozenset(tuple(row[pos] for pos in key_pos) for row in
+                     source_data)
+
+
+def create_student_map(source_data, student_pos, value_pos):
+    """Return a dictionary of the values held for each Student ID.
+
+    Groups the values (e.g. Enrolment Codes or Course Codes) against each
+    Student ID so that a Student ID - value combination can be checked without
+    scanning the whole file.
+
+    Args:
+        source_data (list): List of data to be mapped.
+        student_pos (int): Position of the Student ID in source_data.
+        value_pos (int): Position of the value in source_data.
+
+    Returns:
+        student_map (dict): Set of values for each Student ID.
+
+    File structure (Enrolment Codes file):
+        EnrolmentPK, StudentFK.
+
+    File structure (Student Course Codes file):
+        StudentFK, CourseFK.
+    """
+    student_map = {}
+    for row in source_data:
+        student_map.setdefault(row[student_pos], set()).add(row[value_pos])
+    return student_map
+
+
+def create_tutor_index(cleaned_tu):
+    """Return a dictionary of Tutor IDs keyed on tutor name.
+
+    The name keys are normalised with normalise_name() so that differences in
+    case and spacing do not prevent a match. If two tutors share a name, the
+    first tutor in the list is used.
+
+    Args:
+        cleaned_tu (list): List of tutors.
+
+    Returns:
+        tutor_index (dict): Tutor ID for each normalised tutor name.
+
+    File Structure (cleaned_tu):
+        TutorID, FirstName, LastName.
+    """
+    tutor_index = {}
+    for tutor in cleaned_tu:
+        name = normalise_name('{} {}'.format(tutor[1], tutor[2]))
+        tutor_index.setdefault(name, tutor[0])
+    return tutor_index
+
+
+def date_cache_stats(since=None):
+    """Return the hit-rate statistics for the date parse cache.
+
+    The statistics are shown in the stage profile, see save_profile().
+
+    Args:
+        since (dict): (Optional) Statistics returned by an earlier call. If
+        provided, only the hits and misses since then are counted.
+
+    Returns:
+        stats (dict): Number of hits, misses and cached dates, the maximum
+        cache size and the hit rate (0 to 1) for parse_date().
+    """
+    info = parse_date.cache_info()
+    hits = info.hits
+    misses = info.misses
+    if since is not None:
+        hits -= since['hits']
+        misses -= since['misses']
+    lookups = hits + misses
+    stats = {'hits': hits, 'misses': misses,
+             'size': info.currsize, 'max_size': info.maxsize,
+             'hit_rate': hits / lookups if lookups else 0.0}
+    return stats
+
+
+def date_is_valid(raw_date):
+    """Return True if raw_date is a valid date.
+
+    Cached replacement for da.validate_date(). See parse_date().
+
+    Args:
+        raw_date (str): Date to be checked.
+
+    Returns:
+        True if the date is valid, False otherwise.
+    """
+    return parse_date(raw_date)[0]
+
+
+def discard_warnings(check):
+    """Return a check function that does not return any warnings.
+
+    The check is still run, so errors are processed as usual. Used for the
+    sources whose warnings are not added to the warnings log.
+
+    Args:
+        check (function): Check function for a source.
+
+    Returns:
+        (function): Check function that returns False and no warnings.
+    """
+    def check_errors(data):
+        check(data)
+        return False, []
+
+    return check_errors
+
+
+def drop_existing(expiry_data, current_students):
+    """Remove students already in the Results table.
+    
+    Args:
+        expiry_data (list): Cleaned expiry date data (ExpiryRow).
+        current_students (list): List of students currently in Results table.
+        
+    Returns:
+        updated_expiry_data (list): List of data to be kept.
+    """
+    updated_expiry_data = []
+    for student in expiry_data:
+        if student.enrolment_id not in current_students:
+            updated_expiry_data.append(student)
+    return updated_expiry_data
+
+
+def drop_status(expiry_data):
+    """Remove students without status of Graduated, Expired or Withdrawn.
+    
+    Args:
+        expiry_data (list): Cleaned expiry date data (ExpiryRow).
+        
     Returns:
         updated_expiry_data (list): List of data to be kept.
     """
@@ -2544,7 +2694,7 @@ def drop_status(expiry_data):
     # List of statuses to keep in data
     allowed_status = ['Graduated', 'Expired', 'Withdrawn']
     for student in expiry_data:
-        if student[3] in allowed_status:
+        if student.status in allowed_status:
             updated_expiry_data.append(student)
     return updated_expiry_data    
 
@@ -2569,19 +2719,6 @@ def extract_source_tutor(source_data, source_pos):
     return source_tutor
 
 
-def extract_student_2(student_data, student_pos):
-    """Extract a single student.
-
-    Args:
-        student_data (list): List containing student data.
-        student_pos (int): Location of the student to be extracted.
-
-    Returns:
-        student (list): A single student in a list.
-    """
-    return student_data[student_pos]
-
-
 def extract_workshop(workshop_data, workshop_pos):
     """Extract a single workshop.
 
@@ -2619,6 +2756,74 @@ def extract_workshop_tutor(workshop_tutor_data, workshop_tutor_pos):
     return workshop_tutor
 
 
+def filter_delta(rows, ledger, fingerprints, source):
+    """Return the rows that are not in the ledger of a previous run.
+
+    Rows whose fingerprint (see get_row_fingerprint()) is in the ledger have
+    already been processed and are skipped.
+
+    Args:
+        rows (list): Rows read from the source file.
+        ledger (set): Fingerprints of the rows processed by previous runs,
+        from load_ledger().
+        fingerprints (list): Updated with the fingerprint of each kept row.
+        source (str): Name of the source, for the skipped rows message.
+
+    Returns:
+        kept_rows (list): Rows that are new or have changed.
+    """
+    kept_rows = []
+    for row in rows:
+        fingerprint = get_row_fingerprint(row)
+        if fingerprint not in ledger:
+            kept_rows.append(row)
+            fingerprints.append(fingerprint)
+    skipped = len(rows) - len(kept_rows)
+    if skipped > 0:
+        print('Skipped {} unchanged rows in {}.'.format(skipped, source))
+    return kept_rows
+
+
+def filter_student_ids(rows, student_ids, source):
+    """Return the rows for the passed students.
+
+    Args:
+        rows (list): Rows read from the source file, with the Student ID in
+        the first column.
+        student_ids (set): Student ID Numbers of the rows to be kept.
+        source (str): Name of the source, for the skipped rows message.
+
+    Returns:
+        kept_rows (list): Rows for the passed students.
+    """
+    kept_rows = [row for row in rows if row[0].strip() in student_ids]
+    skipped = len(rows) - len(kept_rows)
+    if skipped > 0:
+        print('Skipped {} rows in {} for unchanged students.'.format(
+                skipped, source))
+    return kept_rows
+
+
+def filter_results(results_df, results_headings, include_students):
+    """Return the Results Table columns for the students to be added.
+
+    Selects the rows and columns in one step. The Enrolment IDs are matched
+    with a hashed isin() against a set rather than checking each row against
+    the students list.
+
+    Args:
+        results_df (dataframe): Master Results data.
+        results_headings (list): Columns to be kept for the Results Table.
+        include_students (list): Enrolment IDs of the students to be added.
+
+    Returns:
+        filtered_df (dataframe): The selected rows and columns.
+    """
+    include = results_df['EnrolmentID'].isin(set(include_students))
+    filtered_df = results_df.loc[include, results_headings]
+    return filtered_df
+
+
 def get_assess_date(raw_date):
     """Return assessment date in the format DD/MM/YYYY.
     
@@ -2702,32 +2907,44 @@ def get_attendance_upload(attendance, dates, course):
     return save_data, headings
 
 
-def get_citizenship(cit_col, oth_col):
-    """Return citizenship value.
-
-    If the citizenship value is 'other' then the value of the 'other' column is
-    returned for the citizenship value.
+def get_combined_errors(collected):
+    """Return the collected errors as one list.
 
     Args:
-        cit_col (str): Value in the citizenship column.
-        oth_col (str): Value in the other column for citizenship.
+        collected (list): The source and errors for each check, as collected
+        by collect_errors().
 
     Returns:
-        citizenship (str): Value of citizenship.
+        errors (list): The errors for each check under a heading.
     """
-    if cit_col not in (None, '') and cit_col.strip().lower() != 'other':
-        citizenship = cit_col.strip()
-    elif cit_col not in (None, '') and cit_col.strip().lower() == 'other':
-        citizenship = oth_col.strip()
-    else:
-        citizenship = cit_col.strip()
-    return citizenship
+    errors = []
+    for source, source_errors in collected:
+        errors.append('\n{} Errors:\n'.format(source))
+        errors.extend(source_errors)
+    return errors
+
+
+def get_course_code(course_code=''):
+    """Gets a course code from the user.
 
+    Args:
+        course_code (str): (Optional) Course code that has already been
+        provided. It is checked against the list of valid courses and, if it
+        is not valid, an error log is processed and the program exits. If not
+        provided, user will be prompted for it.
 
-def get_course_code():
-    """Gets a course code from the user."""
+    Returns:
+        code (str): A valid course code.
+    """
     # Load list of allowed course codes
     valid_codes = ft.load_headings('Course_codes', 'e')
+    if course_code not in (None, ''):
+        if course_code not in valid_codes:
+            process_errors(['{} is not a valid code. The course must be '
+                            'present in the list of valid courses '
+                            '(Course_codes.txt).'.format(course_code)],
+                           'Course_Code')
+        return course_code
     # Get selection and make sure it is a valid course
     while True:
         code = input('\nWhat is the code for the course? Alternatively, type q'
@@ -2756,19 +2973,8 @@ def get_course_data(cd):
     File structure (cd):
         CoursePK, CourseName, Venue, Mode, Status.
     """
-    course_upload_data = []
-    for course in cd:
-        extracted_course = []
-        # Add Course Code
-        extracted_course.append(course[0])
-        # Add Course Name
-        extracted_course.append(course[1])
-        # Add Course Venue
-        extracted_course.append(course[2])
-        # Add Course Mode
-        extracted_course.append(course[3])
-        extracted_course.append(course[4])
-        course_upload_data.append(extracted_course)
+    # Course Code, Name, Venue, Mode and Status
+    course_upload_data = [course[:5] for course in cd]
     headings = 'CoursePK,CourseName,Venue,Mode,Status'
     return course_upload_data, headings
 
@@ -2828,7 +3034,7 @@ def get_enrolment_data(es):
     """Prepare data for Enrolments table upload file.
 
     Args:
-        es (list): Source data to be processed.
+        es (list): Cleaned Enrolment Sheet data (EsRow).
 
     Returns:
         enrol_upload_data (list): The data to be saved to file.
@@ -2840,25 +3046,10 @@ def get_enrolment_data(es):
         Start Date, End Date, Tutor, Tutor contact, Username, Status, Tag,
         Enrolment Code, National Student Number.
     """
-    enrol_upload_data = []
-    for student in es:
-        extracted_student = []
-        # Add empty column for auto number
-        extracted_student.append('')
-        # Add Student ID
-        extracted_student.append(student[0])
-        # Add Course code
-        extracted_student.append(student[7])
-        # Add Tutor code
-        extracted_student.append(student[11])
-        # Add start and end dates
-        extracted_student.append(student[9])
-        extracted_student.append(student[10])
-        # Add status
-        extracted_student.append(student[14])
-        # Add tag
-        extracted_student.append(student[15])
-        enrol_upload_data.append(extracted_student)
+    # EnrolmentPK is left empty for the auto number
+    enrol_upload_data = [['', student.student_id, student.course,
+                          student.tutor, student.start_date, student.end_date,
+                          student.status, student.tag] for student in es]
     headings = ('EnrolmentPK,StudentFK,CourseFK,TutorFK,StartDate,ExpiryDate,'
                 'Status,Tag')
     return enrol_upload_data, headings
@@ -2900,25 +3091,32 @@ def get_ext_data(ext_data):
         Student ID Number, Enrolment Code, Extension Length, Acceptance Date, 
         New Expiry Date.
     """
-    ext_upload_data = []
-    for student in ext_data:
-        extracted_student = []
-        # Add empty column for auto number
-        extracted_student.append('')
-        # Add EnrolmentFK
-        extracted_student.append(student[1])
-        # Add Extension Length
-        extracted_student.append(student[2])
-        # Add Acceptance Date
-        extracted_student.append(student[3])
-        # Add New Expiry Date
-        extracted_student.append(student[4])
-        ext_upload_data.append(extracted_student)
+    # ExtensionPK is left empty for the auto number
+    # EnrolmentFK, Extension Length, Acceptance Date, New Expiry Date
+    ext_upload_data = [[''] + student[1:5] for student in ext_data]
     headings = ('ExtensionPK,EnrolmentFK,ExtensionLength,AcceptanceDate,'
                 'ExpiryDate')
     return ext_upload_data, headings
 
 
+def get_file_stamp(f_name):
+    """Return the path, modified time and size of a CSV file.
+
+    Args:
+        f_name (str): File name without the .csv extension.
+
+    Returns:
+        file_stamp (tuple): Absolute path, modified time (ns) and size of the
+        file. The time and size are None if the file does not exist.
+    """
+    path = os.path.abspath('{}.csv'.format(f_name))
+    try:
+        file_info = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, file_info.st_mtime_ns, file_info.st_size
+
+
 def get_gd_data(gd_data):
     """Prepare data for Graduates table upload file.
 
@@ -2932,22 +3130,12 @@ def get_gd_data(gd_data):
     File structure (gd_data):
         Student ID Number, Enrolment Code, Graduation Date, Certificate Number.
     """
-    gd_upload_data = []
-    for student in gd_data:
-        extracted_student = []
-        # Add empty column for auto number
-        extracted_student.append('')
-        # Add EnrolmentFK
-        extracted_student.append(student[1])
-        # Add Graduation Date
-        extracted_student.append(student[2])
-        # Add Certificate Number
-        extracted_student.append(student[3])
-        gd_upload_data.append(extracted_student)
+    # GraduatePK is left empty for the auto number
+    # EnrolmentFK, Graduation Date, Certificate Number
+    gd_upload_data = [[''] + student[1:4] for student in gd_data]
     headings = ('GraduatePK,EnrolmentFK,GraduationDate,CertificateNumber')
-    # print(gd_upload_data)
     return gd_upload_data, headings
-        
+
 
 def get_grade(raw_grade):
     """Extract the grade from a raw grade.
@@ -2975,50 +3163,43 @@ def get_grade(raw_grade):
         return grade
 
 
-def get_how_heard(h_reason, pl_state):
-    """Return how heard value.
+def get_ledger_name(table):
+    """Return the name of the delta ledger file for a table."""
+    return 'Delta_Ledger_{}.json'.format(table.title().replace('-', '_'))
 
-    If the how heard value is 'other' then the value of the 'other' column is
-    returned for the how heard value.
 
-    Args:
-        h_reason (str): Value in the how heard column.
-        pl_state (str): Value in the other column for how heard.
-
-    Returns:
-        how_heard (str): Value of how heard.
-    """
-    if h_reason not in (None, '') and h_reason.lower() != 'other':
-        how_heard = h_reason.strip()
-    elif h_reason.lower() == 'other' and pl_state not in (None, ''):
-        how_heard = pl_state.strip()
-    elif h_reason.lower() == 'other':
-        how_heard = 'Other - not specified'
-    else:
-        how_heard = h_reason.strip()
-    return how_heard
-
-
-def get_language(lang_col, oth_col):
-    """Return language value.
-
-    If the language value is 'other' then the value of the 'other' column is
-    returned for the language value.
-
-    Args:
-        lang_col (str): Value in the language column.
-        oth_col (str): Value in the other column for language.
+def get_pipelines():
+    """Return the table pipelines that can be run from the command line.
 
     Returns:
-        language (str): Value of language.
+        pipelines (dict): For each table name, a tuple of the process function,
+        the data sources that must be provided for it and True if it needs a
+        course code, False otherwise.
     """
-    if lang_col.lower() == 'yes':
-        language = 'English'
-    elif lang_col.lower() == 'no':
-        language = oth_col.strip()
-    else:
-        language = ''
-    return language
+    pipelines = {
+            'students': (process_student_data,
+                         ['Combined Data Form', 'Enrolment Sheet'], False),
+            'tutors': (process_tutors_data, ['Tutor Data'], False),
+            'courses': (process_courses_data, ['Course Data'], False),
+            'workshops': (process_workshops_data, ['Workshop Data'], False),
+            'course-tutors': (process_course_tutors_data, ['Course Tutors'],
+                              False),
+            'workshop-tutors': (process_workshop_tutors_data,
+                                ['Workshop Tutor Data'], False),
+            'enrolments': (process_enrolment_data, ['Enrolment Sheet'], False),
+            'course-attendance': (process_course_attendance,
+                                  ['Course Attendance', 'Dates'], True),
+            'workshop-attendance': (process_workshop_attendance,
+                                    ['Workshop Attendance'], False),
+            'graduates': (process_graduates, ['Graduates Data'], False),
+            'old-students': (process_old_student_data, ['Old Students'],
+                             False),
+            'extensions': (process_extensions_data, ['Extensions Data'],
+                           False),
+            'results-table': (process_results_table, [], True),
+            'results-students': (process_results_students, [], True)
+            }
+    return pipelines
 
 
 def get_post_code(post_code, country):
@@ -3051,6 +3232,29 @@ def get_post_code(post_code, country):
         return post_code
 
 
+def get_results_rows(reader, results_headings, include_students):
+    """Yield the Results Table rows from a Master Results reader.
+
+    Args:
+        reader (iterable): Chunks of Master Results data (dataframe), e.g.
+        from pandas.read_csv() with chunksize.
+        results_headings (list): Columns to be kept for the Results Table.
+        include_students (set): Enrolment IDs of the students to be added.
+
+    Yields:
+        row (list): The next row, with an empty ID as the first column.
+    """
+    import pandas as pd
+    num_read = 0
+    for chunk in reader:
+        results_df = filter_results(chunk, results_headings, include_students)
+        for row in results_df.values.tolist():
+            yield [''] + row
+        num_read += len(chunk)
+    if num_read == 0:
+        check_df(pd.DataFrame())
+
+
 def get_results_upload_data(cleaned_results, e_id):
     """Create upload file for student data.
     
@@ -3085,33 +3289,73 @@ def get_results_upload_data(cleaned_results, e_id):
     return upload_data
 
 
-def get_status(student_status):
-    """Return student status value.
-
-    Returns the status of the student or an empty string if the value is not
-    in the allowed values.
+def get_row_fingerprint(row):
+    """Return a fingerprint for a row, used by the delta ledgers.
 
     Args:
-        student_status (str): Value in the student status column.
+        row (list): Row read from a source file.
 
     Returns:
-        status (str): Value of student status.
+        (str): Hash of the values in the row.
     """
-    allowed = [None, '', 'Active', 'Suspended', 'Withdrawn', 'Graduated',
-                  'Expired', 'On Hold', 'Cancelled']
-    status = student_status.strip()
-    if status in allowed:
-        return status
-    else:
-        return ''
+    return hashlib.blake2b('\x1f'.join(row).encode('utf-8'),
+                           digest_size=16).hexdigest()
 
 
-def get_student_data(cdf, es):
+def get_source_handlers():
+    """Return the check and clean functions for each data source.
+
+    The check function takes a list of rows and returns the warnings tuple
+    used by load_data(). The clean function takes a list of rows and returns
+    the cleaned rows, or is None if the source is not cleaned on its own
+    (e.g. the Combined Data Form needs the Course Codes to be cleaned). The
+    warnings for the Dates and Enrolment Codes files are not kept.
+
+    Returns:
+        handlers (dict): (check function, clean function) for each source.
+    """
+    handlers = {
+            'ADV Assessments': (lambda data: check_ass_data(data, 65), None),
+            'Course Attendance': (check_ca, None),
+            'Course IDs': (check_cc, clean_cc),
+            'Course Data': (check_cd, clean_cd),
+            'Combined Data Form': (check_cdf, None),
+            'Course Tutors': (lambda data: check_ctd(
+                    data, 'Course Tutor Data', 'Course'), clean_ctd),
+            'Dates': (discard_warnings(check_da), None),
+            'Enrolment Codes': (discard_warnings(check_ec), clean_ec),
+            'Existing Course Tutors': (lambda data: check_ctd(
+                    data, 'Course_Tutors.csv', 'Course'), clean_ctd),
+            'Enrolment IDs': (check_e_id_data, None),
+            'Enrolment Sheet': (check_es_frame, clean_es_frame),
+            'Existing Workshop Tutors': (lambda data: check_ctd(
+                    data, 'Workshop_Tutors.csv', 'Workshop'), clean_ctd),
+            'Expiry Dates': (check_expiry, clean_expiry),
+            'Extensions Data': (check_ex, clean_ext),
+            'Extension Codes': (check_exc, clean_exc),
+            'Graduates Current': (check_gc, clean_gc),
+            'Graduates Data': (check_gd, clean_gd),
+            'Old Students': (check_os, clean_os),
+            'Student ID Course Codes': (check_scc, None),
+            'Workshop Student IDs': (check_swc, None),
+            'Student ID Numbers': (check_si, None),
+            'Tutor Data': (check_td, clean_td),
+            'Tutor IDs': (check_tu, clean_tu),
+            'Workshop Attendance': (check_wa, clean_wa),
+            'Workshop IDs': (check_wc, clean_wc),
+            'Workshop Data': (check_wd, clean_wd),
+            'Workshop Tutor Data': (lambda data: check_ctd(
+                    data, 'Workshop Tutor Data', 'Workshop'), clean_ctd)
+            }
+    return handlers
+
+
+def get_student_data(joined):
     """Prepare data for Student table upload file.
 
     Args:
-        cdf (list): Data from the Combined Data Form.
-        es (list): Data from the Enrolment Sheet.
+        joined (tuple): Matched and unmatched rows from the Combined Data Form
+        and the Enrolment Sheet, as returned by join_cdf_es().
 
     Returns:
         student_upload_data (list): The data to be saved to file.
@@ -3143,70 +3387,12 @@ def get_student_data(cdf, es):
         Enrolment Code, National Student Number.
     """
     errors = []
-    student_upload_data = []
-    i = 0
-    while i < len(cdf):
-        j = 0
-        found = False
-        while not found and j < len(es):
-            student = cdf[i][0]
-            if student == es[j][0]:
-                found = True
-                student_data = []
-                student_data.append(student)
-                student_data.append(cdf[i][2])
-                student_data.append(cdf[i][3])
-                student_data.append(cdf[i][4])
-                student_data.append(cdf[i][5])
-                student_data.append(cdf[i][6])
-                # Username
-                student_data.append(es[j][13])
-                # Telephone
-                student_data.append(cdf[i][11])
-                student_data.append(cdf[i][12])
-                student_data.append(cdf[i][13])
-                # Preferred contact mode
-                student_data.append(cdf[i][14])
-                # Address Number
-                student_data.append(cdf[i][21])
-                student_data.append(cdf[i][22])
-                student_data.append(cdf[i][23])
-                student_data.append(cdf[i][24])
-                student_data.append(cdf[i][25])
-                student_data.append(cdf[i][26])
-                # Nationality
-                student_data.append(cdf[i][15])
-                student_data.append(cdf[i][16])
-                student_data.append(cdf[i][17])
-                student_data.append(cdf[i][18])
-                student_data.append(cdf[i][19])
-                student_data.append(cdf[i][20])
-                # Guardian First Name
-                student_data.append(cdf[i][7])
-                student_data.append(cdf[i][8])
-                student_data.append(cdf[i][9])
-                student_data.append(cdf[i][10])
-                # Disability
-                student_data.append(cdf[i][27])
-                # Previous Education
-                student_data.append(cdf[i][29])
-                student_data.append(cdf[i][30])
-                student_data.append(cdf[i][31])
-                # Employment
-                student_data.append(cdf[i][28])
-                # Reason for study
-                student_data.append(cdf[i][32])
-                student_data.append(cdf[i][33])
-                student_data.append(cdf[i][34])
-                # Enrolment Date
-                student_data.append(es[j][8])
-                student_upload_data.append(student_data)
-            else:
-                j += 1
-        if not found:
-            errors.append('Student {} does not appear in the Enrolment form. '
-                          'Please check!'.format(student))
-        i += 1
+    matched, cdf_only, es_only = joined
+    student_upload_data = [list(STUDENT_UPLOAD_FIELDS(student))
+                           for student in matched]
+    for cdf_student in cdf_only:
+        errors.append('Student {} does not appear in the Enrolment form. '
+                      'Please check!'.format(cdf_student.student_id))
     headings = ('StudentPK,NameGiven,NameSurname,NamePreferred,Gender,'
                 'DateOfBirth,Username,Telephone,Mobile,Email,'
                 'PreferredContactMode,AddressNumber,AddressStreet,'
@@ -3217,7 +3403,7 @@ def get_student_data(cdf, es):
                 'NationalStudentID,Employment,ReasonForStudy,HowHeard,'
                 'AgreeTandC,EnrolmentDate')
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Student_Update_Data')
+        process_errors(errors, 'Student_Update_Data')
     return student_upload_data, headings
 
 
@@ -3225,7 +3411,7 @@ def get_students(expiry_data, status):
     """Return list of students with passed status.
     
     Args:
-        expiry_data (list): List of lists of expiry date data.
+        expiry_data (list): Cleaned expiry date data (ExpiryRow).
         status (str): Status of students to be returned.
         
     Returns:
@@ -3233,7 +3419,7 @@ def get_students(expiry_data, status):
     """
     students = []
     for student in expiry_data:
-        if student[3] == status:
+        if student.status == status:
             students.append(student)
     return students    
 
@@ -3262,6 +3448,54 @@ def get_study_reason(resp_reason, pl_explain):
     return study_reason
 
 
+def get_table_dependencies():
+    """Return the tables that must be processed before each table.
+
+    The upload files need to be added to the Student Database in this order,
+    e.g. a student must be in the Students table before they can be enrolled.
+    Tables that are not listed do not depend on any other table.
+
+    Returns:
+        dependencies (dict): For each table name, a list of the table names
+        that must be processed first.
+    """
+    dependencies = {
+            'enrolments': ['students', 'tutors', 'courses'],
+            'course-tutors': ['courses', 'tutors'],
+            'workshop-tutors': ['workshops', 'tutors'],
+            'course-attendance': ['enrolments'],
+            'workshop-attendance': ['students', 'workshops'],
+            'graduates': ['enrolments'],
+            'extensions': ['enrolments'],
+            'results-table': ['results-students']
+            }
+    return dependencies
+
+
+def get_tee(*streams):
+    """Return a stream that writes to each of the passed streams.
+
+    Used by run_table() to display the messages for a table while keeping
+    them for the run report.
+
+    Args:
+        *streams: Streams to be written to, e.g. sys.stdout.
+
+    Returns:
+        tee (SimpleNamespace): Stream with write() and flush().
+    """
+    def write(text):
+        for stream in streams:
+            stream.write(text)
+        return len(text)
+
+    def flush():
+        for stream in streams:
+            stream.flush()
+
+    return types.SimpleNamespace(write=write, flush=flush)
+
+
 def get_w_enrolment_data(we):
     """Prepare data for Workshop enrolment table upload file.
 
@@ -3303,26 +3537,8 @@ def get_workshop_data(wd):
         Workshop Code, Workshop Name, Location, Venue, Date, Cost, Status,
         Type.
     """
-    workshop_upload_data = []
-    for workshop in wd:
-        extracted_workshop = []
-        # Add Workshop Code
-        extracted_workshop.append(workshop[0])
-        # Add Workshop Name
-        extracted_workshop.append(workshop[1])
-        # Add Workshop Location
-        extracted_workshop.append(workshop[2])
-        # Add Workshop Venue
-        extracted_workshop.append(workshop[3])
-        # Add Workshop Date
-        extracted_workshop.append(workshop[4])
-        # Add Workshop Cost
-        extracted_workshop.append(workshop[5])
-        # Add Workshop Status
-        extracted_workshop.append(workshop[6])
-        # Add Workshop Type
-        extracted_workshop.append(workshop[7])
-        workshop_upload_data.append(extracted_workshop)
+    # Workshop Code, Name, Location, Venue, Date, Cost, Status and Type
+    workshop_upload_data = [workshop[:8] for workshop in wd]
     headings = ('WorkshopPK,WorkshopName,Location,Venue,WorkshopDate,Cost,'
                 'Status,Type')
     return workshop_upload_data, headings
@@ -3694,13 +3910,102 @@ def help_tutor_id():
     print('Tutor ID, First Name, Last Name')
 
 
-def load_data(source, f_name=''):
+def join_cdf_es(cdf, es):
+    """Join the Combined Data Form and Enrolment Sheet data on Student ID.
+
+    Indexes the Enrolment Sheet by Student ID so that each Combined Data Form
+    row is matched in a single pass. If a Student ID appears more than once in
+    the Enrolment Sheet, the first row is used.
+
+    Args:
+        cdf (list): Cleaned Combined Data Form data (CdfRow).
+        es (list): Cleaned Enrolment Sheet data (EsRow).
+
+    Returns:
+        matched (list): JoinedRow of the cdf and es rows for each matched
+        student, in Combined Data Form order.
+        cdf_only (list): Combined Data Form rows with no Enrolment Sheet row.
+        es_only (list): Enrolment Sheet rows with no Combined Data Form row.
+    """
+    es_index = {}
+    for es_student in es:
+        es_index.setdefault(es_student.student_id, es_student)
+    matched = []
+    cdf_only = []
+    matched_ids = set()
+    for cdf_student in cdf:
+        es_student = es_index.get(cdf_student.student_id)
+        if es_student is None:
+            cdf_only.append(cdf_student)
+        else:
+            matched.append(JoinedRow(cdf_student, es_student))
+            matched_ids.add(cdf_student.student_id)
+    es_only = [es_student for es_student in es if
+               es_student.student_id not in matched_ids]
+    return matched, cdf_only, es_only
+
+
+def load_csv_cached(f_name):
+    """Read a CSV file, using a parsed copy saved in the cache if possible.
+
+    The cache is only used if a Reference_Cache directory exists in the same
+    directory as the file. A parsed copy of the file is saved there as a
+    pickle along with a hash of the file contents. The copy is used while the
+    hash still matches, otherwise the file is read again and the copy
+    replaced.
+
+    Args:
+        f_name (str): File name to be loaded, without the .csv extension.
+
+    Returns:
+        read_data (list): A list containing the data read from the file.
+    """
+    cache_dir = os.path.join(os.path.dirname(f_name), 'Reference_Cache')
+    if not os.path.isdir(cache_dir):
+        return ft.load_csv(f_name, 'e')
+    try:
+        with open('{}.csv'.format(f_name), 'rb') as csv_file:
+            file_hash = hashlib.sha256(csv_file.read()).hexdigest()
+    except OSError:
+        # Let load_csv() report the missing file
+        return ft.load_csv(f_name, 'e')
+    cache_name = os.path.join(cache_dir, '{}.pickle'.format(
+            os.path.basename(f_name)))
+    try:
+        with open(cache_name, 'rb') as cache_file:
+            cached_hash, read_data = pickle.load(cache_file)
+        if cached_hash == file_hash:
+            return read_data
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    read_data = ft.load_csv(f_name, 'e')
+    # Write to a temporary file first so a partial copy is never used. Each
+    # process has its own temporary file, as tables processed at the same
+    # time can load the same reference file
+    part_name = '{}.{}.part'.format(cache_name, os.getpid())
+    try:
+        with open(part_name, 'wb') as cache_file:
+            pickle.dump((file_hash, read_data), cache_file,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(part_name, cache_name)
+    except OSError:
+        # The copy is saved again the next time the file is loaded
+        if os.path.exists(part_name):
+            os.remove(part_name)
+    return read_data
+
+
+def load_data(source, f_name='', use_cache=False, keep=None):
     """Read data from a CSV file.
 
     Args:
         source (str): The code for the table that the source data belongs to.
         f_name (str): (Optional) File name to be loaded. If not provided, user
         will be prompted to provide a file name.
+        use_cache (bool): (Optional) If True, the file is read with
+        load_csv_cached() so that a parsed copy can be reused.
+        keep (function): (Optional) Takes the rows read from the file and
+        returns the rows to be checked and kept, e.g. filter_delta().
 
     Returns:
         read_data (list): A list containing the data read from the file.
@@ -3714,144 +4019,20 @@ def load_data(source, f_name=''):
         read_data = ft.get_csv_fname_load(source)
     else:
         print('\nLoading {}...'.format(f_name))
-        read_data = ft.load_csv(f_name, 'e')
+        with stage('load_csv') as counts:
+            if use_cache:
+                read_data = load_csv_cached(f_name)
+            else:
+                read_data = ft.load_csv(f_name, 'e')
+            counts['rows'] = len(read_data)
         print('Loaded {}.'.format(f_name))
+    if keep is not None:
+        read_data = keep(read_data)
     # Check that data has entries for each required column
-    if source == 'ADV Assessments':
-        # Update with required number of assessments if changed
-        to_add, items_to_add = check_ass_data(read_data, 65)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Course Attendance':
-        to_add, items_to_add = check_ca(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Course IDs':
-        to_add, items_to_add = check_cc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Course Data':
-        to_add, items_to_add = check_cd(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Combined Data Form':
-        to_add, items_to_add = check_cdf(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Course Tutors':
-        to_add, items_to_add = check_ctd(read_data,
-                                         'Course Tutor Data',
-                                         'Course')
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Dates':
-        to_add, items_to_add = check_da(read_data)
-    elif source == 'Enrolment Codes':
-        to_add, items_to_add = check_ec(read_data)
-    elif source == 'Existing Course Tutors':
-        to_add, items_to_add = check_ctd(read_data,
-                                         'Course_Tutors.csv',
-                                         'Course')
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Enrolment IDs':
-        to_add, items_to_add = check_e_id_data(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Enrolment Sheet':
-        to_add, items_to_add = check_es(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Existing Workshop Tutors':
-        to_add, items_to_add = check_ctd(read_data,
-                                         'Workshop_Tutors.csv',
-                                         'Workshop')
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Expiry Dates':
-        to_add, items_to_add = check_expiry(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Extensions Data':
-        to_add, items_to_add = check_ex(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Extension Codes':
-        to_add, items_to_add = check_exc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Graduates Current':
-        to_add, items_to_add = check_gc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Graduates Data':
-        to_add, items_to_add = check_gd(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Old Students':
-       to_add, items_to_add = check_os(read_data)
-       if to_add:
-           for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Student ID Course Codes':
-        to_add, items_to_add = check_scc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Workshop Student IDs':
-        to_add, items_to_add = check_swc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Student ID Numbers':
-        to_add, items_to_add = check_si(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Tutor Data':
-        to_add, items_to_add = check_td(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Tutor IDs':
-        to_add, items_to_add = check_tu(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Workshop Attendance':
-        to_add, items_to_add = check_wa(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Workshop IDs':
-        to_add, items_to_add = check_wc(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Workshop Data':
-        to_add, items_to_add = check_wd(read_data)
-        if to_add:
-            for item in items_to_add:
-                warnings.append(item)
-    elif source == 'Workshop Tutor Data':
-        to_add, items_to_add = check_ctd(read_data,
-                                         'Workshop Tutor Data',
-                                         'Workshop')
+    handlers = get_source_handlers()
+    if source in handlers:
+        with stage('check {}'.format(source), read_data):
+            to_add, items_to_add = handlers[source][0](read_data)
         if to_add:
             for item in items_to_add:
                 warnings.append(item)
@@ -3861,10 +4042,75 @@ def load_data(source, f_name=''):
         return read_data, False, warnings
 
 
+def load_ledger(table):
+    """Return the fingerprints of the rows processed by previous delta runs.
+
+    Args:
+        table (str): Name of the table, as used by get_pipelines().
+
+    Returns:
+        ledger (set): Fingerprints of the processed rows. Empty if there is no
+        ledger for the table.
+    """
+    file_name = get_ledger_name(table)
+    try:
+        with open(file_name) as ledger_file:
+            ledger = set(json.load(ledger_file)['fingerprints'])
+    except FileNotFoundError:
+        return set()
+    print('\nLoaded {} processed rows from {}.'.format(len(ledger),
+                                                       file_name))
+    return ledger
+
+
+def load_reference(source, f_name, references=None, clean=None):
+    """Read a reference data file, reusing it if it has not changed.
+
+    Reference files (e.g. Course_IDs.csv) are needed by several of the table
+    pipelines. The loaded data, and the cleaned data if a clean function is
+    given, are kept in references against the file's path, modified time and
+    size. The file is only read and cleaned again if it has changed since it
+    was last loaded.
+
+    Args:
+        source (str): The code for the table that the source data belongs to.
+        f_name (str): File name to be loaded, without the .csv extension.
+        references (dict): (Optional) Reference data already loaded in this
+        session. Updated with the data if it is not present or the file has
+        changed. If not provided, the file is always loaded.
+        clean (function): (Optional) Function used to clean the loaded data.
+
+    Returns:
+        read_data (list): The data read from the file, cleaned if clean was
+        provided.
+        True if warnings list has had items appended to it, False otherwise.
+        warnings (list): Warnings that have been identified in the data.
+    """
+    if references is None:
+        read_data, to_add, warnings = load_data(source, f_name, True)
+        if clean is not None:
+            with stage(clean.__name__, read_data):
+                read_data = clean(read_data)
+        return read_data, to_add, warnings
+    file_stamp = get_file_stamp(f_name)
+    key = (source, file_stamp[0], clean)
+    if key in references and references[key][0] == file_stamp:
+        print('\nUsing {} loaded earlier.'.format(f_name))
+        return references[key][1]
+    read_data, to_add, warnings = load_data(source, f_name, True)
+    if clean is not None:
+        with stage(clean.__name__, read_data):
+            read_data = clean(read_data)
+    references[key] = (file_stamp, (read_data, to_add, warnings))
+    return read_data, to_add, warnings
+
+
 def main():
     repeat = True
     low = 1
     high = 16
+    # Reference data loaded during this session
+    references = {}
     while repeat:
         try_again = False
         main_message()
@@ -3883,33 +4129,33 @@ def main():
                 help_menu()
                 try_again = True
             elif action == 2:
-                process_student_data()
+                process_student_data(references=references)
             elif action == 3:
-                process_tutors_data()
+                process_tutors_data(references=references)
             elif action == 4:
-                process_courses_data()
+                process_courses_data(references=references)
             elif action == 5:
-                process_workshops_data()
+                process_workshops_data(references=references)
             elif action == 6:
-                process_course_tutors_data()
+                process_course_tutors_data(references=references)
             elif action == 7:
-                process_workshop_tutors_data()
+                process_workshop_tutors_data(references=references)
             elif action == 8:
-                process_enrolment_data()
+                process_enrolment_data(references=references)
             elif action == 9:
-                process_course_attendance()    
+                process_course_attendance(references=references)    
             elif action == 10:
-                process_workshop_attendance()
+                process_workshop_attendance(references=references)
             elif action == 11:
-                process_graduates()
+                process_graduates(references=references)
             elif action == 12:
-                process_old_student_data()
+                process_old_student_data(references=references)
             elif action == 13:
-                process_extensions_data()
+                process_extensions_data(references=references)
             elif action == 14:
-                process_results_table()
+                process_results_table(references=references)
             elif action == 15:
-                process_results_students()
+                process_results_students(references=references)
             elif action == high:
                 print('\nIf you have generated any files, please find them '
                       'saved to disk. Goodbye.')
@@ -3919,6 +4165,131 @@ def main():
     print('\nPlease find your files saved to disk. Goodbye.')
 
 
+def main_batch(argv=None):
+    """Process one or more tables from the command line without prompts.
+
+    The tables are processed in the order given and the reference files are
+    only loaded once for the whole run. With --jobs, independent tables are
+    processed at the same time on a pool of worker processes, see
+    run_tables_parallel(). Processing stops at the first table that fails
+    unless --keep-going is used. A report for the run is saved with
+    save_run_report().
+
+    Args:
+        argv (list): (Optional) Command line arguments, not including the
+        program name. If not provided, sys.argv is used.
+
+    Returns:
+        0 if all tables were processed, 1 if any table failed and 2 if the
+        arguments are not valid.
+    """
+    pipelines = get_pipelines()
+    parser = argparse.ArgumentParser(
+            description='Prepare Student Database upload files without the '
+            'menu.')
+    parser.add_argument('tables', nargs='+', choices=list(pipelines),
+                        metavar='table', help='Table to be processed: '
+                        '{}.'.format(', '.join(pipelines)))
+    parser.add_argument('-c', '--course', default='',
+                        help='Course code for course-attendance, '
+                        'results-table and results-students.')
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        metavar='SOURCE=PATH',
+                        help="CSV file for a data source, e.g. 'Enrolment "
+                        "Sheet=Enrolments.csv'. Can be repeated. Reference "
+                        "files default to their standard names.")
+    parser.add_argument('-d', '--directory', default='',
+                        help='Directory containing the files. Upload files '
+                        'are also saved here.')
+    parser.add_argument('--binary-cache', action='store_true',
+                        help='Keep parsed copies of the reference files in a '
+                        'Reference_Cache directory.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the Enrolment Sheet for enrolments and '
+                        'the Master Results file for results-table.')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Rows per chunk when streaming.')
+    parser.add_argument('--collect-errors', action='store_true',
+                        help='Run every check before saving one error log '
+                        'for each table.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of tables to process at the same time, '
+                        'or of workers checking the Combined Data Form when '
+                        'processing one table.')
+    parser.add_argument('--keep-going', action='store_true',
+                        help='Continue with the next table if one fails.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time, rows and memory for each stage '
+                        'and save a profile for each table.')
+    parser.add_argument('--delta', action='store_true',
+                        help='Only process the Combined Data Form and '
+                        'Enrolment Sheet rows that are new or have changed '
+                        'since the last successful run.')
+    parser.add_argument('--sqlite', metavar='DATABASE',
+                        help='Save the upload rows to a SQLite database '
+                        'mirroring the Student Database tables instead of '
+                        'txt files.')
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as exc:
+        return exc.code
+    # Map each data source to its file name (without the .csv extension)
+    files = {}
+    for item in args.file:
+        source, sep, path = item.partition('=')
+        if not sep or source.strip() == '' or path.strip() == '':
+            print('\n{} is not in the form SOURCE=PATH.'.format(item))
+            return 2
+        path = path.strip()
+        if path.lower().endswith('.csv'):
+            path = path[:-4]
+        files[source.strip()] = path
+    if args.jobs < 1:
+        print('\n--jobs must be at least 1.')
+        return 2
+    if args.delta and args.stream:
+        print('\n--delta cannot be used with --stream.')
+        return 2
+    # Make sure every table has the files and course code it needs
+    for table in args.tables:
+        sources = pipelines[table][1]
+        missing = [source for source in sources if source not in files]
+        if missing:
+            print('\n{} requires a file for: {}.'.format(table,
+                  ', '.join(missing)))
+            return 2
+        if pipelines[table][2] and args.course == '':
+            print('\n{} requires a course code (--course).'.format(table))
+            return 2
+    if args.directory != '':
+        os.chdir(args.directory)
+    if args.binary_cache:
+        os.makedirs('Reference_Cache', exist_ok=True)
+    tables = list(dict.fromkeys(args.tables))
+    if args.jobs > 1 and len(tables) > 1:
+        results = run_tables_parallel(tables, args.jobs, files, args.course,
+                                      args.keep_going, args.stream,
+                                      args.chunk_size, args.collect_errors,
+                                      args.profile, args.delta,
+                                      args.sqlite)
+    else:
+        # A single table uses the workers to check the Combined Data Form
+        set_check_jobs(args.jobs)
+        references = {}
+        results = []
+        for table in args.tables:
+            results.append(run_table(table, files, args.course, references,
+                                     False, args.stream, args.chunk_size,
+                                     args.collect_errors, args.profile,
+                                     args.delta, args.sqlite))
+            if results[-1]['status'] == 'failed' and not args.keep_going:
+                break
+    save_run_report(results, args.jobs)
+    if any(result['status'] != 'processed' for result in results):
+        return 1
+    return 0
+
+
 def main_message():
     """Print the menu of options."""
     print('\n\n*************==========================*****************')
@@ -3943,46 +4314,149 @@ def main_message():
     print('16 Exit')
 
 
-def preferred_contact(mobile_pref, email_pref):
-    """Return preferred contact mode.
+def map_unique(column, func):
+    """Return a column with func applied to each distinct value.
+
+    Calls func once for each distinct value in the column rather than once
+    for each row, which is much faster where values repeat (e.g. dates).
+
+    Args:
+        column (Series): Column of values.
+        func (function): Function taking a single value.
+
+    Returns:
+        (Series): Column of results.
+    """
+    return column.map({value: func(value) for value in column.unique()})
+
+
+def normalise_date(raw_date):
+    """Return raw_date in the format dd/mm/yyyy.
 
-    Examines the values for the mobile and email columns and returns the
-    preferred contact mode. Could be 'Email', 'Mobile' or 'Email or Mobile'.
+    Cached replacement for da.clean_date(). Dates that are not valid are
+    passed straight to da.clean_date(), as their cleaned form is not cached.
+    See parse_date().
 
     Args:
-        mobile_pref (str): 'Mobile' if mobile is preferred contact mode.
-        email_pref (Str): 'Email' if email is preferred contact mode.
+        raw_date (str): Date to be cleaned.
 
     Returns:
-        preference (str): Preferred contact mode.
+        (str): Cleaned date.
     """
-    if mobile_pref.strip() == 'Mobile' and email_pref.strip() == 'Email':
-        preference = 'Email or Mobile'
-    elif mobile_pref.strip() == 'Mobile' and email_pref.strip() != 'Email':
-        preference = 'Mobile'
-    elif mobile_pref.strip() != 'Mobile' and email_pref.strip() == 'Email':
-        preference = 'Email'
-    elif mobile_pref.strip() != 'Mobile' and email_pref.strip() != 'Email':
-        preference = ''
-    return preference
+    valid, cleaned_date = parse_date(raw_date)
+    if valid:
+        return cleaned_date
+    import custtools.datetools as da
+    return da.clean_date(raw_date)
 
 
-def process_course_attendance():
+def normalise_name(name):
+    """Return a name in lower case with single spaces between words.
+
+    Args:
+        name (str): Name to be normalised.
+
+    Returns:
+        (str): Normalised name.
+    """
+    return ' '.join(name.split()).lower()
+
+
+def other_column(response, other, not_specified=None):
+    """Return a column of responses with 'Other' replaced.
+
+    Where the response is 'other' (any case) the value of the other column is
+    used. If not_specified is provided it is used where the response is
+    'other' but the other column is empty. Column version of the logic in
+    get_ethnicity(), get_study_reason() and similar functions.
+
+    Args:
+        response (Series): Stripped responses.
+        other (Series): Stripped values of the other column.
+        not_specified (str): (Optional) Value used if other is empty.
+
+    Returns:
+        (Series): Responses with 'Other' replaced.
+    """
+    is_other = response.str.lower() == 'other'
+    if not_specified is None:
+        return response.where(~is_other, other)
+    explained = other.where(other != '', not_specified)
+    return response.where(~is_other, explained)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(raw_date):
+    """Return whether a date is valid and its dd/mm/yyyy form.
+
+    Results are kept in a bounded cache that evicts the least recently used
+    dates, so a date that appears in both a check_* and a clean_* function, or
+    on many rows, is only parsed once. Use date_cache_stats() for the hit
+    rate.
+
+    Args:
+        raw_date (str): Date to be parsed.
+
+    Returns:
+        valid (bool): True if the date is valid, False otherwise.
+        cleaned_date (str): Date in the format dd/mm/yyyy, or None if the date
+        is not valid.
+    """
+    import custtools.datetools as da
+    if not da.validate_date(raw_date):
+        return False, None
+    return True, da.clean_date(raw_date)
+
+
+def process_collected_errors():
+    """Process the collected errors before an upload file is saved.
+
+    Does nothing unless collect_errors() is active and errors have been
+    found. Otherwise the combined error log is processed and the program
+    exits so that no upload file is saved.
+    """
+    if error_collection and error_collection[-1][1]:
+        source, collected = error_collection[-1]
+        save_error_log(get_combined_errors(collected), source)
+
+
+def process_course_attendance(files=None, course_code='', references=None,
+                              headless=False):
     """Process a Course Attendance Table upload form.
 
     Loads the course attendance data file and processes it.
     Saves the processed data to a file for uploading to the Course
     attendance table in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        course_code (str): (Optional) Code for the course being processed. If
+        not provided, user will be prompted for it.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Course Attendance Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Course Attendance Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Course Attendance Data File', 'Student-Course File',
                       'Dates File', 'Course IDs File']
-    ad.confirm_files('Course Attendance Data', required_files)
+    if not headless:
+        ad.confirm_files('Course Attendance Data', required_files)
     # Get name for Course Attendance Data File and then load
-    att_data, to_add, warnings_to_add = load_data('Course Attendance')
+    att_file_name = files.get('Course Attendance')
+    att_data, to_add, warnings_to_add = load_data('Course Attendance',
+                                                  att_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
@@ -3990,37 +4464,43 @@ def process_course_attendance():
     # Load the Student ID and Course Codes combinations
     # Used to make sure the Course Code and Student ID Number combination is
     # correct
-    scc_file_name = 'scc'
-    scc_data, to_add, warnings_to_add = load_data('Student ID Course Codes',
-                                                  scc_file_name)
+    scc_file_name = files.get('Student ID Course Codes', 'scc')
+    scc_data, to_add, warnings_to_add = load_reference(
+            'Student ID Course Codes', scc_file_name, references)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Get name for Dates Data File and then load
-    date_data, to_add, warnings_to_add = load_data('Dates')
+    date_file_name = files.get('Dates')
+    date_data, to_add, warnings_to_add = load_data('Dates', date_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Load Course ID Numbers
-    cc_file_name = 'Course_IDs'
-    cc_data, to_add, warnings_to_add = load_data('Course IDs', cc_file_name)
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_cc = clean_cc(cc_data)
     # Get the course code to be processed
-    course = input('What is the code for the course being processed? --> ')
+    course = course_code
+    if course in (None, ''):
+        course = input('What is the code for the course being processed? '
+                       '--> ')
     # Check that is an actual course
-    check_valid_course(cleaned_cc, course, 0, 'Course_Codes')
+    check_valid_course(create_id_index(cleaned_cc, 0), course, 'Course_Codes')
     # Clean the dates data
-    cleaned_date_data = clean_pt_dates(date_data)
+    with stage('clean_pt_dates', date_data):
+        cleaned_date_data = clean_pt_dates(date_data)
     # Check that each student is actually enrolled in the course
-    to_add, warnings_to_add = check_valid_scc(att_data, scc_data, course, 0, 
-                                              'Course_Attendance_Data_')
+    scc_map = create_student_map(scc_data, 0, 1)
+    with stage('check_valid_scc', att_data):
+        to_add, warnings_to_add = check_valid_scc(att_data, scc_map, course, 0,
+                                                  'Course_Attendance_Data_')
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
@@ -4031,344 +4511,599 @@ def process_course_attendance():
               'updated, you can ignore this warning. Otherwise, please correct'
               ' the file before processing again.')
     # Create data for file upload
-    save_data, headings = get_attendance_upload(att_data, cleaned_date_data,
-                                                course)
-    ft.save_lists_to_text(save_data, headings, 'Course_Attendance_{}_'.format(
-            course))
-    ft.process_warning_log(warnings, warnings_to_process)
-
-
-def process_courses_data():
+    with stage('get_attendance_upload', att_data):
+        save_data, headings = get_attendance_upload(att_data,
+                                                    cleaned_date_data, course)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_upload', save_data):
+        save_upload(save_data, headings,
+                    'Course_Attendance_{}_'.format(course), 'CourseAttendance')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
+
+
+def process_courses_data(files=None, references=None, headless=False):
     """Process a Course Table upload form.
 
     Loads the course data file and processes it.
     Saves the processed data to a file for uploading to the Courses table in
     the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Courses Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Courses Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Courses Data File', 'Course IDs File']
-    ad.confirm_files('Course Data', required_files)
+    if not headless:
+        ad.confirm_files('Course Data', required_files)
     # Get name for Course Data File and then load
-    course_data, to_add, warnings_to_add = load_data('Course Data')
+    course_file_name = files.get('Course Data')
+    course_data, to_add, warnings_to_add = load_data('Course Data',
+                                                     course_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the course data
-    cleaned_courses = clean_cd(course_data)
+    with stage('clean_cd', course_data):
+        cleaned_courses = clean_cd(course_data)
     # print('Check cleaned courses data:')
     # ad.debug_list(cleaned_courses)
     # Load Course Codes
-    cc_file_name = 'Course_IDs'
-    cc_data, to_add, warnings_to_add = load_data('Course IDs', cc_file_name)
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_cc = clean_cc(cc_data)
     # Check that each Course is unique
     # print('Checking cleaned_cc:')
     # ad.debug_list(cleaned_cc)
     # print('Checking course codes are unique')
-    check_unique(cleaned_cc, cleaned_courses, 0, 0, 'Course Data',
-                 'Course code')
+    cc_index = create_id_index(cleaned_cc, 0)
+    with stage('check_unique', cleaned_courses):
+        check_unique(cc_index, cleaned_courses, 0, 'Course Data',
+                     'Course code')
     # Get course data for file
-    save_data, headings = get_course_data(cleaned_courses)
+    with stage('get_course_data', cleaned_courses):
+        save_data, headings = get_course_data(cleaned_courses)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Course Data Upload file
-    ft.save_lists_to_text(save_data, headings, 'Course_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', save_data):
+        save_upload(save_data, headings, 'Course_Data_', 'Courses')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_course_tutors_data():
+def process_course_tutors_data(files=None, references=None, headless=False):
     """Process a Course-Tutors Table upload form.
 
     Loads the course-tutors data file and processes it.
     Saves the processed data to a file for uploading to the Course-tutors table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Course Tutors Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Course Tutors Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Course Tutors Data File', 'Course Tutors File',
                       'Course IDs File', 'Tutor IDs File']
-    ad.confirm_files('Course Tutor Data', required_files)
+    if not headless:
+        ad.confirm_files('Course Tutor Data', required_files)
     # Get name for Course Tutor Data File and then load
-    ct_data, to_add, warnings_to_add = load_data('Course Tutors')
+    ct_file_name = files.get('Course Tutors')
+    ct_data, to_add, warnings_to_add = load_data('Course Tutors', ct_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the course-tutors data
-    cleaned_ct_data = clean_ctd(ct_data)
+    with stage('clean_ctd', ct_data):
+        cleaned_ct_data = clean_ctd(ct_data)
     # print('cleaned_ct_data:')
     # ad.debug_list(cleaned_ct_data)
     # Check that each course exists already
-    cc_file_name = 'Course_IDs'
-    cc_data, to_add, warnings_to_add = load_data('Course IDs', cc_file_name)
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_cc = clean_cc(cc_data)
-    check_present(cleaned_cc, cleaned_ct_data, 0, 0,
-                  'Course Tutor Data', 'Course code')
+    cc_index = create_id_index(cleaned_cc, 0)
+    with stage('check_present', cleaned_ct_data):
+        check_present(cc_index, cleaned_ct_data, 0, 'Course Tutor Data',
+                      'Course code')
     # Check that each Tutor exists already
-    tu_file_name = 'Tutor_IDs'
-    tu_data, to_add, warnings_to_add = load_data('Tutor IDs', tu_file_name)
+    tu_file_name = files.get('Tutor IDs', 'Tutor_IDs')
+    clean_tutor_ids, to_add, warnings_to_add = load_reference(
+            'Tutor IDs', tu_file_name, references, clean_tu)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    clean_tutor_ids = clean_tu(tu_data)
     # print('clean_tu_data:')
     # ad.debug_list(clean_tutor_ids)
-    check_present(clean_tutor_ids, cleaned_ct_data, 0, 1,
-                  'Course Tutors Data', 'Tutor ID')
+    tu_index = create_id_index(clean_tutor_ids, 0)
+    with stage('check_present', cleaned_ct_data):
+        check_present(tu_index, cleaned_ct_data, 1, 'Course Tutors Data',
+                      'Tutor ID')
     # Load existing Course-Tutor pairings
-    ect_file_name = 'Course_Tutors'
-    ect_data, to_add, warnings_to_add = load_data('Existing Course Tutors',
-                                                  ect_file_name)
+    ect_file_name = files.get('Existing Course Tutors', 'Course_Tutors')
+    cleaned_ect, to_add, warnings_to_add = load_reference(
+            'Existing Course Tutors', ect_file_name, references, clean_ctd)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_ect = clean_ctd(ect_data)
     # Check that each Course-Tutor pairing is unique
-    check_source_tutor_unique(cleaned_ct_data, cleaned_ect,
-                              'Course-Tutors Data')
+    with stage('check_source_tutor_unique', cleaned_ct_data):
+        check_source_tutor_unique(cleaned_ct_data, cleaned_ect,
+                                  'Course-Tutors Data')
     # Get data for save file
-    save_data, headings = get_course_tutor_data(cleaned_ct_data)
+    with stage('get_course_tutor_data', cleaned_ct_data):
+        save_data, headings = get_course_tutor_data(cleaned_ct_data)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save the data
-    ft.save_lists_to_text(save_data, headings, 'Course_Tutors_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', save_data):
+        save_upload(save_data, headings, 'Course_Tutors_Data_', 'CourseTutors')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_enrolment_data():
+def process_enrolment_data(files=None, references=None, headless=False,
+                           delta=False):
     """Process an Enrolment Table upload form.
 
     Loads the enrolment data file and processes it.
     Saves the processed data to a file for uploading to the Enrolments table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+        delta (bool): (Optional) If True, only the Enrolment Sheet rows that
+        are not in the ledger of previous runs are processed. The ledger is
+        updated once the upload file has been saved.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Enrolment Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Enrolment Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Enrolment Data', 'Student IDs File', 'Tutor IDs File',
                       'Course IDs File']
-    ad.confirm_files('Enrolment Data', required_files)
+    if not headless:
+        ad.confirm_files('Enrolment Data', required_files)
+    es_keep = None
+    if delta:
+        ledger = load_ledger('enrolments')
+        fingerprints = []
+        es_keep = functools.partial(filter_delta, ledger=ledger,
+                                    fingerprints=fingerprints,
+                                    source='Enrolment Sheet')
     # Get name for Enrolment Sheet data and then load
-    es_data, to_add, warnings_to_add = load_data('Enrolment Sheet')
+    es_file_name = files.get('Enrolment Sheet')
+    es_data, to_add, warnings_to_add = load_data('Enrolment Sheet',
+                                                 es_file_name, keep=es_keep)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the data in the Enrolment Sheet file
-    cleaned_es = clean_es(es_data)
+    with stage('clean_es_frame', es_data):
+        cleaned_es = clean_es_frame(es_data)
     # Load the Student ID Numbers
-    si_file_name = 'Student_IDs'
-    si_data, to_add, warnings_to_add = load_data('Student ID Numbers', 
-                                                 si_file_name)
+    si_file_name = files.get('Student ID Numbers', 'Student_IDs')
+    si_data, to_add, warnings_to_add = load_reference('Student ID Numbers',
+                                                      si_file_name, references)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Check that students are already present in the Student ID list
-    check_present(si_data, cleaned_es, 0, 0,
-                  'Enrolment_Sheet_ID_Student', 'Student ID')
+    si_index = create_id_index(si_data, 0)
+    with stage('check_present', cleaned_es):
+        check_present(si_index, cleaned_es, 0, 'Enrolment_Sheet_ID_Student',
+                      'Student ID')
     # Load the Tutor ID Numbers
-    tu_file_name = 'Tutor_IDs'
-    tu_data, to_add, warnings_to_add = load_data('Tutor IDs', tu_file_name)
+    tu_file_name = files.get('Tutor IDs', 'Tutor_IDs')
+    clean_tutor_ids, to_add, warnings_to_add = load_reference(
+            'Tutor IDs', tu_file_name, references, clean_tu)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    enrolment_data, headings = get_enrolment_data(cleaned_es)
-    # Replace Tutor name with Tutor ID
-    to_add, warnings_to_add, updated_es = replace_tutors(enrolment_data,
-                                                         tu_data)
+    with stage('get_enrolment_data', cleaned_es):
+        enrolment_data, headings = get_enrolment_data(cleaned_es)
+    # Replace Tutor name with Tutor ID in place
+    tutor_index = create_tutor_index(clean_tutor_ids)
+    with stage('replace_tutors', enrolment_data):
+        to_add, warnings_to_add, updated_es = replace_tutors(
+                enrolment_data, tutor_index, False)
     # Check that Tutors are present in the list
-    check_present(tu_data, updated_es, 0, 3, 'Enrolment_Sheet_Tutor_ID',
-                  'Tutor ID')
+    tu_index = create_id_index(clean_tutor_ids, 0)
+    with stage('check_present', updated_es):
+        check_present(tu_index, updated_es, 3, 'Enrolment_Sheet_Tutor_ID',
+                      'Tutor ID')
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Load Course ID Numbers
-    cc_file_name = 'Course_IDs'
-    cc_data, to_add, warnings_to_add = load_data('Course IDs', cc_file_name)
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_cc = clean_cc(cc_data)
     # Check that course codes are already present in the list
-    check_present(cleaned_cc, enrolment_data, 0, 2,
-                  'Enrolment Data', 'Course code')
+    cc_index = create_id_index(cleaned_cc, 0)
+    with stage('check_present', enrolment_data):
+        check_present(cc_index, enrolment_data, 2, 'Enrolment Data',
+                      'Course code')
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Enrolment Data upload file
-    ft.save_lists_to_text(updated_es, headings, 'Enrolment_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', updated_es):
+        save_upload(updated_es, headings, 'Enrolment_Data_', 'Enrolments')
+    if delta:
+        save_ledger('enrolments', ledger.union(fingerprints))
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
+
+
+def process_enrolment_stream(files=None, references=None, headless=False,
+                             chunk_size=10000):
+    """Process an Enrolment Table upload form without loading it into memory.
+
+    Streaming version of process_enrolment_data(). The reference files are
+    loaded and indexed first, then the Enrolment Sheet is read, checked,
+    cleaned and written to the upload file a chunk at a time so that memory
+    use does not grow with the size of the Enrolment Sheet.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source. If the Enrolment Sheet is not provided, user will be prompted
+        for it. Reference files default to their standard names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+        chunk_size (int): (Optional) Number of rows processed at a time.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
+    """
+    if files is None:
+        files = {}
+    warnings = ['\nProcessing Enrolment Data Warnings:\n']
+    print('\nProcessing Enrolment Data Upload Form (streaming).')
+    # Confirm the required files are in place
+    required_files = ['Enrolment Data', 'Student IDs File', 'Tutor IDs File',
+                      'Course IDs File']
+    if not headless:
+        ad.confirm_files('Enrolment Data', required_files)
+    es_file = files.get('Enrolment Sheet')
+    if es_file in (None, ''):
+        es_file = input('\nWhat is the name of the Enrolment Sheet file '
+                        '(without the .csv extension)? --> ')
+    # Load and index the Student ID Numbers
+    si_file_name = files.get('Student ID Numbers', 'Student_IDs')
+    si_data, to_add, warnings_to_add = load_reference('Student ID Numbers',
+                                                      si_file_name, references)
+    if to_add:
+        add_warnings(warnings, warnings_to_add)
+    si_index = create_id_index(si_data, 0)
+    # Load, clean and index the Tutor ID Numbers
+    tu_file_name = files.get('Tutor IDs', 'Tutor_IDs')
+    clean_tutor_ids, to_add, warnings_to_add = load_reference(
+            'Tutor IDs', tu_file_name, references, clean_tu)
+    if to_add:
+        add_warnings(warnings, warnings_to_add)
+    tutor_index = create_tutor_index(clean_tutor_ids)
+    tu_index = create_id_index(clean_tutor_ids, 0)
+    # Load, clean and index the Course ID Numbers
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
+    if to_add:
+        add_warnings(warnings, warnings_to_add)
+    cc_index = create_id_index(cleaned_cc, 0)
+    # Stream the Enrolment Sheet through the checks to the upload file
+    es_rows = stream_data('Enrolment Sheet', es_file, warnings, chunk_size)
+    upload_rows = stream_enrolment_upload(es_rows, si_index, tutor_index,
+                                          tu_index, cc_index, warnings,
+                                          chunk_size)
+    headings = get_enrolment_data([])[1]
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_upload'):
+        save_upload(upload_rows, headings, 'Enrolment_Data_', 'Enrolments')
+    save_warning_log(warnings, len(warnings) > 1)
+    return warnings
+
+
+def process_errors(errors, source):
+    """Process an error log, or keep it for a combined error log.
+
+    Processes the error log, which saves it and exits the program. If
+    collect_errors() is active the errors are kept instead and the program
+    continues.
+
+    Args:
+        errors (list): Errors that have been identified.
+        source (str): The source of the data that was checked.
+    """
+    if error_collection:
+        error_collection[-1][1].append((source, list(errors)))
+    else:
+        save_error_log(errors, source)
 
 
-def process_extensions_data():
+def process_extensions_data(files=None, references=None, headless=False):
     """Process an Extensions Table upload form.
     
     Loads the extensions data file and processes it.
     Saves the processed data to a file for uploading to the Extensions table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Extensions Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Extensions Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Extensions Data', 'Enrolment Codes File',
                       'Extension Codes File']
-    ad.confirm_files('Extensions Data', required_files)
+    if not headless:
+        ad.confirm_files('Extensions Data', required_files)
     # Get name for Extensions data and then load
-    ext_data, to_add, warnings_to_add = load_data('Extensions Data')
+    ext_file_name = files.get('Extensions Data')
+    ext_data, to_add, warnings_to_add = load_data('Extensions Data',
+                                                  ext_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the data in the Extensions Data file
-    cleaned_ext = clean_ext(ext_data)
+    with stage('clean_ext', ext_data):
+        cleaned_ext = clean_ext(ext_data)
     # Load the Extensions table enrolment codes and acceptance dates
     # Used to make sure the extension is not already contained in the
     # Extensions table
-    exc_file_name = 'Extension_Codes'
-    exc_data, to_add, warnings_to_add = load_data('Extension Codes',
-                                                  exc_file_name)
+    exc_file_name = files.get('Extension Codes', 'Extension_Codes')
+    cleaned_exc, to_add, warnings_to_add = load_reference(
+            'Extension Codes', exc_file_name, references, clean_exc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the data in the Extensions Codes Data file
-    cleaned_exc = clean_exc(exc_data)
     # Load the Student ID and Enrolment Codes combinations
     # Used to make sure the Enrolment Code and Student ID Number combination is
     # correct
-    ec_file_name = 'Enrolment_Codes'
-    ec_data, to_add, warnings_to_add = load_data('Enrolment Codes',
-                                                 ec_file_name)
+    ec_file_name = files.get('Enrolment Codes', 'Enrolment_Codes')
+    cleaned_ec, to_add, warnings_to_add = load_reference(
+            'Enrolment Codes', ec_file_name, references, clean_ec)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the data in the Enrolment Codes Data file
-    cleaned_ec = clean_ec(ec_data)
     # Check that Enrolment Code and Acceptance Date combination is not already
     # in the Extensions Table
     # print(cleaned_exc)
-    check_unique_extension(cleaned_exc, cleaned_ext, 0, 1, 1, 3)
+    with stage('check_unique_extension', cleaned_ext):
+        check_unique_extension(cleaned_exc, cleaned_ext, 0, 1, 1, 3)
     # Check that Student ID and Enrolment Code combinations are valid
-    check_valid_stud(cleaned_ext, cleaned_ec, 1, 0, 'Extensions_Data')
+    ec_map = create_student_map(cleaned_ec, 1, 0)
+    with stage('check_valid_stud', cleaned_ext):
+        check_valid_stud(cleaned_ext, ec_map, 1, 0, 'Extensions_Data')
     # Prepare the data to be saved
-    updated_ext, headings = get_ext_data(cleaned_ext)
+    with stage('get_ext_data', cleaned_ext):
+        updated_ext, headings = get_ext_data(cleaned_ext)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Extensions Data upload file
-    ft.save_lists_to_text(updated_ext, headings, 'Extensions_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', updated_ext):
+        save_upload(updated_ext, headings, 'Extensions_Data_', 'Extensions')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_graduates():
+def process_graduates(files=None, references=None, headless=False):
     """Process a Graduates Table upload form.
     
     Loads the graduate data file and processes it.
     Saves the processed data to a file for uploading to the Graduates table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Graduate Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Graduate Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Graduate Data', 'Enrolment Codes File',
                       'Graduates Current File']
-    ad.confirm_files('Graduate Data', required_files)
+    if not headless:
+        ad.confirm_files('Graduate Data', required_files)
     # Get name for Graduate data and then load
-    grad_data, to_add, warnings_to_add = load_data('Graduates Data')
+    grad_file_name = files.get('Graduates Data')
+    grad_data, to_add, warnings_to_add = load_data('Graduates Data',
+                                                   grad_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the data in the Graduates Data file
-    cleaned_gd = clean_gd(grad_data)
+    with stage('clean_gd', grad_data):
+        cleaned_gd = clean_gd(grad_data)
     # Load the Graduates table enrolment codes
     # Used to make sure the Enrolment Code is not already contained in the
     # Graduates table
-    gc_file_name = 'Graduates_Current'
-    gc_data, to_add, warnings_to_add = load_data('Graduates Current',
-                                                 gc_file_name)
+    gc_file_name = files.get('Graduates Current', 'Graduates_Current')
+    cleaned_gc, to_add, warnings_to_add = load_reference(
+            'Graduates Current', gc_file_name, references, clean_gc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the data in the Graduates Current Data file
-    cleaned_gc = clean_gc(gc_data)
     # Load the Student ID and Enrolment Codes combinations
     # Used to make sure the Enrolment Code and Student ID Number combination is
     # correct
-    ec_file_name = 'Enrolment_Codes'
-    ec_data, to_add, warnings_to_add = load_data('Enrolment Codes',
-                                                 ec_file_name)
+    ec_file_name = files.get('Enrolment Codes', 'Enrolment_Codes')
+    cleaned_ec, to_add, warnings_to_add = load_reference(
+            'Enrolment Codes', ec_file_name, references, clean_ec)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the data in the Enrolment Codes Data file
-    cleaned_ec = clean_ec(ec_data)
     # Check that Enrolment Code is not already in the Graduates Table
-    check_unique(cleaned_gc, cleaned_gd, 1, 1, 'Graduates Data',
-                 'Enrolment Code')   
+    gc_index = create_id_index(cleaned_gc, 1)
+    with stage('check_unique', cleaned_gd):
+        check_unique(gc_index, cleaned_gd, 1, 'Graduates Data',
+                     'Enrolment Code')
     # Check that Student ID and Enrolment Code combinations are valid
-    check_valid_stud(cleaned_gd, cleaned_ec, 1, 0, 'Graduates_Data')
+    ec_map = create_student_map(cleaned_ec, 1, 0)
+    with stage('check_valid_stud', cleaned_gd):
+        check_valid_stud(cleaned_gd, ec_map, 1, 0, 'Graduates_Data')
     # Prepare the data to be saved
-    updated_gd, headings = get_gd_data(cleaned_gd)
+    with stage('get_gd_data', cleaned_gd):
+        updated_gd, headings = get_gd_data(cleaned_gd)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Graduates Data upload file
-    ft.save_lists_to_text(updated_gd, headings, 'Graduate_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', updated_gd):
+        save_upload(updated_gd, headings, 'Graduate_Data_', 'Graduates')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_old_student_data():
+def process_old_student_data(files=None, references=None, headless=False):
     """Process a Students Table upload form (existing students).
 
     Loads the enrolment data file and processes it.
     Saves the processed data to a file for uploading to the Enrolments table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Existing Student Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Existing Student Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Old Students Enrolment Data File', 'Student IDs File']
-    ad.confirm_files('Student Data', required_files)
+    if not headless:
+        ad.confirm_files('Student Data', required_files)
     # Get name for Old Students Enrolment Data File and then load
-    os_data, to_add, warnings_to_add = load_data('Old Students')
+    os_file_name = files.get('Old Students')
+    os_data, to_add, warnings_to_add = load_data('Old Students', os_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # ad.debug_list(os_data)
     # Load the Student ID Numbers
-    si_file_name = 'Student_IDs'
-    si_data, to_add, warnings_to_add = load_data('Student ID Numbers',
-                                                 si_file_name)
+    si_file_name = files.get('Student ID Numbers', 'Student_IDs')
+    si_data, to_add, warnings_to_add = load_reference('Student ID Numbers',
+                                                      si_file_name, references)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # print('Loaded Student IDs ok')
     # Clean os_data
-    cleaned_os = clean_os(os_data)
+    with stage('clean_os', os_data):
+        cleaned_os = clean_os(os_data)
     # Clean the data in the Enrolment Sheet file
     # Check each student is not already in the database
-    check_unique(si_data, cleaned_os, 0, 0, 'Old_Students_ID', 'Student ID')
+    si_index = create_id_index(si_data, 0)
+    with stage('check_unique', cleaned_os):
+        check_unique(si_index, cleaned_os, 0, 'Old_Students_ID', 'Student ID')
     # Create Student data upload file
     headings = ('StudentPK,NameGiven,NameSurname,NamePreferred,DateOfBirth,'
                 'Username,Telephone,Mobile,Email,PreferredContactMode,'
@@ -4378,46 +5113,127 @@ def process_old_student_data():
                 'HowHeard,AgreeTandC,EnrolmentDate,Gender,Ethnicity,'
                 'CountryOfBirth,Language,Disability,PreviousEducation,'
                 'PreviousEdYear, Employment,ReasonForStudy')
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Student data upload file
-    ft.save_lists_to_text(cleaned_os, headings, 'Old_Student_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', cleaned_os):
+        save_upload(cleaned_os, headings, 'Old_Student_Data_', 'Students')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_results_students():
+def process_results_stream(files=None, course_code='', references=None,
+                           headless=False, chunk_size=10000):
+    """Prepare upload file for Results Table without loading it into memory.
+
+    Streaming version of process_results_table(). The Master Results file is
+    read a chunk at a time with only the Results Table columns parsed, and
+    the rows for the students to be added are appended to the upload file, so
+    that memory use does not grow with the size of the Master Results file.
+
+    Args:
+        files (dict): (Optional) Not used, accepted so that all pipelines can
+        be called in the same way.
+        course_code (str): (Optional) Code for the course being processed. If
+        not provided, user will be prompted for it.
+        references (dict): (Optional) Not used, accepted so that all pipelines
+        can be called in the same way.
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+        chunk_size (int): (Optional) Number of rows processed at a time.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
+    """
+    warnings = ['\nProcessing Results Table Data Warnings:\n']
+    print('\nProcessing Results Table (streaming).')
+    # Confirm the required files are in place
+    required_files = ['Master Results File', 'Master Results Headings File',
+                      'Students to add File', 'Course Codes',
+                      'Results Table Headings File']
+    if not headless:
+        ad.confirm_files('Results Table Data', required_files)
+    # Get course code
+    course_code = get_course_code(course_code)
+    # Load the headings and Students to add files
+    master_headings = ft.load_headings('Master_Results_Headings_{}'.format(
+            course_code), 'e')
+    results_headings = ft.load_headings('Results_Table_Headings_{}'.format(
+            course_code), 'e')
+    include_students = ft.load_headings('Students_to_add_{}'.format(
+            course_code), 'e')
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    file_name = '{}_Results_Table_Data_{}.txt'.format(
+            course_code, ft.generate_time_string())
+    with stage('stream_results'):
+        stream_results('Master_Results_{}.csv'.format(course_code),
+                       master_headings, results_headings, include_students,
+                       file_name, chunk_size, '{}_Results'.format(course_code))
+    save_warning_log(warnings, len(warnings) > 1)
+    return warnings
+
+
+def process_results_students(files=None, course_code='', references=None,
+                             headless=False):
     """Find students that need to be added to the Results table.
     
     Checks the expiry date of students to determine those that need to be
     added to the Results table (> 1 month passed since expiry).
     Removes students not in the base course and then removes students that have
     already been added. Returns a list of students (Enrolment ID) that need to
-    be added and saves this as a txt file.    
+    be added and saves this as a txt file.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        course_code (str): (Optional) Code for the course being processed. If
+        not provided, user will be prompted for it.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Results Students Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Results Students.')
     # Confirm the required files are in place
     required_files = ['Expiry Dates', 'Cuurent Results Table Students',
                       'Course Codes']
-    ad.confirm_files('Results Students Data', required_files)
+    if not headless:
+        ad.confirm_files('Results Students Data', required_files)
     # Get course code to process (base code)
-    course_code = get_course_code()
+    course_code = get_course_code(course_code)
     # Load Expiry Dates file
-    exp_file_name = 'Expiry_Dates_{}'.format(course_code)
+    exp_file_name = files.get('Expiry Dates',
+                              'Expiry_Dates_{}'.format(course_code))
     expiry_data, to_add, warnings_to_add = load_data('Expiry Dates',
-                                                  exp_file_name)
+                                                     exp_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
+    with stage('clean_expiry', expiry_data):
+        expiry_data = clean_expiry(expiry_data)
     # Load Current Results Table Students File
     current_students = ft.load_headings('Current_Results_Students_{}'.format(
             course_code), 'e')
     # Check that all students are in base course
-    check_course(expiry_data, course_code)
+    with stage('check_course', expiry_data):
+        check_course(expiry_data, course_code)
     # Drop students whose status is not in Expired, Graduated, Withdrawn
-    expiry_data = drop_status(expiry_data)
+    with stage('drop_status', expiry_data):
+        expiry_data = drop_status(expiry_data)
     # Drop students already in results table
-    expiry_data = drop_existing(expiry_data, current_students)
+    with stage('drop_existing', expiry_data):
+        expiry_data = drop_existing(expiry_data, current_students)
     # Place graduated students into a separate list
     graduated = get_students(expiry_data, 'Graduated')
     # Place expired students into a into a separate list
@@ -4425,7 +5241,8 @@ def process_results_students():
     # Place withdrawn students into a DataFrame
     withdrawn = get_students(expiry_data, 'Withdrawn')
     # Drop expired students that expired < 1 month ago
-    expired = update_expired(expired, 30)
+    with stage('update_expired', expired):
+        expired = update_expired(expired, 30)
     # Create list to hold Enrolment IDs of students to be returned
     extracted_students = []
     # Place all remaining Graduated students into students list
@@ -4441,12 +5258,37 @@ def process_results_students():
     headings = '' # No headings required
     file_name = 'Students_to_add_{}_{}{}'.format(course_code,
                                  ft.generate_time_string(), '.txt')
-    ft.save_list_to_text_single(extracted_students, headings, file_name)
-    ft.process_warning_log(warnings, warnings_to_process)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_list_to_text_single', extracted_students):
+        ft.save_list_to_text_single(extracted_students, headings, file_name)
+    record_file(file_name)
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_results_table():
-    """Prepare upload file for Results Table."""
+def process_results_table(files=None, course_code='', references=None,
+                          headless=False):
+    """Prepare upload file for Results Table.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        course_code (str): (Optional) Code for the course being processed. If
+        not provided, user will be prompted for it.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
+    """
+    import pandas as pd
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Results Table Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Results Table.')
@@ -4454,13 +5296,16 @@ def process_results_table():
     required_files = ['Master Results File', 'Master Results Headings File',
                       'Students to add File', 'Course Codes', 
                       'Results Table Headings File']
-    ad.confirm_files('Results Table Data', required_files)
+    if not headless:
+        ad.confirm_files('Results Table Data', required_files)
     # Get course code
-    course_code = get_course_code()
+    course_code = get_course_code(course_code)
     # Load Master Results file
     print('\nLoading {}...'.format('Master_Results_{}.csv'.format(
             course_code)))
-    master_data = ft.load_csv('Master_Results_{}.csv'.format(course_code))
+    with stage('load_csv') as counts:
+        master_data = ft.load_csv('Master_Results_{}.csv'.format(course_code))
+        counts['rows'] = len(master_data)
     print('Loaded {}.'.format('Master_Results_{}.csv'.format(course_code)))
     # Load Master headings file
     print('\nLoading {}...'.format('Master_Results_Headings_{}'.format
@@ -4485,65 +5330,112 @@ def process_results_table():
           (course_code)))
     # Place Master Results into a DataFrame
     results_df = pd.DataFrame(data = master_data, columns = master_headings)
-    check_df(results_df)
-    # Drop StudentID, Name, Course columns
-    results_df = results_df[results_headings]
-    check_df(results_df)
-    # Drop students not in Students to add file
-    results_df['EnrolmentID'] = results_df['EnrolmentID'].apply(
-            apply_students_filter, args=(include_students,))
-    results_df.dropna(subset=['EnrolmentID'], inplace=True)
+    with stage('check_df', results_df):
+        check_df(results_df)
+    # Keep the Results Table columns for students in Students to add file
+    with stage('filter_results', results_df):
+        results_df = filter_results(results_df, results_headings,
+                                    include_students)
     # Add empty column for ID to start of DataFrame
     results_df.insert(0, 'ID', '')
     # Save file
     file_name = '{}_Results_Table_Data_{}.txt'.format(course_code,
                       ft.generate_time_string())
-    results_df.to_csv(file_name, index=False)
-    print('\nFile has been saved to {}'.format(file_name))
-    ft.process_warning_log(warnings, warnings_to_process)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_upload', results_df):
+        if output_databases:
+            save_rows_to_database(results_df.values.tolist(),
+                                  ','.join(results_df.columns),
+                                  '{}_Results'.format(course_code))
+        else:
+            results_df.to_csv(file_name, index=False)
+            print('\nFile has been saved to {}'.format(file_name))
+            record_file(file_name)
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_student_data():
+def process_student_data(files=None, references=None, headless=False,
+                         delta=False):
     """Process a Students Table upload form.
 
     Loads the enrolment data file and processes it.
     Saves the processed data to a file for uploading to the Enrolments table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+        delta (bool): (Optional) If True, only the Combined Data Form rows
+        that are not in the ledger of previous runs are processed, along with
+        the Enrolment Sheet rows for those students. The ledger is updated
+        once the upload file has been saved.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Student Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Student Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Combined Data File', 'Enrolment Data Sheet',
                       'Course IDs File', 'Student IDs File']
-    ad.confirm_files('Student Data', required_files)
+    if not headless:
+        ad.confirm_files('Student Data', required_files)
+    cdf_keep = None
+    es_keep = None
+    if delta:
+        ledger = load_ledger('students')
+        fingerprints = []
+        cdf_keep = functools.partial(filter_delta, ledger=ledger,
+                                     fingerprints=fingerprints,
+                                     source='Combined Data Form')
     # Get name for Combined Data form and then load
-    cdf_data, to_add, warnings_to_add = load_data('Combined Data Form')
+    cdf_file_name = files.get('Combined Data Form')
+    cdf_data, to_add, warnings_to_add = load_data('Combined Data Form',
+                                                  cdf_file_name,
+                                                  keep=cdf_keep)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # ad.debug_list(cdf_data)
+    if delta:
+        # Only the Enrolment Sheet rows for the students being processed
+        student_ids = {row[0].strip() for row in cdf_data}
+        es_keep = functools.partial(filter_student_ids,
+                                    student_ids=student_ids,
+                                    source='Enrolment Sheet')
     # Get name for Enrolment Sheet data and then load
-    es_data, to_add, warnings_to_add = load_data('Enrolment Sheet')
+    es_file_name = files.get('Enrolment Sheet')
+    es_data, to_add, warnings_to_add = load_data('Enrolment Sheet',
+                                                 es_file_name, keep=es_keep)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Load Course Codes
-    cc_file_name = 'Course_IDs'
-    cc_data, to_add, warnings_to_add = load_data('Course IDs', cc_file_name)
+    cc_file_name = files.get('Course IDs', 'Course_IDs')
+    cleaned_cc, to_add, warnings_to_add = load_reference(
+            'Course IDs', cc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Course Codes data
-    cleaned_cc = clean_cc(cc_data)
     # print('cleaned cc data ok')
     # Load the Student ID Numbers
-    si_file_name = 'Student_IDs'
-    si_data, to_add, warnings_to_add = load_data('Student ID Numbers',
-                                                 si_file_name)
+    si_file_name = files.get('Student ID Numbers', 'Student_IDs')
+    si_data, to_add, warnings_to_add = load_reference('Student ID Numbers',
+                                                      si_file_name, references)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
@@ -4554,103 +5446,140 @@ def process_student_data():
     # print('Cleaned course codes successfully')
     # ad.debug_dict(course_codes)
     # Process cdf data into desired columns
-    cleaned_cdf = clean_cdf(cdf_data, course_codes)
+    with stage('clean_cdf_frame', cdf_data):
+        cleaned_cdf = clean_cdf_frame(cdf_data, course_codes)
     # Clean the data in the Enrolment Sheet file
     # Check each student is not already in the database
-    check_unique(si_data, cleaned_cdf, 0, 0, 'Combined_Data_Form_ID',
-                 'Student ID')
+    si_index = create_id_index(si_data, 0)
+    with stage('check_unique', cleaned_cdf):
+        check_unique(si_index, cleaned_cdf, 0, 'Combined_Data_Form_ID',
+                     'Student ID')
     # print('checked students cdf')
-    cleaned_es = clean_es(es_data)
+    with stage('clean_es_frame', es_data):
+        cleaned_es = clean_es_frame(es_data)
     # print('cleaned es')
+    # Join CDF and ES on Student ID for the comparison and upload data
+    with stage('join_cdf_es', cleaned_cdf):
+        joined = join_cdf_es(cleaned_cdf, cleaned_es)
     # Compare data from CDF and ES to make sure they are consistent
-    to_add, warnings_to_add = compare_cdf_es(cleaned_cdf, cleaned_es)
+    with stage('compare_cdf_es', cleaned_cdf):
+        to_add, warnings_to_add = compare_cdf_es(cleaned_cdf, cleaned_es,
+                                                 joined)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Create Student data upload file
-    student_data, headings = get_student_data(cleaned_cdf, cleaned_es)
+    with stage('get_student_data', joined[0]):
+        student_data, headings = get_student_data(joined)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Student data upload file
-    ft.save_lists_to_text(student_data, headings, 'Student_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
-
-
-def process_tc(user_response):
-    """Return the Terms and Conditions value.
-
-    If there is a value in the Terms and Conditions column then it returns
-    'Yes' as this indicates that the box has been ticked. If there is no value
-    then it returns 'No' as this indicates it has not been ticked.
-
-    Args:
-        user_response (str): Value from the Terms and Conditions column.
-
-    Returns:
-        t_and_c (str): Value for Terms and conditions. Can be either 'Yes' or
-        'No'.
-    """
-    if user_response not in (None, ''):
-        t_and_c = 'Yes'
-    else:
-        t_and_c = 'No'
-    return t_and_c
+    with stage('save_upload', student_data):
+        save_upload(student_data, headings, 'Student_Data_', 'Students')
+    if delta:
+        save_ledger('students', ledger.union(fingerprints))
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_tutors_data():
+def process_tutors_data(files=None, references=None, headless=False):
     """Process a Tutors Table upload form.
 
     Loads the tutors data file and processes it.
     Saves the processed data to a file for uploading to the Tutors table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Tutors Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Tutor Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Tutor Data File', 'Tutor IDs File']
-    ad.confirm_files('Tutor Data', required_files)
+    if not headless:
+        ad.confirm_files('Tutor Data', required_files)
     # Get name for Tutor Data and then load
-    tutor_data, to_add, warnings_to_add = load_data('Tutor Data')
+    tutor_file_name = files.get('Tutor Data')
+    tutor_data, to_add, warnings_to_add = load_data('Tutor Data',
+                                                    tutor_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean Tutor Data File
-    clean_tutor_data = clean_td(tutor_data)
+    with stage('clean_td', tutor_data):
+        clean_tutor_data = clean_td(tutor_data)
     # Load the Tutor ID Numbers
-    tu_file_name = 'Tutor_IDs'
-    tu_data, to_add, warnings_to_add = load_data('Tutor IDs', tu_file_name)
+    tu_file_name = files.get('Tutor IDs', 'Tutor_IDs')
+    clean_tutor_ids, to_add, warnings_to_add = load_reference(
+            'Tutor IDs', tu_file_name, references, clean_tu)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean Tutor_IDs.csv
-    clean_tutor_ids = clean_tu(tu_data)
     # Check Tutor ID not already in Tutor_IDs.csv
-    check_unique(clean_tutor_ids, clean_tutor_data, 0, 0, 'Tutor Data File',
-                 'Tutor ID')
+    tu_index = create_id_index(clean_tutor_ids, 0)
+    with stage('check_unique', clean_tutor_data):
+        check_unique(tu_index, clean_tutor_data, 0, 'Tutor Data File',
+                     'Tutor ID')
     # Save Tutor Upload file
     headings = 'TutorPK,TFirstName,TLastName,TEmail,TPhoneNumber'
-    ft.save_lists_to_text(clean_tutor_data, headings, 'Tutor_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_upload', clean_tutor_data):
+        save_upload(clean_tutor_data, headings, 'Tutor_Data_', 'Tutors')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_workshop_attendance():
+def process_workshop_attendance(files=None, references=None, headless=False):
     """Process a Workshop Attendance Table upload form.
     
     Loads the workshop attendance data file and processes it.
     Saves the processed data to a file for uploading to the Course
     attendance table in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Workshop Attendance Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Workshop Attendance Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Workshop Attendance Data File', 'Student-Workshop File',
                       'Workshop IDs File']
-    ad.confirm_files('Workshop Attendance Data', required_files)
+    if not headless:
+        ad.confirm_files('Workshop Attendance Data', required_files)
     # Get name for Workshop Attendance Data File and then load
-    att_data, to_add, warnings_to_add = load_data('Workshop Attendance')
+    att_file_name = files.get('Workshop Attendance')
+    att_data, to_add, warnings_to_add = load_data('Workshop Attendance',
+                                                  att_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
@@ -4658,155 +5587,281 @@ def process_workshop_attendance():
     # Load the Student ID and Workshop Codes combinations
     # Used to make sure the Workshop Code and Student ID Number combination is
     # correct
-    swc_file_name = 'swc'
-    swc_data, to_add, warnings_to_add = load_data('Workshop Student IDs',
-                                                  swc_file_name)
+    swc_file_name = files.get('Workshop Student IDs', 'swc')
+    swc_data, to_add, warnings_to_add = load_reference('Workshop Student IDs',
+                                                       swc_file_name,
+                                                       references)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Load Workshop ID Numbers
-    wc_file_name = 'Workshop_IDs'
-    wc_data, to_add, warnings_to_add = load_data('Workshop IDs', wc_file_name)
+    wc_file_name = files.get('Workshop IDs', 'Workshop_IDs')
+    cleaned_wc, to_add, warnings_to_add = load_reference(
+            'Workshop IDs', wc_file_name, references, clean_wc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Workshop Codes data
-    cleaned_wc = clean_wc(wc_data)
     # Extract codes into a list
     wc_list = ad.extract_list_item(cleaned_wc, 0)
     # Check the Student-Workshop data is valid
-    validate_swc(swc_data, wc_list)
+    with stage('validate_swc', swc_data):
+        validate_swc(swc_data, wc_list)
     # Check the Workshop Attendance data is valid
-    validate_wa(att_data, swc_data, 0, 1, 1, 0)
+    with stage('validate_wa', att_data):
+        validate_wa(att_data, swc_data, 0, 1, 1, 0)
     # Clean the Workshop attendance data
-    cleaned_wa = clean_wa(att_data)
+    with stage('clean_wa', att_data):
+        cleaned_wa = clean_wa(att_data)
     # Create data for file upload
     headings = 'AttendancePK,StudentFK,WorkshopFK'    
-    ft.save_lists_to_text(cleaned_wa, headings, 'Workshop_Attendance_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
+    with stage('save_upload', cleaned_wa):
+        save_upload(cleaned_wa, headings, 'Workshop_Attendance_',
+                    'WorkshopAttendance')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_workshops_data():
+def process_workshops_data(files=None, references=None, headless=False):
     """Process a Workshops Table upload form.
 
     Loads the workshops data file and processes it.
     Saves the processed data to a file for uploading to the Workshops table
     in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Workshops Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Workshops Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Workshops Data File', 'Workshop IDs File']
-    ad.confirm_files('Workshops Data', required_files)
+    if not headless:
+        ad.confirm_files('Workshops Data', required_files)
     # Get name for Workshops Data File and then load
-    workshops_data, to_add, warnings_to_add = load_data('Workshop Data')
+    workshops_file_name = files.get('Workshop Data')
+    workshops_data, to_add, warnings_to_add = load_data('Workshop Data',
+                                                        workshops_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the workshop data
-    cleaned_workshops = clean_wd(workshops_data)
+    with stage('clean_wd', workshops_data):
+        cleaned_workshops = clean_wd(workshops_data)
     # print('Check cleaned workshops data:')
     # ad.debug_list(cleaned_workshops)
     # Load Workshop Codes
-    wc_file_name = 'Workshop_IDs'
-    wc_data, to_add, warnings_to_add = load_data('Workshop IDs', wc_file_name)
+    wc_file_name = files.get('Workshop IDs', 'Workshop_IDs')
+    cleaned_wc, to_add, warnings_to_add = load_reference(
+            'Workshop IDs', wc_file_name, references, clean_wc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Workshop Codes data
-    cleaned_wc = clean_wc(wc_data)
     # Check that each Course is unique
     # print('Checking cleaned_wc:')
     # ad.debug_list(cleaned_wc)
     # print('Checking workshop codes are unique')
-    check_unique(cleaned_wc, cleaned_workshops, 0, 0, 'Workshop Data',
-                 'Workshop ID')
+    wc_index = create_id_index(cleaned_wc, 0)
+    with stage('check_unique', cleaned_workshops):
+        check_unique(wc_index, cleaned_workshops, 0, 'Workshop Data',
+                     'Workshop ID')
     # Get workshop data for file
-    save_data, headings = get_workshop_data(cleaned_workshops)
+    with stage('get_workshop_data', cleaned_workshops):
+        save_data, headings = get_workshop_data(cleaned_workshops)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save Workshop Data Upload file
-    ft.save_lists_to_text(save_data, headings, 'Workshop_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
+    with stage('save_upload', save_data):
+        save_upload(save_data, headings, 'Workshop_Data_', 'Workshops')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
 
 
-def process_workshop_tutors_data():
+def process_workshop_tutors_data(files=None, references=None, headless=False):
     """Process a Workshop-Tutors Table upload form.
 
     Loads the workshop-tutors data file and processes it.
     Saves the processed data to a file for uploading to the Workshop-tutors
     table in the student database.
+
+    Args:
+        files (dict): (Optional) File names to be loaded, keyed on the data
+        source (e.g. 'Enrolment Sheet'). If a data file is not provided, user
+        will be prompted for it. Reference files default to their standard
+        names.
+        references (dict): (Optional) Reference data already loaded in this
+        session, passed on to load_reference().
+        headless (bool): (Optional) If True, the required files are not
+        confirmed with the user.
+
+    Returns:
+        warnings (list): Warnings that have been identified in the data.
     """
+    if files is None:
+        files = {}
     warnings = ['\nProcessing Workshop Tutors Data Warnings:\n']
     warnings_to_process = False
     print('\nProcessing Workshop Tutors Data Upload Form.')
     # Confirm the required files are in place
     required_files = ['Workshop Tutors Data File', 'Workshop Tutors File',
                       'Workshop IDs File', 'Tutor IDs File']
-    ad.confirm_files('Workshop Tutor Data', required_files)
+    if not headless:
+        ad.confirm_files('Workshop Tutor Data', required_files)
     # Get name for Workshop Tutor Data File and then load
-    wt_data, to_add, warnings_to_add = load_data('Workshop Tutor Data')
+    wt_file_name = files.get('Workshop Tutor Data')
+    wt_data, to_add, warnings_to_add = load_data('Workshop Tutor Data',
+                                                 wt_file_name)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
     # Clean the workshop-tutors data
-    cleaned_wt_data = clean_ctd(wt_data)
+    with stage('clean_ctd', wt_data):
+        cleaned_wt_data = clean_ctd(wt_data)
     # print('cleaned_wt_data:')
     # ad.debug_list(cleaned_wt_data)
     # Check that each Workshop exists already
-    wc_file_name = 'Workshop_IDs'
-    wc_data, to_add, warnings_to_add = load_data('Workshop IDs', wc_file_name)
+    wc_file_name = files.get('Workshop IDs', 'Workshop_IDs')
+    cleaned_wc, to_add, warnings_to_add = load_reference(
+            'Workshop IDs', wc_file_name, references, clean_cc)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Workshop Codes data
-    cleaned_wc = clean_cc(wc_data)
-    check_present(cleaned_wc, cleaned_wt_data, 0, 0,
-                  'Workshop Tutor Data', 'Workshop code')
+    wc_index = create_id_index(cleaned_wc, 0)
+    with stage('check_present', cleaned_wt_data):
+        check_present(wc_index, cleaned_wt_data, 0, 'Workshop Tutor Data',
+                      'Workshop code')
     # Check that each Tutor exists already
-    tu_file_name = 'Tutor_IDs'
-    tu_data, to_add, warnings_to_add = load_data('Tutor IDs', tu_file_name)
+    tu_file_name = files.get('Tutor IDs', 'Tutor_IDs')
+    clean_tutor_ids, to_add, warnings_to_add = load_reference(
+            'Tutor IDs', tu_file_name, references, clean_tu)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    clean_tutor_ids = clean_tu(tu_data)
     # print('clean_tu_data:')
     # ad.debug_list(clean_tutor_ids)
-    check_present(clean_tutor_ids, cleaned_wt_data, 0, 1,
-                  'Workshop Tutors Data', 'Tutor ID')
+    tu_index = create_id_index(clean_tutor_ids, 0)
+    with stage('check_present', cleaned_wt_data):
+        check_present(tu_index, cleaned_wt_data, 1, 'Workshop Tutors Data',
+                      'Tutor ID')
     # Load existing Workshop-Tutor pairings
-    ewt_file_name = 'Workshop_Tutors'
-    ewt_data, to_add, warnings_to_add = load_data('Existing Workshop Tutors',
-                                                  ewt_file_name)
+    ewt_file_name = files.get('Existing Workshop Tutors', 'Workshop_Tutors')
+    cleaned_ewt, to_add, warnings_to_add = load_reference(
+            'Existing Workshop Tutors', ewt_file_name, references, clean_ctd)
     if to_add:
         warnings_to_process = True
         for line in warnings_to_add:
             warnings.append(line)
-    # Clean the Workshop Codes data
-    cleaned_ewt = clean_ctd(ewt_data)
     # Check that each Workshop-Tutor pairing is unique
-    check_source_tutor_unique(cleaned_wt_data, cleaned_ewt, 'Workshop-Tutors '
-                              + 'Data')
+    with stage('check_source_tutor_unique', cleaned_wt_data):
+        check_source_tutor_unique(cleaned_wt_data, cleaned_ewt,
+                                  'Workshop-Tutors Data')
     # Get data for save file
-    save_data, headings = get_workshop_tutor_data(cleaned_wt_data)
+    with stage('get_workshop_tutor_data', cleaned_wt_data):
+        save_data, headings = get_workshop_tutor_data(cleaned_wt_data)
+    # Stop before saving if any errors have been collected
+    process_collected_errors()
     # Save the data
-    ft.save_lists_to_text(save_data, headings, 'Workshop_Tutors_Data_')
-    ft.process_warning_log(warnings, warnings_to_process)
-    return
+    with stage('save_upload', save_data):
+        save_upload(save_data, headings, 'Workshop_Tutors_Data_',
+                    'WorkshopTutors')
+    save_warning_log(warnings, warnings_to_process)
+    return warnings
+
+
+@contextlib.contextmanager
+def profile_stages(memory=True):
+    """Record the resources used by each stage while the block runs.
+
+    The stages are the steps of each pipeline (e.g. loading, checking,
+    cleaning and saving the data) that are run with stage(). For each stage
+    the number of calls, wall time, CPU time, rows handled and peak memory
+    are recorded.
+
+    Args:
+        memory (bool): (Optional) If False, memory is not traced, which
+        avoids the overhead of tracemalloc.
+
+    Yields:
+        profile (dict): Calls, wall_seconds, cpu_seconds, rows and
+        peak_memory for each stage that was run.
+    """
+    profile = {}
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    # Wall time, CPU time and peak memory of inner stages for active stages
+    stage_profiles.append({'profile': profile, 'memory': memory,
+                           'active': []})
+    try:
+        yield profile
+    finally:
+        stage_profiles.pop()
+        if started:
+            tracemalloc.stop()
+        for record in profile.values():
+            record['wall_seconds'] = round(record['wall_seconds'], 6)
+            record['cpu_seconds'] = round(record['cpu_seconds'], 6)
+
+
+def read_csv_rows(f_name):
+    """Yield each row of a CSV file, skipping the headings row.
+
+    Args:
+        f_name (str): Name of the file to be read, without the .csv extension.
+
+    Yields:
+        row (list): The next row of the file.
+    """
+    with open('{}.csv'.format(f_name), newline='',
+              encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        for row in reader:
+            yield row
 
 
-def replace_tutors(old_es, tutor_data):
+def record_file(name):
+    """Record a saved file for the table that run_table() is processing.
+
+    Does nothing unless run_table() is recording the saved files.
+
+    Args:
+        name (str): Name of the saved file, or table in the output database.
+    """
+    if saved_files:
+        saved_files[-1].append(name)
+
+
+def replace_tutors(old_es, tutor_index, copy_data=True):
     """Replace Tutor Name with Tutor ID.
 
     Args:
         old_es (list): List containing data from the enrolment sheet.
-        tutor_data (list): List of tutor names and ID numbers.
+        tutor_index (dict): Tutor IDs keyed on normalised tutor name, as
+        returned by create_tutor_index().
+        copy_data (bool): (Optional) If True the rows are copied before the
+        Tutor names are replaced. If False old_es is updated in place.
 
     Returns:
         True if warnings list has had items appended to it, False otherwise.
@@ -4817,66 +5872,708 @@ def replace_tutors(old_es, tutor_data):
     File Structure (old_es):
         EnrolmentPK, StudentFK, CourseFK, TutorFK, StartDate, ExpiryDate,
         Status
-
-    File Structure (tutor_data):
-        TutorID, FirstName, LastName.
     """
-    new_es = copy.deepcopy(old_es)
+    if copy_data:
+        new_es = [list(student) for student in old_es]
+    else:
+        new_es = old_es
     warnings = ['\nTutor Data Warnings:\n']
     errors = []
-    # Clean the data in the Tutor file
-    # print('Replace_tutors input data:')
-    # ad.debug_list(tutor_data)
-    cleaned_tu = clean_tu(tutor_data)
-    # Place Tutors into a dictionary
-    tutors = tutors_to_dict(cleaned_tu)
     # Replace tutor names with Tutor IDs
-    i = 0
-    while i < len(new_es):
+    for student in new_es:
         # Skip if no Tutor provided
-        if new_es[i][3] not in (None, ''):
-            tutor_found = False
-            for tutor_ID, tutor_name in tutors.items():
-                if new_es[i][3].lower().strip() == 'tbc':
-                    warnings.append('Tutor is \'tbc\' for student {}'.format(
-                            new_es[i][1]))
-                    new_es[i][3] = ''
-                    tutor_found = True
-                    break
-                elif new_es[i][3] == tutor_name:
-                    new_es[i][3] = tutor_ID
-                    tutor_found = True
-                    break
-                else:
-                    continue
-            if not tutor_found:
-                errors.append('Could not find the tutor {} for student {}.'
-                              .format(new_es[i][3], new_es[i][1]))
-        i += 1
+        if student[3] in (None, ''):
+            continue
+        tutor_name = normalise_name(student[3])
+        if tutor_name == 'tbc':
+            warnings.append('Tutor is \'tbc\' for student {}'.format(
+                    student[1]))
+            student[3] = ''
+        elif tutor_name in tutor_index:
+            student[3] = tutor_index[tutor_name]
+        else:
+            errors.append('Could not find the tutor {} for student {}.'
+                          .format(student[3], student[1]))
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Enrolment_Data_Tutors')
+        process_errors(errors, 'Enrolment_Data_Tutors')
     if len(warnings) > 1:
         return True, warnings, new_es
     else:
         return False, warnings, new_es
 
 
-def tutors_to_dict(cleaned_tu):
-    """Create a dictionary with tutors from a list.
+def run_table(table, files, course_code='', references=None, capture=False,
+              stream=False, chunk_size=10000, collect=False, profile=False,
+              delta=False, database=None):
+    """Process one table for a batch run and return the result.
 
     Args:
-        cleaned_tu (list): List of tutors.
+        table (str): Name of the table, as used by get_pipelines().
+        files (dict): File names to be loaded, keyed on the data source.
+        course_code (str): (Optional) Code for the course being processed.
+        references (dict): (Optional) Reference data already loaded in this
+        run, passed on to load_reference().
+        capture (bool): (Optional) If True, the messages printed while the
+        table is processed are only returned. Otherwise they are displayed
+        as well.
+        stream (bool): (Optional) If True, enrolments are processed with
+        process_enrolment_stream() and results-table with
+        process_results_stream().
+        chunk_size (int): (Optional) Number of rows processed at a time when
+        streaming.
+        collect (bool): (Optional) If True, the errors from every check are
+        saved in one error log, see collect_errors().
+        profile (bool): (Optional) If True, the resources used by each stage
+        are recorded and saved with save_profile().
+        delta (bool): (Optional) If True, students and enrolments only
+        process the rows that are not in the ledger of previous runs.
+        database (str): (Optional) Name of a SQLite database that the upload
+        rows are saved to instead of txt files, see sqlite_output().
 
     Returns:
-        tutor_dict (dict): Dictionary with tutors.
+        result (dict): Table name, status ('processed' or 'failed'), run time
+        in seconds, warnings, messages, the output files saved (see
+        record_file()) and the stage profile if requested.
     """
-    tutor_dict = {}
-    for tutor in cleaned_tu:
-        key = tutor[0]
-        value = '{} {}'.format(tutor[1], tutor[2])
-        tutor_dict[key] = value
-    # ad.debug_dict(tutor_dict)
-    return tutor_dict
+    pipelines = get_pipelines()
+    process = pipelines[table][0]
+    options = {'files': files, 'references': references, 'headless': True}
+    if pipelines[table][2]:
+        options['course_code'] = course_code
+    if table == 'enrolments' and stream:
+        process = process_enrolment_stream
+        options['chunk_size'] = chunk_size
+    elif table == 'results-table' and stream:
+        process = process_results_stream
+        options['chunk_size'] = chunk_size
+    if table in ('students', 'enrolments') and delta:
+        options['delta'] = True
+    result = {'table': table, 'status': 'processed', 'seconds': 0.0,
+              'warnings': [], 'messages': '', 'output_files': []}
+    messages = io.StringIO()
+    if capture:
+        redirect = contextlib.redirect_stdout(messages)
+    else:
+        redirect = contextlib.redirect_stdout(get_tee(sys.stdout, messages))
+    if collect:
+        collector = collect_errors('{}_All_Checks'.format(
+                table.title().replace('-', '_')))
+    else:
+        collector = contextlib.nullcontext()
+    if profile:
+        profiler = profile_stages()
+        date_cache = date_cache_stats()
+    else:
+        profiler = contextlib.nullcontext()
+    if database is not None:
+        output = sqlite_output(database)
+    else:
+        output = contextlib.nullcontext()
+    saved_files.append(result['output_files'])
+    start = time.perf_counter()
+    try:
+        with redirect:
+            try:
+                with profiler as stages, output, collector:
+                    result['warnings'] = process(**options)
+            except SystemExit:
+                # save_error_log() exits once the error log has been saved
+                result['status'] = 'failed'
+                print('\n{} could not be processed. Please review the error '
+                      'log.'.format(table))
+            except Exception as error:
+                result['status'] = 'failed'
+                print('\n{} failed: {}'.format(table, error))
+            result['seconds'] = round(time.perf_counter() - start, 3)
+            if profile:
+                result['profile'] = stages
+                save_profile(table, stages, result['seconds'],
+                             date_cache_stats(date_cache))
+    finally:
+        saved_files.pop()
+    result['messages'] = messages.getvalue()
+    return result
+
+
+def run_tables_parallel(tables, jobs, files, course_code='', keep_going=False,
+                        stream=False, chunk_size=10000, collect=False,
+                        profile=False, delta=False, database=None):
+    """Process tables on a pool of worker processes.
+
+    A table is started once every table it depends on (see
+    get_table_dependencies()) that is part of this run has been processed.
+    Tables that depend on a table that failed are skipped. The messages from
+    each worker are displayed when its table finishes.
+
+    Args:
+        tables (list): Names of the tables to be processed.
+        jobs (int): Number of worker processes.
+        files (dict): File names to be loaded, keyed on the data source.
+        course_code (str): (Optional) Code for the course being processed.
+        keep_going (bool): (Optional) If False, no further tables are started
+        once a table has failed.
+        stream (bool): (Optional) If True, enrolments and results-table are
+        streamed.
+        chunk_size (int): (Optional) Number of rows processed at a time when
+        streaming.
+        collect (bool): (Optional) If True, the errors from every check are
+        saved in one error log for each table.
+        profile (bool): (Optional) If True, a stage profile is saved for each
+        table.
+        delta (bool): (Optional) If True, students and enrolments only
+        process new or changed rows.
+        database (str): (Optional) Name of a SQLite database that the upload
+        rows are saved to.
+
+    Returns:
+        results (list): The result for each table, in the order of tables.
+    """
+    import concurrent.futures
+    dependencies = get_table_dependencies()
+    # Only wait for tables that are part of this run
+    waiting = {}
+    for table in tables:
+        waiting[table] = [needed for needed in dependencies.get(table, [])
+                          if needed in tables and needed != table]
+    results = {}
+    running = {}
+    stop = False
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=set_check_jobs,
+            initargs=(1,)) as executor:
+        while waiting or running:
+            for table in list(waiting):
+                needed = waiting[table]
+                if stop or any(results.get(item, {}).get('status') in
+                               ('failed', 'skipped') for item in needed):
+                    results[table] = {'table': table, 'status': 'skipped',
+                                      'seconds': 0.0, 'warnings': [],
+                                      'messages': '', 'output_files': []}
+                    del waiting[table]
+                elif all(item in results for item in needed):
+                    future = executor.submit(run_table, table, files,
+                                             course_code, None, True, stream,
+                                             chunk_size, collect, profile,
+                                             delta, database)
+                    running[future] = table
+                    del waiting[table]
+            if not running:
+                continue
+            done, not_done = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                table = running.pop(future)
+                try:
+                    results[table] = future.result()
+                except Exception as error:
+                    results[table] = {'table': table, 'status': 'failed',
+                                      'seconds': 0.0, 'warnings': [],
+                                      'messages': '\n{} failed: {}'.format(
+                                              table, error),
+                                      'output_files': []}
+                print(results[table]['messages'])
+                if results[table]['status'] == 'failed' and not keep_going:
+                    stop = True
+    return [results[table] for table in tables]
+
+
+def save_error_log(errors, source):
+    """Save the error log and exit.
+
+    The errors are saved one per line to {source}_Error_Log_{time}.txt.
+
+    Args:
+        errors (list): Errors that have been identified.
+        source (str): The source of the data that was checked.
+    """
+    file_name = '{}_Error_Log_{}.txt'.format(source,
+                                             ft.generate_time_string())
+    with open(file_name, 'w') as text_file:
+        for error in errors:
+            text_file.write('{}\n'.format(error))
+    record_file(file_name)
+    print('\nErrors have been found in the {}. The error log has been saved '
+          'to {}'.format(source.replace('_', ' '), file_name))
+    sys.exit()
+
+
+def save_ledger(table, ledger):
+    """Save the fingerprints of the processed rows for the next delta run.
+
+    The ledger is written to a temporary file first so that an interrupted
+    save does not lose the previous ledger.
+
+    Args:
+        table (str): Name of the table, as used by get_pipelines().
+        ledger (set): Fingerprints of every row processed so far.
+
+    Returns:
+        file_name (str): Name of the saved ledger file.
+    """
+    file_name = get_ledger_name(table)
+    with open(file_name + '.part', 'w') as ledger_file:
+        json.dump({'table': table, 'updated': ft.generate_time_string(),
+                   'fingerprints': sorted(ledger)}, ledger_file)
+    os.replace(file_name + '.part', file_name)
+    print('\n{} processed rows have been saved to {}'.format(len(ledger),
+                                                             file_name))
+    record_file(file_name)
+    return file_name
+
+
+def save_profile(table, profile, seconds, date_cache=None):
+    """Save and display the stage profile for a table.
+
+    The profile is saved with the upload files, as
+    <Table>_Profile_<time>.json.
+
+    Args:
+        table (str): Name of the table, as used by get_pipelines().
+        profile (dict): Resources used by each stage, from profile_stages().
+        seconds (float): Run time for the whole table.
+        date_cache (dict): (Optional) Date parse cache statistics for the
+        table, from date_cache_stats().
+
+    Returns:
+        file_name (str): Name of the saved profile file.
+    """
+    file_name = '{}_Profile_{}.json'.format(table.title().replace('-', '_'),
+                                            ft.generate_time_string())
+    with open(file_name, 'w') as profile_file:
+        json.dump({'table': table, 'seconds': seconds, 'stages': profile,
+                   'date_cache': date_cache}, profile_file, indent=2)
+    print('\n{} Profile:\n'.format(table))
+    print('{:<32} {:>6} {:>9} {:>9} {:>9} {:>10}'.format(
+            'Stage', 'Calls', 'Wall', 'CPU', 'Rows', 'Peak KiB'))
+    # Slowest stages first
+    for name, stage in sorted(profile.items(),
+                              key=lambda item: -item[1]['wall_seconds']):
+        print('{:<32} {:>6} {:>9.3f} {:>9.3f} {:>9} {:>10.1f}'.format(
+                name, stage['calls'], stage['wall_seconds'],
+                stage['cpu_seconds'], stage['rows'],
+                stage['peak_memory'] / 1024))
+    if date_cache is not None:
+        print('\nDate cache: {} hits, {} misses ({:.1%} hit rate), {} of {} '
+              'dates cached'.format(date_cache['hits'], date_cache['misses'],
+                                    date_cache['hit_rate'],
+                                    date_cache['size'],
+                                    date_cache['max_size']))
+    print('\nProfile has been saved to {}'.format(file_name))
+    record_file(file_name)
+    return file_name
+
+
+def save_rows_to_database(rows, headings, table, chunk_size=10000):
+    """Save upload rows to a table in the active output database.
+
+    Rows are first inserted with executemany() in batches of chunk_size into
+    a temporary table, which is private to this connection and does not lock
+    the database, so the rows can be produced (e.g. streamed and checked) at
+    their own pace. Once every row has been staged, the table is created with
+    a TEXT column for each heading if it does not exist, any headings it does
+    not have yet are added as columns and the staged rows are copied in, all
+    in one transaction. Only that transaction holds the write lock, so tables
+    saved to the same database at the same time wait for each other's copies
+    rather than for each other's processing. If the rows cannot be saved, or
+    errors are collected while they are produced, nothing is added to the
+    table.
+
+    Args:
+        rows (iterable): Rows to be saved.
+        headings (str): Column headings, separated by commas.
+        table (str): Name of the Student Database table, e.g. 'Enrolments'.
+        chunk_size (int): (Optional) Number of rows inserted at a time.
+
+    Returns:
+        name (str): Table and database the rows were saved to.
+    """
+    connection, db_name = output_databases[-1]
+    names = [heading.strip() for heading in headings.split(',')]
+    columns = ['"{}"'.format(name.replace('"', '""')) for name in names]
+    quoted_table = '"{}"'.format(table.replace('"', '""'))
+    column_list = ', '.join(columns)
+    num_rows = 0
+    connection.execute('DROP TABLE IF EXISTS temp.Staged_Rows')
+    connection.execute('CREATE TEMP TABLE Staged_Rows ({})'.format(
+            column_list))
+    insert = 'INSERT INTO temp.Staged_Rows VALUES ({})'.format(
+            ', '.join(['?'] * len(names)))
+    try:
+        for chunk in chunk_rows(rows, chunk_size):
+            connection.execute('BEGIN')
+            try:
+                connection.executemany(insert, chunk)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            num_rows += len(chunk)
+        # Errors can be collected while the rows are produced
+        process_collected_errors()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+                    quoted_table, ', '.join('{} TEXT'.format(column)
+                                            for column in columns)))
+            existing = {info[1] for info in connection.execute(
+                    'PRAGMA table_info({})'.format(quoted_table))}
+            for name, column in zip(names, columns):
+                if name not in existing:
+                    connection.execute(
+                            'ALTER TABLE {} ADD COLUMN {} TEXT'.format(
+                                    quoted_table, column))
+            connection.execute(
+                    'INSERT INTO {0} ({1}) SELECT {1} FROM temp.Staged_Rows'
+                    .format(quoted_table, column_list))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+    finally:
+        connection.execute('DROP TABLE temp.Staged_Rows')
+    print('\n{} rows have been saved to the {} table in {}'.format(
+            num_rows, table, db_name))
+    name = '{} table in {}'.format(table, db_name)
+    record_file(name)
+    return name
+
+
+def save_rows_to_text(rows, headings, f_name):
+    """Save rows to a txt file as they are produced.
+
+    Rows are written one at a time so that the whole upload does not need to
+    be held in memory. The file is written under a temporary name and only
+    renamed once every row has been written, so a run that exits part way
+    through does not leave an incomplete upload file.
+
+    Args:
+        rows (iterable): Rows to be saved.
+        headings (str): Column headings to be saved to file.
+        f_name (str): Start of the file name, e.g. 'Enrolment_Data_'.
+
+    Returns:
+        file_name (str): Name of the saved file.
+    """
+    file_name = '{}{}.txt'.format(f_name, ft.generate_time_string())
+    temp_name = '{}.part'.format(file_name)
+    num_rows = 0
+    try:
+        with open(temp_name, 'w') as text_file:
+            text_file.write('{}\n'.format(headings))
+            for row in rows:
+                text_file.write('{}\n'.format(','.join(str(item) for item
+                                                       in row)))
+                num_rows += 1
+        # Errors can be collected while the rows are produced
+        process_collected_errors()
+    except BaseException:
+        # Includes the exit when a chunk of streamed rows has errors
+        os.remove(temp_name)
+        raise
+    os.replace(temp_name, file_name)
+    print('\n{} rows have been saved to {}'.format(num_rows, file_name))
+    record_file(file_name)
+    return file_name
+
+
+def save_run_report(results, jobs):
+    """Save and display a report for a batch run.
+
+    Args:
+        results (list): The result for each table, as returned by
+        run_table().
+        jobs (int): Number of worker processes used.
+
+    Returns:
+        file_name (str): Name of the saved report file.
+    """
+    report = {'created': ft.generate_time_string(), 'jobs': jobs,
+              'tables': results}
+    file_name = 'Run_Report_{}.json'.format(ft.generate_time_string())
+    with open(file_name, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print('\nRun Report:\n')
+    print('{:<20} {:<10} {:>9} {:>9}  {}'.format('Table', 'Status',
+                                                 'Seconds', 'Warnings',
+                                                 'Output Files'))
+    for result in results:
+        # The first item of each warnings list is its heading
+        print('{:<20} {:<10} {:>9.3f} {:>9}  {}'.format(
+                result['table'], result['status'], result['seconds'],
+                max(len(result['warnings']) - 1, 0),
+                ', '.join(result['output_files'])))
+    print('\nReport has been saved to {}'.format(file_name))
+    return file_name
+
+
+def save_upload(rows, headings, f_name, table):
+    """Save the rows for an upload file.
+
+    The rows are saved to a txt file, or to the output database while
+    sqlite_output() is active.
+
+    Args:
+        rows (iterable): Rows to be saved.
+        headings (str): Column headings to be saved.
+        f_name (str): Start of the txt file name, e.g. 'Enrolment_Data_'.
+        table (str): Name of the Student Database table the rows are for,
+        e.g. 'Enrolments'.
+    """
+    if output_databases:
+        save_rows_to_database(rows, headings, table)
+    else:
+        save_rows_to_text(rows, headings, f_name)
+
+
+def save_warning_log(warnings, warnings_to_process):
+    """Save the warning log if there are warnings to be saved.
+
+    The warnings are saved one per line to Warning_Log_{time}.txt.
+
+    Args:
+        warnings (list): Warnings that have been identified.
+        warnings_to_process (bool): True if there are warnings to be saved.
+
+    Returns:
+        file_name (str): Name of the saved file, or None if there were no
+        warnings to be saved.
+    """
+    if not warnings_to_process:
+        return None
+    file_name = 'Warning_Log_{}.txt'.format(ft.generate_time_string())
+    with open(file_name, 'w') as text_file:
+        for warning in warnings:
+            text_file.write('{}\n'.format(warning))
+    record_file(file_name)
+    print('\nWarnings have been found. The warning log has been saved to '
+          '{}'.format(file_name))
+    return file_name
+
+
+def set_check_jobs(jobs):
+    """Set the number of worker processes used by check_cdf().
+
+    Also used to start the worker processes for run_tables_parallel(), where
+    jobs is 1 so that each table being processed at the same time does not
+    start a pool of its own.
+
+    Args:
+        jobs (int): Number of worker processes for large Combined Data Forms.
+    """
+    global cdf_check_jobs
+    cdf_check_jobs = jobs
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Record the resources used by a stage of a pipeline.
+
+    Does nothing unless profile_stages() is active. Time spent in a stage run
+    within another stage (e.g. the check run by load_data()) is only counted
+    for the inner stage. Peak memory is the most memory allocated by Python
+    above what was in use when the stage started, including inner stages.
+
+    Args:
+        name (str): Name of the stage, e.g. 'clean_es_frame'.
+        rows (list): (Optional) Data handled by the stage, used to count the
+        rows. Can also be a DataFrame.
+
+    Yields:
+        counts (dict): Rows handled by the stage. 'rows' can be set in the
+        block if they are only known once the stage has run (e.g. loading a
+        file).
+    """
+    counts = {'rows': len(rows) if hasattr(rows, '__len__') else 0}
+    if not stage_profiles:
+        yield counts
+        return
+    profile = stage_profiles[-1]['profile']
+    memory = stage_profiles[-1]['memory']
+    active = stage_profiles[-1]['active']
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if active:
+            active[-1]['peak'] = max(active[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+    else:
+        current = 0
+    frame = {'wall': 0.0, 'cpu': 0.0, 'peak': current}
+    active.append(frame)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield counts
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        active.pop()
+        if active:
+            active[-1]['wall'] += wall
+            active[-1]['cpu'] += cpu
+        record = profile.setdefault(name, {
+                'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                'rows': 0, 'peak_memory': 0})
+        record['calls'] += 1
+        record['wall_seconds'] += wall - frame['wall']
+        record['cpu_seconds'] += cpu - frame['cpu']
+        record['rows'] += counts['rows']
+        if memory:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_memory'] = max(record['peak_memory'], peak - current)
+
+
+@contextlib.contextmanager
+def sqlite_output(db_name):
+    """Save upload rows to a SQLite database instead of txt files.
+
+    While active, save_upload() inserts the rows for each table into a local
+    SQLite mirror of the Student Database tables (see
+    save_rows_to_database()), where they can be queried or exported.
+
+    Args:
+        db_name (str): Name of the SQLite database file. It is created if it
+        does not exist.
+
+    Yields:
+        connection (sqlite3.Connection): Connection to the database.
+    """
+    import sqlite3
+    # Transactions are started and committed by save_rows_to_database()
+    connection = sqlite3.connect(db_name, timeout=60, isolation_level=None)
+    try:
+        # Allow the database to be queried while tables are being saved
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        output_databases.append((connection, db_name))
+        try:
+            yield connection
+        finally:
+            output_databases.pop()
+    finally:
+        connection.close()
+
+
+def stream_results(master_file, master_headings, results_headings,
+                   include_students, file_name, chunk_size=10000,
+                   table='Results'):
+    """Save the Results Table rows from a Master Results file in chunks.
+
+    Only the Results Table columns are parsed from the Master Results file.
+    Each chunk is filtered to the students to be added and appended to the
+    upload file, which is written under a temporary name and renamed once
+    complete. While sqlite_output() is active, the rows are saved to the
+    output database instead (see get_results_rows()).
+
+    Args:
+        master_file (str): Name of the Master Results file.
+        master_headings (list): Column headings for the Master Results file.
+        results_headings (list): Columns to be kept for the Results Table.
+        include_students (list): Enrolment IDs of the students to be added.
+        file_name (str): Name of the upload file.
+        chunk_size (int): (Optional) Number of rows read at a time.
+        table (str): (Optional) Name of the table in the output database.
+
+    Returns:
+        file_name (str): Name of the saved file, or the table the rows were
+        saved to.
+    """
+    import pandas as pd
+    print('\nLoading {}...'.format(master_file))
+    include = set(include_students)
+    temp_name = '{}.part'.format(file_name)
+    num_read = 0
+    reader = pd.read_csv(master_file, header=0, names=master_headings,
+                         usecols=results_headings, dtype=str,
+                         keep_default_na=False, chunksize=chunk_size)
+    if output_databases:
+        headings = ','.join(['ID'] + list(results_headings))
+        return save_rows_to_database(get_results_rows(
+                reader, results_headings, include), headings, table,
+                chunk_size)
+    with open(temp_name, 'w', newline='') as text_file:
+        for chunk in reader:
+            results_df = filter_results(chunk, results_headings, include)
+            results_df.insert(0, 'ID', '')
+            # Headings are only written with the first chunk
+            results_df.to_csv(text_file, index=False, header=num_read == 0)
+            num_read += len(chunk)
+    if num_read == 0:
+        os.remove(temp_name)
+        check_df(pd.DataFrame())
+    os.replace(temp_name, file_name)
+    print('\nFile has been saved to {}'.format(file_name))
+    record_file(file_name)
+    return file_name
+
+
+def stream_data(source, f_name, warnings, chunk_size=10000, clean=True):
+    """Yield checked and cleaned rows from a CSV file in chunks.
+
+    Reads the file a chunk at a time and passes each chunk through the check
+    and clean functions for the source (see get_source_handlers()), so that
+    only one chunk is held in memory. Errors cause the error log to be saved
+    and the program to exit as soon as the chunk containing them is checked.
+
+    Args:
+        source (str): The code for the table that the source data belongs to.
+        f_name (str): File name to be streamed, without the .csv extension.
+        warnings (list): List that warnings for the file are added to.
+        chunk_size (int): (Optional) Number of rows checked at a time.
+        clean (bool): (Optional) If False the rows are checked but not
+        cleaned.
+
+    Yields:
+        row (list): The next checked (and cleaned) row.
+    """
+    check_data, clean_data = get_source_handlers()[source]
+    print('\nStreaming {}...'.format(f_name))
+    for chunk in chunk_rows(read_csv_rows(f_name), chunk_size):
+        to_add, items_to_add = check_data(chunk)
+        if to_add:
+            add_warnings(warnings, items_to_add)
+        if clean and clean_data is not None:
+            chunk = clean_data(chunk)
+        for row in chunk:
+            yield row
+    print('Streamed {}.'.format(f_name))
+
+
+def stream_enrolment_upload(es_rows, si_index, tutor_index, tu_index,
+                            cc_index, warnings, chunk_size=10000):
+    """Yield Enrolments table upload rows from cleaned Enrolment Sheet rows.
+
+    Applies the same checks as process_enrolment_data() to each chunk of rows
+    before the upload rows for the chunk are produced.
+
+    Args:
+        es_rows (iterable): Cleaned Enrolment Sheet rows.
+        si_index (frozenset): Student IDs in the database.
+        tutor_index (dict): Tutor IDs keyed on normalised tutor name.
+        tu_index (frozenset): Tutor IDs in the database.
+        cc_index (frozenset): Course codes in the database.
+        warnings (list): List that warnings are added to.
+        chunk_size (int): (Optional) Number of rows processed at a time.
+
+    Yields:
+        row (list): The next Enrolments table upload row.
+    """
+    for chunk in chunk_rows(es_rows, chunk_size):
+        # Check that students are already present in the Student ID list
+        check_present(si_index, chunk, 0, 'Enrolment_Sheet_ID_Student',
+                      'Student ID')
+        enrolment_data = get_enrolment_data(chunk)[0]
+        # Replace Tutor name with Tutor ID in place
+        to_add, warnings_to_add, updated_es = replace_tutors(
+                enrolment_data, tutor_index, False)
+        if to_add:
+            add_warnings(warnings, warnings_to_add)
+        # Check that Tutors and course codes are present in the lists
+        check_present(tu_index, updated_es, 3, 'Enrolment_Sheet_Tutor_ID',
+                      'Tutor ID')
+        check_present(cc_index, updated_es, 2, 'Enrolment Data',
+                      'Course code')
+        for row in updated_es:
+            yield row
 
 
 def update_expired(expired, num_days):
@@ -4886,16 +6583,17 @@ def update_expired(expired, num_days):
     expiry date is earlier then the student is added to the returned list.
     
     Args:
-        expired (list): List of lists of student expiry date data.
+        expired (list): Cleaned expiry date data (ExpiryRow).
         num_days (int): Number of days to work back from today.
         
     Returns:
-        updated_expired (list): List of lists for students expiring before the
-        passed date (todays date - num_days).
+        updated_expired (list): Students (ExpiryRow) expiring before the passed
+        date (todays date - num_days).
     """
+    import custtools.datetools as da
     updated_expired = []
     for student in expired:
-        if da.get_days_past(student[2]) > num_days:
+        if da.get_days_past(student.expiry_date) > num_days:
             updated_expired.append(student)
     return updated_expired
 
@@ -4927,39 +6625,11 @@ def validate_wa(att_data, swc_data, swc_si_pos, swc_wi_pos, att_si_pos,
     File structure (swc_data):
         StudentFK, WorkshopFK       
     """
-    errors = []
-    i = 0
-    # Check each pair in att_data
-    while i < len(att_data):
-        # Extract Student ID from att_data
-        si_att = att_data[i][att_si_pos]
-        # Extract Workshop ID from att_data
-        wi_att = att_data[i][att_wi_pos]
-        # Look for Student ID in existing data
-        j = 0
-        found = False
-        while j < len(swc_data) and not found:
-            # Extract Student ID from swc_data
-            si_swc = swc_data[j][swc_si_pos]
-            # Extract Workshop ID from swc_data
-            wi_swc = swc_data[j][swc_wi_pos]
-            if si_swc == si_att:
-                # Student ID is found in existing data
-                # Check if Workshop ID also matches
-                if wi_swc == wi_att:
-                    # Workshop ID also matches - duplicate
-                    found = True
-                    errors.append('The combination of Student ID {} and '
-                                  'Workshop ID {} already exists in the '
-                                  'Student Database. Please correct the data '
-                                  'and try again.'.format(si_att, wi_att))
-            # Combination not found, try the next row in existing data
-            j += 1
-        # Check the next row in the data to be checked
-        i += 1
-    # Check if any errors have been identified, save error log if they have
-    if len(errors) > 0:
-        ft.process_error_log(errors, 'Workshop_Attendance_Data')
+    check_pairs_unique(swc_data, att_data, (swc_si_pos, swc_wi_pos),
+                       (att_si_pos, att_wi_pos), 'Workshop_Attendance_Data',
+                       'The combination of Student ID {} and Workshop ID {} '
+                       'already exists in the Student Database. Please '
+                       'correct the data and try again.')
 
 
 def validate_e_id(e_id, e_id_data):
@@ -5062,9 +6732,12 @@ def validate_swc(swc_data, wc_list):
                           '{}'.format(student[0]))
     # Check if any errors have been identified, save error log if they have
     if len(errors) > 0:
-        ft.process_error_log(errors, 'Student_Workshop_Data')
+        process_errors(errors, 'Student_Workshop_Data')
     return
 
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1:
+        sys.exit(main_batch())
+    else:
+        main()